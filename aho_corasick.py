@@ -0,0 +1,172 @@
+import re
+from collections import deque
+
+try:
+    # Необязательная C-реализация автомата (пакет pyahocorasick)
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Сколько позиций совпадения запоминать для каждой строки
+MAX_OFFSETS = 16
+# Длина префиксов строк в регулярном выражении-фильтре
+PREFILTER_DEPTH = 3
+
+
+def _prefix_regex(keys, depth):
+    """Регулярное выражение по бору префиксов: быстро находит позиции возможного начала строки"""
+    trie = {}
+    for key in keys:
+        node = trie
+        for byte in key[:depth]:
+            if None in node:
+                break
+            node = node.setdefault(byte, {})
+        else:
+            # Конец префикса: более длинные продолжения фильтру не нужны
+            node.clear()
+            node[None] = True
+
+    def emit(node):
+        if None in node:
+            return b''
+        branches = [re.escape(bytes([byte])) + emit(child) for byte, child in sorted(node.items())]
+        if len(branches) < 2:
+            return b''.join(branches)
+        return b'(?:' + b'|'.join(branches) + b')'
+
+    return re.compile(emit(trie))
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик для поиска множества строк без учета регистра за один проход"""
+
+    def __init__(self, patterns):
+        self.patterns = []
+        self.lengths = []
+        keys = []
+        for pattern in patterns:
+            key = pattern.encode() if isinstance(pattern, str) else bytes(pattern)
+            key = key.lower()
+            if not key or key in keys:
+                continue
+            self.patterns.append(pattern)
+            self.lengths.append(len(key))
+            keys.append(key)
+        self.max_length = max(self.lengths, default=0)
+        self._build(keys)
+
+    def _build(self, keys):
+        # Бор
+        goto = [{}]
+        output = [[]]
+        for index, key in enumerate(keys):
+            state = 0
+            for byte in key:
+                if byte not in goto[state]:
+                    goto.append({})
+                    output.append([])
+                    goto[state][byte] = len(goto) - 1
+                state = goto[state][byte]
+            output[state].append(index)
+
+        # Функция неудач и детерминированные переходы (хранятся только ненулевые)
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(delta[fail[state]])
+            transitions.update(goto[state])
+            delta[state] = transitions
+            output[state] = output[state] + output[fail[state]]
+            for byte, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(byte, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._output = [tuple(out) for out in output]
+        # Пропуск участков, где не может начаться ни одна строка
+        self._start = _prefix_regex(keys, PREFILTER_DEPTH) if keys else None
+
+        self._native = None
+        if ahocorasick is not None and keys:
+            self._native = ahocorasick.Automaton()
+            for index, key in enumerate(keys):
+                self._native.add_word(key.decode('latin-1'), index)
+            self._native.make_automaton()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def matcher(self):
+        """Новое состояние поиска для потока данных (одного файла)"""
+        return Matcher(self)
+
+
+class Matcher:
+    """Потоковый поиск: состояние автомата сохраняется между блоками"""
+
+    def __init__(self, automaton, max_offsets=MAX_OFFSETS):
+        self.automaton = automaton
+        self.max_offsets = max_offsets
+        self.state = 0
+        self.matches = {}
+        self._tail = b''
+        # Смещение, с которого ожидается следующий блок; при пропуске участка состояние сбрасывается
+        self._next = 0
+
+    def feed(self, chunk, offset=0):
+        """Обработка блока данных, offset - смещение блока от начала потока"""
+        automaton = self.automaton
+        if automaton._start is None:
+            return
+        if offset != self._next:
+            self.state = 0
+            self._tail = b''
+        self._next = offset + len(chunk)
+        data = bytes(chunk).lower()
+        if automaton._native is not None:
+            self._feed_native(data, offset)
+            return
+        delta = automaton._delta
+        output = automaton._output
+        search = automaton._start.search
+        state = self.state
+        pos = 0
+        size = len(data)
+        # Префикс строки может не поместиться в конец блока, его проходим побайтно
+        tail = max(size - PREFILTER_DEPTH + 1, 0)
+        while pos < size:
+            if not state and pos < tail:
+                found = search(data, pos)
+                pos = min(found.start(), tail) if found is not None else tail
+                if pos >= size:
+                    break
+            state = delta[state].get(data[pos], 0)
+            if output[state]:
+                for index in output[state]:
+                    self._add(index, offset + pos + 1 - automaton.lengths[index])
+            pos += 1
+        self.state = state
+
+    def _feed_native(self, data, offset):
+        # C-автомат не хранит состояние между вызовами: добавляем хвост предыдущего блока
+        automaton = self.automaton
+        tail = self._tail
+        data = tail + data
+        start = offset - len(tail)
+        for end, index in automaton._native.iter(data.decode('latin-1')):
+            if end >= len(tail):
+                self._add(index, start + end + 1 - automaton.lengths[index])
+        self._tail = data[-(automaton.max_length - 1):] if automaton.max_length > 1 else b''
+
+    def _add(self, index, position):
+        offsets = self.matches.setdefault(index, [])
+        if len(offsets) < self.max_offsets:
+            offsets.append(position)
+
+    def result(self):
+        """Найденные строки и смещения их начала: {строка: [смещения]}"""
+        patterns = self.automaton.patterns
+        return {patterns[index]: offsets for index, offsets in sorted(self.matches.items())}
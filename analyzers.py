@@ -0,0 +1,349 @@
+import io
+import os
+import mmap
+import bisect
+import hashlib
+
+from aho_corasick import AhoCorasick
+from entropy import ENTROPY_THRESHOLD, EntropyAccumulator
+
+# Размер блока чтения: файл читается один раз крупными блоками
+CHUNK_SIZE = 1024 * 1024
+HEADER_SIZE = 4096
+# Файлы от этого размера читаются через mmap: блоки передаются анализаторам без копирования.
+# Если файл укоротят во время чтения, обращение к отображению завершит процесс (SIGBUS),
+# поэтому по умолчанию mmap выключен (None) и файлы читаются через readinto
+MMAP_THRESHOLD = None
+# Порог mmap при явном включении (cli --mmap)
+MMAP_SIZE = 64 * 1024 * 1024
+# Прочитанные страницы отображения освобождаются через этот объем: память не растет с размером файла
+RELEASE_SIZE = 16 * 1024 * 1024
+
+
+class Analyzer:
+    """Базовый анализатор: получает блоки файла по порядку за один проход"""
+    name = None
+
+    def start(self, size):
+        """Вызывается перед чтением с размером файла"""
+
+    def feed(self, chunk, offset):
+        """Обработка очередного блока (memoryview, действителен только во время вызова)"""
+        raise NotImplementedError
+
+    def result(self):
+        """Итог анализа после прочтения всего файла"""
+        raise NotImplementedError
+
+    def ranges(self):
+        """Нужные участки файла [(начало, конец)], известные после start; None - весь файл"""
+        return None
+
+
+class HashAnalyzer(Analyzer):
+    """Хеш содержимого файла"""
+    name = 'hash'
+
+    def __init__(self, algorithm='md5'):
+        self._hash = hashlib.new(algorithm)
+
+    def feed(self, chunk, offset):
+        self._hash.update(chunk)
+
+    def result(self):
+        return self._hash.hexdigest()
+
+
+class SignatureHashAnalyzer(Analyzer):
+    """Хеши для таблиц базы сигнатур: всего файла и его префиксов, за один проход"""
+    name = 'hashes'
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._hashes = {}
+
+    def start(self, size):
+        for table in self.tables:
+            key = (table.algorithm, table.prefix)
+            # Таблица без сигнатур такого размера: хеш не нужен
+            if key in self._hashes or not table.has_size(size):
+                continue
+            self._hashes[key] = hashlib.new(table.algorithm)
+
+    def feed(self, chunk, offset):
+        for (algorithm, prefix), file_hash in self._hashes.items():
+            if not prefix:
+                file_hash.update(chunk)
+            elif offset < prefix:
+                file_hash.update(chunk[:prefix - offset])
+
+    def ranges(self):
+        if not self._hashes:
+            return []
+        if all(prefix for _, prefix in self._hashes):
+            return [(0, max(prefix for _, prefix in self._hashes))]
+        return None
+
+    def result(self):
+        """{(алгоритм, длина префикса): hex-хеш}"""
+        return {key: file_hash.hexdigest() for key, file_hash in self._hashes.items()}
+
+
+class StringAnalyzer(Analyzer):
+    """Поиск подозрительных строк автоматом Ахо-Корасик"""
+    name = 'strings'
+
+    def __init__(self, automaton):
+        if not isinstance(automaton, AhoCorasick):
+            automaton = AhoCorasick(automaton)
+        self._matcher = automaton.matcher()
+
+    def feed(self, chunk, offset):
+        self._matcher.feed(chunk, offset)
+
+    def result(self):
+        return self._matcher.result()
+
+
+class EntropyAnalyzer(Analyzer):
+    """Энтропия Шеннона файла и профиль по блокам"""
+    name = 'entropy'
+
+    def __init__(self, threshold=ENTROPY_THRESHOLD):
+        self._accumulator = EntropyAccumulator(threshold)
+
+    def feed(self, chunk, offset):
+        self._accumulator.feed(chunk, offset)
+
+    def result(self):
+        return self._accumulator.result()
+
+
+class HeaderAnalyzer(Analyzer):
+    """Первые байты файла для проверки заголовка"""
+    name = 'header'
+
+    def __init__(self, size=HEADER_SIZE):
+        self.size = size
+        self._header = bytearray()
+
+    def feed(self, chunk, offset):
+        if offset < self.size:
+            self._header += chunk[:self.size - offset]
+
+    def ranges(self):
+        return [(0, self.size)]
+
+    def result(self):
+        return bytes(self._header)
+
+
+class RangeAnalyzer(Analyzer):
+    """Анализатор, получающий только заданные участки файла (политики для больших файлов)"""
+
+    def __init__(self, analyzer, ranges):
+        self.analyzer = analyzer
+        self.name = analyzer.name
+        self._ranges = ranges
+        self._ends = [end for _, end in ranges]
+
+    def start(self, size):
+        self.analyzer.start(size)
+
+    def feed(self, chunk, offset):
+        end = offset + len(chunk)
+        index = bisect.bisect_right(self._ends, offset)
+        for start, stop in self._ranges[index:]:
+            if start >= end:
+                break
+            start = max(start, offset)
+            self.analyzer.feed(chunk[start - offset:min(stop, end) - offset], start)
+
+    def ranges(self):
+        return self._ranges
+
+    def result(self):
+        return self.analyzer.result()
+
+
+def required_ranges(analyzers, size):
+    """Объединение участков, нужных анализаторам; None - нужен весь файл"""
+    ranges = []
+    for analyzer in analyzers:
+        wanted = analyzer.ranges() if hasattr(analyzer, 'ranges') else None
+        if wanted is None:
+            return None
+        ranges.extend(wanted)
+    merged = []
+    for start, end in sorted(ranges):
+        end = min(end, size)
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def analyze_stream(stream, analyzers, size, chunk_size=CHUNK_SIZE):
+    """Чтение потока (файла или элемента архива) за один проход с передачей каждого блока всем анализаторам.
+    Возвращает результаты по именам анализаторов и 'size' - число прочитанных байтов"""
+    for analyzer in analyzers:
+        analyzer.start(size)
+    return _read_stream(stream, analyzers, chunk_size)
+
+
+def _results(analyzers, size):
+    results = {analyzer.name: analyzer.result() for analyzer in analyzers}
+    results['size'] = size
+    return results
+
+
+def _read_stream(stream, analyzers, chunk_size):
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    offset = 0
+    while True:
+        size = stream.readinto(buffer)
+        if not size:
+            break
+        chunk = view[:size]
+        for analyzer in analyzers:
+            analyzer.feed(chunk, offset)
+        offset += size
+    return _results(analyzers, offset)
+
+
+def _read_ranges(f, analyzers, ranges, size, chunk_size):
+    # Чтение только нужных участков файла
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    for start, end in ranges:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            length = f.readinto(view[:min(chunk_size, end - offset)])
+            if not length:
+                break
+            chunk = view[:length]
+            for analyzer in analyzers:
+                analyzer.feed(chunk, offset)
+            offset += length
+    return _results(analyzers, size)
+
+
+def _read_mapped(mapped, analyzers, ranges, size, chunk_size):
+    # Блоки - срезы отображения файла; просмотренные страницы сразу освобождаются
+    can_release = hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+    if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL') and ranges is None:
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapped)
+    released = 0
+    try:
+        for start, end in ranges if ranges is not None else [(0, size)]:
+            for offset in range(start, end, chunk_size):
+                with view[offset:min(offset + chunk_size, end)] as chunk:
+                    for analyzer in analyzers:
+                        analyzer.feed(chunk, offset)
+                position = min(offset + chunk_size, end)
+                if can_release and position - released >= RELEASE_SIZE:
+                    position -= position % mmap.PAGESIZE
+                    mapped.madvise(mmap.MADV_DONTNEED, released, position - released)
+                    released = position
+    finally:
+        view.release()
+    return _results(analyzers, size)
+
+
+class DescriptorReader(io.RawIOBase):
+    """Чтение открытого дескриптора (например, полученного через SCM_RIGHTS) через os.pread:
+    у читателя своя позиция, позиция файла у владельца дескриптора не меняется, дескриптор не закрывается"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.position = 0
+        # Канал не поддерживает pread: он читается последовательно
+        try:
+            os.lseek(fd, 0, os.SEEK_CUR)
+            self._seekable = True
+        except OSError:
+            self._seekable = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._seekable
+
+    def fileno(self):
+        return self.fd
+
+    def readinto(self, buffer):
+        if not self._seekable:
+            return os.readv(self.fd, [buffer])
+        data = os.pread(self.fd, len(buffer), self.position)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self._seekable:
+            raise io.UnsupportedOperation("seek")
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += os.fstat(self.fd).st_size
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
+
+
+def open_source(source, buffering=-1):
+    """Файл для чтения по пути или по дескриптору (int)"""
+    if isinstance(source, int):
+        reader = DescriptorReader(source)
+        return reader if buffering == 0 else io.BufferedReader(reader)
+    return open(source, 'rb', buffering=buffering)
+
+
+def analyze_file(file_path, analyzers, chunk_size=CHUNK_SIZE, mmap_threshold=MMAP_THRESHOLD):
+    """Чтение файла за один проход всеми анализаторами (см. analyze_stream).
+    analyzers - список анализаторов или функция, создающая его по размеру файла.
+    Читаются только участки, нужные анализаторам; файлы от mmap_threshold - через mmap.
+    file_path может быть открытым дескриптором (см. DescriptorReader)"""
+    with open_source(file_path, buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if callable(analyzers):
+            analyzers = analyzers(size)
+        for analyzer in analyzers:
+            analyzer.start(size)
+        ranges = required_ranges(analyzers, size)
+
+        if mmap_threshold is not None and size >= max(mmap_threshold, 1):
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Не обычный файл (например, канал): читается как поток
+                mapped = None
+            if mapped is not None:
+                try:
+                    return _read_mapped(mapped, analyzers, ranges, size, chunk_size)
+                finally:
+                    try:
+                        mapped.close()
+                    except BufferError:
+                        # Анализатор еще держит срез: отображение закроется при его удалении
+                        pass
+
+        if ranges is not None:
+            return _read_ranges(f, analyzers, ranges, size, chunk_size)
+        if size > chunk_size and hasattr(os, 'posix_fadvise'):
+            # Файл читается подряд до конца: ядро увеличивает окно упреждающего чтения
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        return _read_stream(f, analyzers, chunk_size)
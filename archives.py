@@ -0,0 +1,287 @@
+import os
+import tarfile
+import zipfile
+import tempfile
+
+from analyzers import CHUNK_SIZE, HEADER_SIZE, Analyzer, analyze_stream, open_source
+
+# Разделитель пути архива и пути внутри него: archive.zip!inner/path
+MEMBER_SEPARATOR = '!'
+
+ZIP = 'zip'
+TAR = 'tar'
+
+# Ограничения распаковки (защита от zip-бомб)
+MAX_DEPTH = 5
+MAX_TOTAL_SIZE = 1024 * 1024 * 1024
+MAX_MEMBERS = 10000
+MAX_RATIO = 100
+# Степень сжатия проверяется только для данных больше этого объема
+RATIO_MIN_SIZE = 1024 * 1024
+# Вложенный tar (в том числе сжатый) обходится потоком во время чтения элемента, без копии.
+# Вложенному ZIP нужен произвольный доступ: он копируется до NESTED_BUFFER_SIZE в памяти,
+# больше - во временный файл, но не более NESTED_SPOOL_LIMIT; больший ZIP не обходится
+NESTED_BUFFER_SIZE = 16 * 1024 * 1024
+NESTED_SPOOL_LIMIT = 256 * 1024 * 1024
+
+
+def archive_type(header):
+    """Тип архива по первым байтам файла или None"""
+    if header[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return ZIP
+    if header[257:262] == b'ustar':
+        return TAR
+    # Сжатый tar; обычный сжатый файл tarfile не откроет, и он будет пропущен
+    if header[:2] == b'\x1f\x8b' or header[:3] == b'BZh' or header[:6] == b'\xfd7zXZ\x00':
+        return TAR
+    return None
+
+
+class ArchiveLimitExceeded(Exception):
+    """Превышено ограничение распаковки"""
+
+
+class _LimitAnalyzer(Analyzer):
+    """Учет распакованных байтов: чтение прерывается при превышении ограничений"""
+    name = 'limit'
+
+    def __init__(self, scanner, level):
+        self.scanner = scanner
+        self.level = level
+
+    def feed(self, chunk, offset):
+        self.scanner.total_size += len(chunk)
+        self.level['bytes'] += len(chunk)
+        self.scanner.check_total()
+        self.scanner.check_ratio(self.level['bytes'], self.level['size'])
+
+    def result(self):
+        return None
+
+
+class _MemberReader:
+    """Чтение элемента архива, при котором каждый прочитанный блок передается анализаторам.
+    Через read элемент читает tarfile при потоковом обходе вложенного tar, finish дочитывает остаток:
+    элемент распаковывается один раз. spool - копия вложенного ZIP (см. NESTED_SPOOL_LIMIT)"""
+
+    def __init__(self, stream, analyzers, size, chunk_size):
+        self.stream = stream
+        self.analyzers = analyzers
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.spool = None
+        for analyzer in analyzers:
+            analyzer.start(size)
+        head = bytearray()
+        while len(head) < HEADER_SIZE:
+            block = stream.read(HEADER_SIZE - len(head))
+            if not block:
+                break
+            head += block
+        self.head = bytes(head)
+        # Начало элемента уже передано анализаторам, но еще не прочитано через read
+        self._pending = self.head
+        self._feed(self.head)
+
+    def _feed(self, chunk):
+        if not chunk:
+            return
+        for analyzer in self.analyzers:
+            analyzer.feed(chunk, self.offset)
+        self.offset += len(chunk)
+        if self.spool is not None:
+            if self.offset > NESTED_SPOOL_LIMIT:
+                self.spool.close()
+                self.spool = None
+            else:
+                self.spool.write(chunk)
+
+    def start_spool(self):
+        self.spool = tempfile.SpooledTemporaryFile(NESTED_BUFFER_SIZE)
+        self.spool.write(self.head)
+
+    def read(self, size=-1):
+        if self._pending:
+            data = self._pending if size < 0 else self._pending[:size]
+            self._pending = self._pending[len(data):]
+            return data
+        data = self.stream.read(size)
+        self._feed(data)
+        return data
+
+    def finish(self):
+        """Дочитывание элемента; результаты анализаторов и 'size', как у analyze_stream"""
+        self._pending = b''
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        while True:
+            size = self.stream.readinto(buffer)
+            if not size:
+                break
+            self._feed(view[:size])
+        results = {analyzer.name: analyzer.result() for analyzer in self.analyzers}
+        results['size'] = self.offset
+        return results
+
+
+class ArchiveScanner:
+    """Потоковая проверка содержимого архива без извлечения на диск.
+    Каждый файл архива читается теми же анализаторами, что и обычные файлы; вложенные архивы обходятся
+    рекурсивно во время их проверки (см. _MemberReader), их файлы выдаются раньше самого вложенного архива"""
+
+    def __init__(self, create_analyzers, chunk_size=CHUNK_SIZE, max_depth=MAX_DEPTH,
+                 max_total_size=MAX_TOTAL_SIZE, max_members=MAX_MEMBERS, max_ratio=MAX_RATIO):
+        self.create_analyzers = create_analyzers
+        self.chunk_size = chunk_size
+        self.max_depth = max_depth
+        self.max_total_size = max_total_size
+        self.max_members = max_members
+        self.max_ratio = max_ratio
+        self.total_size = 0
+        self.members = 0
+        # Описания превышенных ограничений
+        self.exceeded = []
+
+    def check_total(self, extra=0):
+        if self.total_size + extra > self.max_total_size:
+            raise ArchiveLimitExceeded(f"объем распаковки более {self.max_total_size // (1024 * 1024)} МБ")
+
+    def check_ratio(self, size, compressed):
+        if size > RATIO_MIN_SIZE and size > self.max_ratio * max(compressed, 1):
+            raise ArchiveLimitExceeded(f"степень сжатия более {self.max_ratio}")
+
+    def scan(self, file_path, header):
+        """Генератор (путь внутри архива, результаты анализа, ошибка) для всех файлов архива"""
+        kind = archive_type(header)
+        if kind is None:
+            return
+        try:
+            with open_source(file_path) as f:
+                try:
+                    archive = self._open(f, header)
+                except Exception:
+                    # Поврежденный архив: сам файл уже проверен как обычный
+                    return
+                if archive is not None:
+                    yield from self._walk(archive, os.fstat(f.fileno()).st_size, '', 1)
+        except ArchiveLimitExceeded as e:
+            self.exceeded.append(str(e))
+
+    def _open(self, stream, header):
+        """Архив из потока по заголовку; None, если сжатый файл оказался не tar"""
+        if archive_type(header) == ZIP:
+            return zipfile.ZipFile(stream)
+        try:
+            return tarfile.open(fileobj=stream, mode='r:*')
+        except tarfile.ReadError:
+            if header[257:262] == b'ustar':
+                raise
+            return None
+
+    def _zip_members(self, archive):
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield info.filename, info.file_size, info.compress_size, lambda info=info: archive.open(info)
+
+    def _tar_members(self, archive):
+        # Сжатие tar общее для всего архива, степень сжатия проверяется по архиву в целом
+        for info in archive:
+            if info.isfile():
+                yield info.name, info.size, None, lambda info=info: archive.extractfile(info)
+
+    def _walk(self, archive, size, prefix, depth):
+        if isinstance(archive, zipfile.ZipFile):
+            members = self._zip_members(archive)
+        else:
+            members = self._tar_members(archive)
+        level = {'size': size, 'bytes': 0}
+        try:
+            with archive:
+                yield from self._walk_members(members, level, prefix, depth)
+        finally:
+            members.close()
+
+    def _walk_members(self, members, level, prefix, depth):
+        while True:
+            try:
+                member = next(members, None)
+            except ArchiveLimitExceeded:
+                raise
+            except Exception:
+                # Поврежденный архив или не архив: сам файл уже проверен как обычный
+                return
+            if member is None:
+                return
+            name, declared_size, compressed_size, open_member = member
+            member_path = prefix + name
+
+            # Заявленные размеры проверяются до распаковки, фактические - во время чтения
+            self.members += 1
+            if self.members > self.max_members:
+                raise ArchiveLimitExceeded(f"более {self.max_members} файлов")
+            self.check_total(declared_size)
+            if compressed_size is not None:
+                self.check_ratio(declared_size, compressed_size)
+
+            yield from self._scan_member(open_member, member_path, declared_size, level, depth)
+
+    def _scan_member(self, open_member, member_path, declared_size, level, depth):
+        """Проверка элемента; файлы вложенного архива выдаются раньше результата самого элемента"""
+        reader = None
+        error = None
+        try:
+            with open_member() as member_stream:
+                analyzers = self.create_analyzers() + [_LimitAnalyzer(self, level)]
+                if depth >= self.max_depth:
+                    analysis = analyze_stream(member_stream, analyzers, declared_size, self.chunk_size)
+                    if archive_type(analysis.get('header', b'')) is not None:
+                        self.exceeded.append(f"{member_path}: вложенность более {self.max_depth}")
+                else:
+                    reader = _MemberReader(member_stream, analyzers, declared_size, self.chunk_size)
+                    kind = archive_type(reader.head)
+                    if kind == TAR:
+                        error = yield from self._walk_stream(reader, member_path, declared_size, depth + 1)
+                    elif kind == ZIP:
+                        reader.start_spool()
+                    analysis = reader.finish()
+        except Exception as e:
+            if reader is not None and reader.spool is not None:
+                reader.spool.close()
+            if isinstance(e, ArchiveLimitExceeded):
+                raise
+            yield member_path, None, e
+            return
+        if reader is None or reader.spool is None:
+            if reader is not None and kind == ZIP:
+                limit = NESTED_SPOOL_LIMIT // (1024 * 1024)
+                self.exceeded.append(f"{member_path}: вложенный ZIP более {limit} МБ не обходится")
+            yield member_path, analysis, error
+            return
+        with reader.spool as spool:
+            yield from self._walk_nested(spool, member_path, analysis, depth + 1)
+
+    def _walk_stream(self, reader, member_path, size, depth):
+        """Потоковый обход вложенного tar во время чтения элемента; ошибка открытия архива или None"""
+        try:
+            archive = tarfile.open(fileobj=reader, mode='r|*')
+        except tarfile.ReadError as e:
+            # Сжатый файл, который не является tar, проверяется как обычный
+            return e if reader.head[257:262] == b'ustar' else None
+        except ArchiveLimitExceeded:
+            raise
+        except Exception as e:
+            return e
+        yield from self._walk(archive, size, member_path + MEMBER_SEPARATOR, depth)
+        return None
+
+    def _walk_nested(self, spool, member_path, analysis, depth):
+        # Элемент уже проверен; обходится его копия. Ошибка открытия вложенного архива
+        # попадает в результат самого элемента
+        spool.seek(0)
+        try:
+            archive = zipfile.ZipFile(spool)
+        except Exception as e:
+            yield member_path, analysis, e
+            return
+        yield from self._walk(archive, analysis['size'], member_path + MEMBER_SEPARATOR, depth)
+        yield member_path, analysis, None
@@ -0,0 +1,271 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CORPUS_PATH = "bench_corpus"
+DEFAULT_SEED = 1
+# Версия генератора: при изменении набора файлов корпус создается заново
+CORPUS_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DEFAULT_TOLERANCE = 0.15
+
+EICAR = b'X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*'
+WORDS = [b'the', b'data', b'report', b'file', b'user', b'value', b'system', b'config',
+         b'import', b'return', b'index', b'table', b'print', b'result', b'update', b'module']
+# Фиксированная дата элементов ZIP: архивы одинаковы побайтно при каждой генерации
+ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+
+
+def _text(rng, size):
+    """Текстоподобные данные заданного размера"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return b' '.join(words)[:size]
+
+
+def _zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(zipfile.ZipInfo(name, ZIP_DATE), data)
+    return buffer.getvalue()
+
+
+def _gen_tiny(rng, directory, scale):
+    for i in range(int(2000 * scale)):
+        subdir = os.path.join(directory, f"d{i % 20:02d}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"f{i:05d}.txt"), 'wb') as f:
+            f.write(_text(rng, rng.randint(0, 4096)))
+
+
+def _gen_huge(rng, directory, scale):
+    size = int(64 * 1024 * 1024 * scale)
+    block = _text(rng, 1024 * 1024)
+    for i in range(2):
+        with open(os.path.join(directory, f"huge{i}.bin"), 'wb') as f:
+            written = 0
+            while written < size:
+                # Текст с участками случайных данных: работают все анализаторы
+                data = rng.randbytes(256 * 1024) if written % (8 * 1024 * 1024) == 0 else block
+                data = data[:size - written]
+                f.write(data)
+                written += len(data)
+
+
+def _gen_entropy(rng, directory, scale):
+    for i in range(max(1, int(32 * scale))):
+        with open(os.path.join(directory, f"blob{i:03d}.bin"), 'wb') as f:
+            f.write(rng.randbytes(1024 * 1024))
+
+
+def _gen_archives(rng, directory, scale):
+    for i in range(max(1, int(50 * scale))):
+        members = [(f"doc{j}.txt", _text(rng, rng.randint(100, 64 * 1024))) for j in range(10)]
+        inner = _zip_bytes(members[:5])
+        with open(os.path.join(directory, f"archive{i:03d}.zip"), 'wb') as f:
+            f.write(_zip_bytes(members + [("nested/inner.zip", inner)]))
+
+
+def _gen_signatures(rng, directory, scale):
+    for i in range(max(1, int(200 * scale))):
+        kind = i % 4
+        if kind == 0:
+            data = EICAR
+        elif kind == 1:
+            data = b'hello'
+        elif kind == 2:
+            data = _text(rng, 32 * 1024) + b' trojan ' + _text(rng, 1024)
+        else:
+            data = _zip_bytes([("sample.com", EICAR)])
+        with open(os.path.join(directory, f"sample{i:04d}.bin"), 'wb') as f:
+            f.write(data)
+
+
+GENERATORS = {
+    'tiny': _gen_tiny,
+    'huge': _gen_huge,
+    'entropy': _gen_entropy,
+    'archives': _gen_archives,
+    'signatures': _gen_signatures,
+}
+
+
+def generate_corpus(path=DEFAULT_CORPUS_PATH, seed=DEFAULT_SEED, scale=1.0, categories=None):
+    """Создание детерминированного корпуса; существующий корпус с теми же параметрами используется повторно"""
+    categories = list(categories or GENERATORS)
+    manifest = {'version': CORPUS_VERSION, 'seed': seed, 'scale': scale}
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r') as f:
+            existing = json.load(f)
+    except (OSError, ValueError):
+        existing = {}
+    done = existing.get('categories', []) if {k: existing.get(k) for k in manifest} == manifest else []
+    if not done and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+
+    for name in categories:
+        if name in done:
+            continue
+        directory = os.path.join(path, name)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        # Отдельный генератор на категорию: ее содержимое не зависит от набора остальных
+        GENERATORS[name](random.Random(f"{seed}:{name}"), directory, scale)
+        done.append(name)
+        with open(manifest_path, 'w') as f:
+            json.dump(dict(manifest, categories=done), f)
+    return path
+
+
+def _peak_rss():
+    """Пиковый объем резидентной памяти процесса, байты"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _corpus_size(directory):
+    files = 0
+    size = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def run_category(directory, workers=1, repeat=3):
+    """Проверка каталога движком; лучшее из repeat запусков. Выполняется в отдельном процессе"""
+    from engine import DrWebFree
+    from metrics import FILE
+    engine = DrWebFree()
+    metrics = engine.enable_metrics()
+    files, size = _corpus_size(directory)
+
+    best = None
+    best_timings = {}
+    results = 0
+    for _ in range(repeat):
+        metrics.reset()
+        started = time.perf_counter()
+        results = sum(1 for _ in engine.iter_results(directory, workers))
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+            # Суммарное время проверок во всех процессах; FILE - проверка файла целиком
+            best_timings = {check: histogram['sum'] for check, histogram in metrics.to_dict()['checks'].items()
+                            if check != FILE}
+
+    elapsed = max(best, 1e-9)
+    return {
+        'files': files,
+        'bytes': size,
+        'results': results,
+        'seconds': best,
+        'files_per_sec': files / elapsed,
+        'mb_per_sec': size / elapsed / (1024 * 1024),
+        # Время анализаторов и обхода каталогов; остальное - чтение и проверки по результатам
+        'checks': {name: value for name, value in sorted(best_timings.items())},
+        'peak_rss': _peak_rss()
+    }
+
+
+def run_benchmark(corpus_path, categories=None, workers=1, repeat=3):
+    """Запуск по категориям, каждая - в новом процессе (пиковая память не накапливается)"""
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'workers': workers,
+        'repeat': repeat,
+        'categories': {}
+    }
+    context = multiprocessing.get_context('spawn')
+    for name in categories or GENERATORS:
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            report['categories'][name] = pool.submit(
+                run_category, os.path.join(corpus_path, name), workers, repeat).result()
+    return report
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Список регрессий относительно базового отчета"""
+    regressions = []
+    for name, current in report['categories'].items():
+        base = baseline.get('categories', {}).get(name)
+        if base is None:
+            continue
+        for metric in ('files_per_sec', 'mb_per_sec'):
+            if current[metric] < base[metric] * (1 - tolerance):
+                regressions.append(f"{name}: {metric} {current[metric]:.1f} < {base[metric]:.1f}")
+        if current['peak_rss'] and base.get('peak_rss') and current['peak_rss'] > base['peak_rss'] * (1 + tolerance):
+            regressions.append(f"{name}: peak_rss {current['peak_rss'] // 1024} КБ > {base['peak_rss'] // 1024} КБ")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"{'категория':<12}{'файлов':>8}{'МБ':>9}{'файлов/с':>11}{'МБ/с':>9}{'RSS, МБ':>9}  проверки, с"]
+    for name, result in report['categories'].items():
+        checks = ', '.join(f"{check} {value:.2f}" for check, value in result['checks'].items())
+        rss = result['peak_rss'] / (1024 * 1024) if result['peak_rss'] else 0
+        lines.append(f"{name:<12}{result['files']:>8}{result['bytes'] / (1024 * 1024):>9.1f}"
+                     f"{result['files_per_sec']:>11.1f}{result['mb_per_sec']:>9.1f}{rss:>9.1f}  {checks}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер производительности сканера на синтетическом корпусе")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_PATH, help="каталог корпуса")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--scale', type=float, default=1.0, help="множитель числа и размера файлов")
+    parser.add_argument('--categories', nargs='+', choices=list(GENERATORS), help="категории корпуса")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="процессов сканирования")
+    parser.add_argument('--repeat', type=int, default=3, help="запусков на категорию (берется лучший)")
+    parser.add_argument('--json', action='store_true', help="вывести отчет в JSON")
+    parser.add_argument('--save-baseline', metavar='FILE', help="сохранить отчет как базовый")
+    parser.add_argument('--compare', metavar='FILE', help="сравнить с базовым отчетом")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="допустимое ухудшение (доля)")
+    args = parser.parse_args(argv)
+
+    generate_corpus(args.corpus, args.seed, args.scale, args.categories)
+    report = run_benchmark(args.corpus, args.categories, args.workers, args.repeat)
+    report.update(seed=args.seed, scale=args.scale)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if (baseline.get('seed'), baseline.get('scale')) != (args.seed, args.scale):
+            print("Базовый отчет получен на другом корпусе (seed/scale)", file=sys.stderr)
+            return 2
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Регрессия: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
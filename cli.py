@@ -0,0 +1,311 @@
+import os
+import sys
+import argparse
+import datetime
+
+# Коды завершения: как у большинства сканеров командной строки
+EXIT_CLEAN = 0
+EXIT_INFECTED = 1
+EXIT_ERROR = 2
+
+FORMATS = ('text', 'jsonl', 'csv')
+METRICS_FORMATS = ('json', 'prometheus')
+
+
+def create_sink(output_format, stream, infected_only):
+    from sinks import JsonLinesSink, CsvSink, TextReportSink
+    if output_format == 'jsonl':
+        return JsonLinesSink(stream, infected_only)
+    if output_format == 'csv':
+        return CsvSink(stream, infected_only)
+    return TextReportSink(stream)
+
+
+def size_policy(value):
+    """Разбор значения --size-policy: (размер в байтах, политика)"""
+    from policies import POLICIES
+    size, _, policy = value.partition('=')
+    try:
+        size = int(float(size) * 1024 * 1024)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверный размер: {size}")
+    if policy not in POLICIES:
+        raise argparse.ArgumentTypeError(f"неизвестная политика: {policy} (допустимы {', '.join(POLICIES)})")
+    return size, policy
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Dr.Web Free: сканирование без графического интерфейса")
+    parser.add_argument('paths', nargs='*', help="файлы и директории для проверки")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='text', help="формат вывода")
+    parser.add_argument('-o', '--output', help="файл для результатов (по умолчанию stdout)")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="число процессов (0 - все ядра)")
+    parser.add_argument('--chunksize', type=int, help="файлов в одном задании процесса")
+    parser.add_argument('--cache', nargs='?', const='', metavar='DB',
+                        help="использовать кеш вердиктов (по умолчанию scan_cache.db)")
+    parser.add_argument('--infected-only', action='store_true',
+                        help="выводить только зараженные файлы (для jsonl и csv)")
+    parser.add_argument('--no-clean', action='store_true', help="не очищать зараженные файлы")
+    parser.add_argument('--quarantine', metavar='DIR',
+                        help="каталог карантина для копий очищаемых файлов (по умолчанию quarantine)")
+    parser.add_argument('--quarantine-list', action='store_true', help="показать содержимое карантина")
+    parser.add_argument('--restore', type=int, action='append', metavar='ID',
+                        help="восстановить файл из карантина по номеру записи (можно указать несколько раз)")
+    parser.add_argument('--purge-quarantine', type=float, metavar='ДНЕЙ',
+                        help="удалить из карантина записи старше заданного числа дней (0 - все)")
+    parser.add_argument('--update', nargs='?', const='', metavar='URL',
+                        help="обновить базы сигнатур перед сканированием (URL каталога обновлений)")
+    parser.add_argument('--daemon', nargs='?', const='', metavar='SOCKET',
+                        help="проверять через запущенную службу сканирования (python -m scan_daemon)")
+    parser.add_argument('--watch', action='store_true',
+                        help="проверять файлы по мере изменения в директориях (Linux inotify) до Ctrl+C")
+    parser.add_argument('--walk-order', choices=('inode', 'none'), default='inode',
+                        help="порядок проверки файлов каталога: по inode (меньше перемещений головок диска) или как есть")
+    parser.add_argument('--cross-fs', action='store_true',
+                        help="переходить на другие файловые системы, смонтированные внутри директорий")
+    parser.add_argument('--size-policy', action='append', type=size_policy, metavar='МБ=ПОЛИТИКА',
+                        help="политика анализа файлов от заданного размера: full, sampled, head_tail "
+                             "или hash_only (можно указать несколько раз)")
+    parser.add_argument('--mmap', action='store_true',
+                        help="читать файлы от 64 МБ через mmap (быстрее, но если файл укоротят во время "
+                             "проверки, процесс аварийно завершится; с --watch не действует)")
+    parser.add_argument('--session', nargs='?', const='', metavar='FILE',
+                        help="сохранять контрольные точки и продолжать прерванное сканирование "
+                             "(по умолчанию файл в каталоге sessions); Ctrl+C останавливает проверку с сохранением")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="проверять каждую жесткую ссылку и копию файла отдельно")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="записать метрики проверок (время анализаторов, ошибки, самые долгие файлы)")
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='json', help="формат метрик")
+    return parser
+
+
+def write_metrics(path, output_format, data):
+    """Запись метрик (ScanMetrics.to_dict) в JSON или текстовом формате Prometheus"""
+    import json
+    from metrics import ScanMetrics
+    with open(path, 'w', encoding='utf-8') as f:
+        if output_format == 'prometheus':
+            metrics = ScanMetrics()
+            metrics.merge(data)
+            f.write(metrics.to_prometheus())
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def daemon_results(client, paths, totals):
+    """Результаты проверки службой сканирования; файлы служба не очищает"""
+    from results import ScanResult
+    started = datetime.datetime.now()
+    totals.update(total_files=0, infected_files=0, cleaned_files=0)
+    for path in paths:
+        # Служба работает в своем каталоге: пути передаются абсолютными
+        for data in client.scan([os.path.abspath(path)]):
+            result = ScanResult.from_dict(data)
+            totals['total_files'] += 1
+            if result.is_infected:
+                totals['infected_files'] += 1
+            yield result
+    totals['scan_time'] = datetime.datetime.now() - started
+
+
+def watch_results(antivirus, args, totals):
+    """Результаты проверки измененных файлов до прерывания (Ctrl+C или SIGTERM)"""
+    import queue
+    import signal
+    from watcher import Watcher
+    results = queue.Queue()
+    watcher = Watcher(antivirus, args.paths, lambda result, latency: results.put(result),
+                      workers=args.workers or os.cpu_count() or 1)
+    signal.signal(signal.SIGTERM, lambda *_: results.put(None))
+    started = datetime.datetime.now()
+    totals.update(total_files=0, infected_files=0, cleaned_files=0)
+    watcher.start()
+    print("Наблюдение за изменениями запущено (Ctrl+C - остановка)", file=sys.stderr)
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            totals['total_files'] += 1
+            if result.is_infected:
+                totals['infected_files'] += 1
+            yield result
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        totals['scan_time'] = datetime.datetime.now() - started
+        latency = watcher.latency.snapshot()
+        if latency['count']:
+            print(f"Задержка от изменения до вердикта: p50 {latency['p50']:.3f} с, "
+                  f"p99 {latency['p99']:.3f} с, максимум {latency['max']:.3f} с", file=sys.stderr)
+
+
+def quarantine_command(args):
+    """Просмотр, восстановление и очистка карантина"""
+    from quarantine import DEFAULT_QUARANTINE_PATH, Quarantine
+    quarantine = Quarantine(args.quarantine or DEFAULT_QUARANTINE_PATH)
+    try:
+        if args.quarantine_list:
+            for entry in quarantine.entries():
+                created = datetime.datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M:%S')
+                threats = ', '.join(code for code, _ in entry['threats'])
+                print(f"{entry['id']}\t{created}\t{entry['hash'][:16]}\t{entry['size']}\t{entry['path']}\t{threats}")
+        for entry_id in args.restore or ():
+            print(f"Восстановлен файл: {quarantine.restore(entry_id)}", file=sys.stderr)
+        if args.purge_quarantine is not None:
+            removed = quarantine.purge(older_than=args.purge_quarantine * 86400 or None)
+            print(f"Удалено записей карантина: {removed}", file=sys.stderr)
+    except (OSError, LookupError, ValueError) as e:
+        print(f"Ошибка карантина: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        quarantine.close()
+    return EXIT_CLEAN
+
+
+def session_scan(antivirus, args):
+    """Сканирование с контрольными точками: прерванный сеанс продолжается, Ctrl+C останавливает его"""
+    import signal
+    from scan_session import ScanSession
+    session = ScanSession(args.paths[0], args.session or None)
+    if session.resumed:
+        print(f"Продолжение прерванного сканирования: проверено файлов {session.stats['files']}", file=sys.stderr)
+    previous = signal.signal(signal.SIGINT, lambda *_: session.cancel())
+
+    def results(totals):
+        if session.resumed:
+            yield from session.results()
+        yield from antivirus.scan_iter(args.paths[0], workers=args.workers, chunksize=args.chunksize,
+                                       session=session)
+        totals.update(antivirus.scan_stats)
+
+    try:
+        code = write_results(args, results)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+        session.close()
+    if session.cancelled:
+        print(f"Сканирование остановлено, продолжить: --session {args.session}".rstrip(), file=sys.stderr)
+        return EXIT_ERROR if code == EXIT_CLEAN else code
+    return code
+
+
+def write_results(args, results):
+    """Вывод результатов в выбранном формате и код завершения"""
+    stream = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    errors = 0
+    totals = {}
+    try:
+        sink = create_sink(args.format, stream, args.infected_only)
+        for result in results(totals):
+            sink.write(result)
+            if result.error:
+                errors += 1
+            if args.watch:
+                stream.flush()
+        sink.finish(totals)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    if totals.get('infected_files'):
+        return EXIT_INFECTED
+    return EXIT_ERROR if errors else EXIT_CLEAN
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    quarantine_action = args.quarantine_list or args.restore or args.purge_quarantine is not None
+    if quarantine_action:
+        if args.paths or args.update is not None:
+            parser.error("действия с карантином выполняются без путей для проверки и --update")
+        return quarantine_command(args)
+    if not args.paths and args.update is None:
+        parser.error("укажите пути для проверки или --update")
+    if args.daemon is not None and (args.update is not None or args.watch):
+        parser.error("--update и --watch не используются вместе с --daemon")
+    if args.watch and not all(os.path.isdir(path) for path in args.paths):
+        parser.error("для --watch укажите директории")
+    if args.session is not None and (len(args.paths) != 1 or args.watch or args.daemon is not None):
+        parser.error("--session используется с одним путем, без --watch и --daemon")
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"Путь не найден: {path}", file=sys.stderr)
+            return EXIT_ERROR
+
+    if args.daemon is not None:
+        from scan_daemon import DEFAULT_SOCKET_PATH, ScanClient
+        try:
+            with ScanClient(args.daemon or DEFAULT_SOCKET_PATH) as client:
+                code = write_results(args, lambda totals: daemon_results(client, args.paths, totals))
+                if args.metrics:
+                    write_metrics(args.metrics, args.metrics_format, client.metrics())
+                return code
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка службы сканирования: {e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    from engine import DrWebFree
+    antivirus = DrWebFree()
+    antivirus.auto_clean = not args.no_clean
+    antivirus.walk_order = args.walk_order
+    antivirus.cross_filesystems = args.cross_fs
+    if args.size_policy:
+        from policies import FULL
+        antivirus.size_policies = [(0, FULL)] + args.size_policy
+    if args.mmap:
+        from analyzers import MMAP_SIZE
+        antivirus.mmap_threshold = MMAP_SIZE
+    antivirus.deduplicate = not args.no_dedup
+    if args.update is not None:
+        try:
+            if antivirus.update_signatures(args.update or None):
+                print(f"Базы сигнатур обновлены до версии {antivirus.virus_signatures.version}", file=sys.stderr)
+            else:
+                print("Базы сигнатур актуальны", file=sys.stderr)
+        except Exception as e:
+            print(f"Ошибка при обновлении сигнатур: {e}", file=sys.stderr)
+            return EXIT_ERROR
+    if not args.paths:
+        return EXIT_CLEAN
+    if args.cache is not None:
+        antivirus.enable_scan_cache(args.cache or None)
+    if args.quarantine:
+        antivirus.enable_quarantine(args.quarantine)
+    if args.metrics:
+        antivirus.enable_metrics()
+
+    if args.watch:
+        try:
+            return write_results(args, lambda totals: watch_results(antivirus, args, totals))
+        finally:
+            if args.metrics:
+                write_metrics(args.metrics, args.metrics_format, antivirus.metrics.to_dict())
+
+    def local_results(totals):
+        for path in args.paths:
+            yield from antivirus.scan_iter(path, workers=args.workers, chunksize=args.chunksize)
+            for name, value in antivirus.scan_stats.items():
+                totals[name] = totals[name] + value if name in totals else value
+
+    try:
+        if args.session is not None:
+            return session_scan(antivirus, args)
+        return write_results(args, local_results)
+    finally:
+        if antivirus.scan_cache is not None:
+            antivirus.scan_cache.close()
+        if antivirus.quarantine is not None:
+            antivirus.quarantine.close()
+        if args.metrics:
+            write_metrics(args.metrics, args.metrics_format, antivirus.metrics.to_dict())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import os
+import sys
+import hashlib
+from collections import deque
+
+from results import ScanResult
+
+# Объем начала файла для быстрого сравнения кандидатов одного размера
+PREFIX_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
+# Сколько файлов отслеживается для поиска копий; дальше новые файлы проверяются без сравнения
+MAX_ENTRIES = 1000000
+
+# Общий вердикт чистого файла, не являющегося архивом: хранится без затрат памяти на каждый файл
+_CLEAN = (('', (), False, None),)
+
+
+def _digest(path, limit=None):
+    # Стойкий к коллизиям хеш: подобранная пара файлов не должна получить общий вердикт
+    file_hash = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            block = f.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+            if not block:
+                break
+            file_hash.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return file_hash.digest()
+
+
+class _Original:
+    __slots__ = ('path', 'size', 'key', 'inode', 'prefix', 'digest', 'results', 'verdict', 'done', 'waiting')
+
+    def __init__(self, path, size, key, inode):
+        self.path = path
+        self.size = size
+        self.key = key
+        self.inode = inode
+        self.prefix = None
+        self.digest = None
+        # Результаты, пока файл проверяется: файлы архива, затем сам архив
+        self.results = []
+        # Вердикт для копий: (путь внутри архива или '', угрозы, can_clean, error) по каждому результату
+        self.verdict = None
+        self.done = False
+        # Копии, ожидающие вердикта: (путь, счетчик в stats); список создается с первой копией
+        self.waiting = None
+
+
+class _Bucket:
+    """Уровень индекса копий: файлы по хешу (table) и единственный файл, хеш которого еще не нужен (lone)"""
+    __slots__ = ('lone', 'table')
+
+    def __init__(self):
+        self.lone = None
+        self.table = {}
+
+    def __bool__(self):
+        return self.lone is not None or bool(self.table)
+
+
+class Deduplicator:
+    """Общий вердикт для жестких ссылок и одинаковых файлов в пределах одного сканирования.
+    Повторный inode с тем же расширением пропускается сразу; кандидаты в копии отбираются по размеру
+    и расширению (от него зависят эвристики), затем по хешу начала файла, и только совпавшие
+    сравниваются по хешу всего содержимого. Хеши хранятся в словарях: поиск копии не зависит
+    от числа файлов того же размера, а хеш файла считается, только когда появился второй кандидат.
+    Вердикт проверенного файла хранится, только если у него есть жесткие ссылки или другой кандидат
+    того же размера и расширения (или это общий вердикт чистого файла); для остальных файлов
+    хранятся лишь путь и размер, нужные для сравнения с будущими кандидатами.
+    saved_bytes - объем копий, которые не анализировались (копии содержимого при этом читаются для хеша)"""
+
+    def __init__(self, prefix_size=PREFIX_SIZE, max_entries=MAX_ENTRIES):
+        self.prefix_size = prefix_size
+        self.max_entries = max_entries
+        self._inodes = {}
+        self._groups = {}
+        self._by_path = {}
+        self._entries = 0
+        # Результаты копий, готовые к выдаче
+        self.ready = deque()
+        # Копии, оригинал которых проверить не удалось: проверяются сами
+        self.rescan = []
+        self.stats = {
+            'hardlinks': 0,
+            'duplicates': 0,
+            'saved_bytes': 0
+        }
+
+    def _prefix(self, entry):
+        if entry.prefix is None:
+            entry.prefix = _digest(entry.path, self.prefix_size)
+        return entry.prefix
+
+    def _full(self, entry):
+        if entry.digest is None:
+            # Файл не больше префикса целиком описывается его хешем
+            entry.digest = entry.prefix if entry.size <= self.prefix_size else _digest(entry.path)
+        return entry.digest
+
+    def _find(self, candidate, group):
+        if not group:
+            return None
+        # Первый файл группы получает хеш начала, когда появляется второй
+        if group.lone is not None:
+            group.table.setdefault(self._prefix(group.lone), _Bucket()).lone = group.lone
+            group.lone = None
+        bucket = group.table.get(self._prefix(candidate))
+        if not bucket:
+            return None
+        if bucket.lone is not None:
+            bucket.table[self._full(bucket.lone)] = bucket.lone
+            bucket.lone = None
+        return bucket.table.get(self._full(candidate))
+
+    def _insert(self, entry, group):
+        if not group and entry.prefix is None:
+            group.lone = entry
+            return
+        bucket = group.table.setdefault(self._prefix(entry), _Bucket())
+        if not bucket and entry.digest is None:
+            bucket.lone = entry
+        else:
+            bucket.table[self._full(entry)] = entry
+
+    def check(self, file_path, stat):
+        """True, если файл - копия уже найденного: его результаты будут выданы через ready"""
+        if stat is None:
+            return False
+        # Вердикт зависит от расширения: жесткие ссылки с разными расширениями проверяются отдельно
+        extension = sys.intern(os.path.splitext(file_path)[1].lower())
+        inode = (stat.st_dev, stat.st_ino, extension)
+        original = self._inodes.get(inode)
+        if original is not None and self._known(original):
+            self._share(original, file_path, 'hardlinks')
+            return True
+
+        key = (stat.st_size, extension)
+        entry = _Original(file_path, stat.st_size, key, inode if stat.st_nlink > 1 else None)
+        group = self._groups.setdefault(key, _Bucket())
+        try:
+            original = self._find(entry, group)
+            if original is not None and not self._known(original):
+                # Вердикт одиночного файла не хранился: копия проверяется сама и занимает его место в индексе
+                original = None
+                self._entries -= 1
+            if original is None and self._entries < self.max_entries:
+                self._insert(entry, group)
+                self._entries += 1
+                if stat.st_nlink > 1:
+                    self._inodes[inode] = entry
+                self._by_path[file_path] = entry
+        except OSError:
+            # Файл недоступен для сравнения: проверяется как обычно и сообщит об ошибке сам
+            return False
+        finally:
+            if not group:
+                del self._groups[key]
+        if original is not None:
+            self._share(original, file_path, 'duplicates')
+            return True
+        return False
+
+    def _known(self, original):
+        """Вердикт оригинала будет получен: файл еще проверяется или вердикт сохранен"""
+        return not original.done or original.verdict is not None
+
+    def _shared(self, entry):
+        """У файла есть жесткие ссылки или другой кандидат в копии: его вердикт нужно сохранить"""
+        if self._inodes.get(entry.inode) is entry:
+            return True
+        group = self._groups.get(entry.key)
+        return group is not None and group.lone is not entry
+
+    def _share(self, original, file_path, counter):
+        if original.done:
+            self._release(original, file_path, counter)
+        else:
+            if original.waiting is None:
+                original.waiting = []
+            original.waiting.append((file_path, counter))
+
+    def _release(self, original, file_path, counter):
+        self.stats[counter] += 1
+        self.stats['saved_bytes'] += original.size
+        self.ready.extend(self._copy(original, file_path))
+
+    def _forget(self, entry):
+        if self._inodes.get(entry.inode) is entry:
+            del self._inodes[entry.inode]
+        group = self._groups.get(entry.key)
+        if group is None:
+            return
+        if group.lone is entry:
+            group.lone = None
+        elif entry.prefix in group.table:
+            bucket = group.table[entry.prefix]
+            if bucket.lone is entry:
+                bucket.lone = None
+            elif bucket.table.get(entry.digest) is entry:
+                del bucket.table[entry.digest]
+            if not bucket:
+                del group.table[entry.prefix]
+        if not group:
+            del self._groups[entry.key]
+
+    def _copy(self, original, file_path):
+        for member, threats, can_clean, error in original.verdict:
+            if not member:
+                yield ScanResult(file_path, list(threats), can_clean, error)
+            else:
+                yield ScanResult(file_path + member, list(threats), can_clean, error, container=file_path)
+
+    def add(self, result):
+        """Учет результата проверки; по завершении файла ожидающие копии получают его вердикт"""
+        path = result.container or result.file_path
+        entry = self._by_path.get(path)
+        if entry is None:
+            return
+        entry.results.append(result)
+        if result.container is not None:
+            return
+        del self._by_path[path]
+        entry.done = True
+        results, entry.results = entry.results, None
+        waiting, entry.waiting = entry.waiting or (), None
+        if result.error:
+            # Ошибочный вердикт не переносится; следующие копии тоже проверяются сами
+            self._forget(entry)
+            self.rescan.extend(file_path for file_path, _ in waiting)
+            return
+        verdict = tuple((item.file_path[len(path):], tuple(item.threats), item.can_clean, item.error)
+                        for item in results)
+        if verdict == _CLEAN:
+            entry.verdict = _CLEAN
+        elif waiting or self._shared(entry):
+            entry.verdict = verdict
+        for file_path, counter in waiting:
+            self._release(entry, file_path, counter)
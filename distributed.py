@@ -0,0 +1,470 @@
+import os
+import sys
+import json
+import time
+import hmac
+import socket
+import datetime
+import threading
+from collections import deque
+
+from results import ScanResult, error_result
+
+DEFAULT_PORT = 7340
+# Сколько частей (шардов) получается при делении дерева: с запасом на число узлов,
+# чтобы быстрые узлы брали больше работы
+SHARD_TARGET = 256
+# Результаты отправляются координатору пачками; каждая пачка заодно продлевает аренду шарда
+RESULT_BATCH = 200
+HEARTBEAT_INTERVAL = 5
+# Узел без сообщений дольше этого считается пропавшим, его шарды отдаются другим
+LEASE_TIMEOUT = 30
+# Когда очередь пуста, шард, который проверяется дольше этого, дублируется на свободный узел
+SPECULATE_AFTER = 60
+WAIT_INTERVAL = 1
+CONNECT_RETRIES = 30
+# После стольких сообщений failed шард больше не раздается: в отчет попадает ошибка
+MAX_FAILURES = 3
+
+
+def parse_address(value, default_host='127.0.0.1'):
+    """'хост:порт', 'хост' или ':порт' -> (хост, порт)"""
+    host, _, port = value.rpartition(':') if ':' in value else (value, '', '')
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+def split_shards(paths, target=SHARD_TARGET, cross_filesystems=False):
+    """Деление путей на шарды {'path', 'recursive'}: каталоги раскрываются в ширину, пока шардов
+    меньше target; у раскрытого каталога отдельным шардом проверяются только его собственные файлы"""
+    shards = []
+    pending = deque()
+    for path in paths:
+        if os.path.isdir(path):
+            pending.append((path, os.stat(path).st_dev))
+        else:
+            shards.append({'path': path, 'recursive': False})
+    while pending and len(shards) + len(pending) < target:
+        directory, device = pending.popleft()
+        has_files = False
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if cross_filesystems or entry.stat(follow_symlinks=False).st_dev == device:
+                                subdirectories.append(entry.path)
+                        else:
+                            has_files = True
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        if has_files:
+            shards.append({'path': directory, 'recursive': False})
+        pending.extend((path, device) for path in sorted(subdirectories))
+    shards.extend({'path': path, 'recursive': True} for path, _ in pending)
+    for index, shard in enumerate(shards):
+        shard['id'] = index
+    return shards
+
+
+def _send(conn, message, lock=None):
+    data = (json.dumps(message, ensure_ascii=False) + "\n").encode()
+    if lock is None:
+        conn.sendall(data)
+    else:
+        with lock:
+            conn.sendall(data)
+
+
+def _result_dict(result):
+    return dict(result.to_dict(), container=result.container)
+
+
+def _from_dict(data):
+    result = ScanResult.from_dict(data)
+    result.container = data.get('container')
+    return result
+
+
+class Coordinator:
+    """Координатор распределенного сканирования: делит дерево на шарды и раздает их по TCP
+    узлам (ScanWorker). Шард считается проверенным по первому сообщению done; его результаты
+    принимаются целиком, поэтому повторная проверка шарда другим узлом не дает дублей.
+    Шарды пропавшего узла (разрыв соединения или нет сообщений LEASE_TIMEOUT секунд)
+    возвращаются в очередь, а медленный шард при пустой очереди дублируется на свободный узел
+    (только между узлами без очистки: иначе одни и те же файлы очищались бы дважды).
+    Шард, который узлы MAX_FAILURES раз не смогли проверить, завершается результатом с ошибкой.
+
+    Протокол - строки JSON: узел отправляет hello (с token и clean), next, results, heartbeat, done, failed;
+    на next координатор отвечает {"shard": ...}, {"wait": секунд} или {"done": true}"""
+
+    def __init__(self, paths, address=('127.0.0.1', DEFAULT_PORT), token=None, shard_target=SHARD_TARGET,
+                 cross_filesystems=False, lease_timeout=LEASE_TIMEOUT, speculate_after=SPECULATE_AFTER):
+        self.paths = list(paths)
+        self.address = address
+        self.token = token
+        self.shard_target = shard_target
+        self.cross_filesystems = cross_filesystems
+        self.lease_timeout = lease_timeout
+        self.speculate_after = speculate_after
+        self.shards = []
+        self._pending = deque()
+        # Попытки проверки: шард -> {узел: {'results': [...], 'started': время}}
+        self._attempts = {}
+        self._done = set()
+        self._failures = {}
+        self._completed = deque()
+        self._seen = {}
+        # Узлы, которые очищают зараженные файлы
+        self._cleaning = set()
+        self._next_worker = 0
+        self._condition = threading.Condition()
+        self._socket = None
+        self._started = False
+        self._stopped = threading.Event()
+        self.scan_stats = {
+            'total_files': 0,
+            'infected_files': 0,
+            'cleaned_files': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'dedup_files': 0,
+            'dedup_bytes': 0,
+            'shards': 0,
+            'reassigned_shards': 0,
+            'workers': 0,
+            'scan_time': datetime.timedelta()
+        }
+
+    def bind(self):
+        self._socket = socket.create_server(self.address)
+        self.address = self._socket.getsockname()[:2]
+        return self
+
+    def start(self):
+        """Деление дерева на шарды и прием узлов в отдельном потоке"""
+        if self._socket is None:
+            self.bind()
+        self._started = True
+        self.shards = split_shards(self.paths, self.shard_target, self.cross_filesystems)
+        self._pending.extend(shard['id'] for shard in self.shards)
+        self.scan_stats['shards'] = len(self.shards)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._socket is not None:
+            self._socket.close()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        worker = None
+        try:
+            reader = conn.makefile('rb')
+            hello = json.loads(reader.readline() or b'{}')
+            if not isinstance(hello, dict) or hello.get('cmd') != 'hello' or (
+                    self.token is not None and not hmac.compare_digest(str(hello.get('token', '')).encode(),
+                                                                       self.token.encode())):
+                _send(conn, {'error': "неверный ключ доступа"})
+                return
+            with self._condition:
+                self._next_worker += 1
+                worker = self._next_worker
+                self._seen[worker] = time.monotonic()
+                if hello.get('clean', True):
+                    self._cleaning.add(worker)
+                self.scan_stats['workers'] += 1
+            _send(conn, {'ok': True, 'worker': worker})
+            for line in reader:
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    raise ValueError(f"неверное сообщение: {line[:100]!r}")
+                cmd = message.get('cmd')
+                with self._condition:
+                    self._seen[worker] = time.monotonic()
+                    if cmd == 'next':
+                        reply = self._assign(worker)
+                    else:
+                        reply = None
+                        self._handle(worker, cmd, message)
+                if reply is not None:
+                    _send(conn, reply)
+        except (OSError, ValueError) as e:
+            if not self._stopped.is_set():
+                print(f"Ошибка соединения с узлом {worker}: {e}", file=sys.stderr)
+        finally:
+            conn.close()
+            if worker is not None:
+                with self._condition:
+                    self._drop(worker)
+                    self._cleaning.discard(worker)
+                    self._condition.notify_all()
+
+    def _handle(self, worker, cmd, message):
+        if cmd not in ('results', 'done', 'failed'):
+            return
+        # Номер шарда приходит из сети: неверный разрывает соединение, шарды узла передаются другим
+        shard = message.get('shard')
+        if type(shard) is not int or not 0 <= shard < len(self.shards):
+            raise ValueError(f"неверный номер шарда: {shard!r}")
+        attempt = self._attempts.get(shard, {}).get(worker)
+        if cmd == 'results':
+            results = message.get('results')
+            if not isinstance(results, list) or not all(isinstance(data, dict) for data in results):
+                raise ValueError("неверный список результатов")
+            if attempt is not None:
+                attempt['results'].extend(results)
+        elif cmd == 'done':
+            if attempt is not None:
+                stats = message.get('stats')
+                self._complete(shard, attempt['results'], stats if isinstance(stats, dict) else {})
+        elif attempt is not None:
+            path = self.shards[shard]['path']
+            error = message.get('error')
+            print(f"Узел {worker} не проверил {path}: {error}", file=sys.stderr)
+            self._failures[shard] = self._failures.get(shard, 0) + 1
+            if self._failures[shard] >= MAX_FAILURES:
+                self._complete(shard, [_result_dict(error_result(path, error))], {})
+            else:
+                self._release(shard, worker)
+
+    def _assign(self, worker):
+        while self._pending:
+            shard = self._pending.popleft()
+            if shard not in self._done:
+                return self._start(shard, worker)
+        if len(self._done) == len(self.shards):
+            return {'done': True}
+        # Очередь пуста: самый долгий шард, который проверяет только один узел, дублируется.
+        # Шарды узлов с очисткой не дублируются: файлы были бы очищены дважды
+        if worker in self._cleaning:
+            return {'wait': WAIT_INTERVAL}
+        now = time.monotonic()
+        candidates = [(attempts[next(iter(attempts))]['started'], shard)
+                      for shard, attempts in self._attempts.items()
+                      if len(attempts) == 1 and worker not in attempts and not attempts.keys() & self._cleaning]
+        if candidates:
+            started, shard = min(candidates)
+            if now - started >= self.speculate_after:
+                self.scan_stats['reassigned_shards'] += 1
+                return self._start(shard, worker)
+        return {'wait': WAIT_INTERVAL}
+
+    def _start(self, shard, worker):
+        self._attempts.setdefault(shard, {})[worker] = {'results': [], 'started': time.monotonic()}
+        return {'shard': self.shards[shard]}
+
+    def _complete(self, shard, results, stats):
+        self._done.add(shard)
+        self._attempts.pop(shard, None)
+        for name, value in stats.items():
+            if (name in self.scan_stats and type(value) is int
+                    and name not in ('shards', 'reassigned_shards', 'workers', 'scan_time')):
+                self.scan_stats[name] += value
+        self._completed.append(results)
+        self._condition.notify_all()
+
+    def _release(self, shard, worker):
+        attempts = self._attempts.get(shard)
+        if attempts is None or attempts.pop(worker, None) is None:
+            return
+        if not attempts:
+            del self._attempts[shard]
+            if shard not in self._done:
+                self.scan_stats['reassigned_shards'] += 1
+                self._pending.appendleft(shard)
+
+    def _drop(self, worker):
+        self._seen.pop(worker, None)
+        for shard in [shard for shard, attempts in self._attempts.items() if worker in attempts]:
+            self._release(shard, worker)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.lease_timeout
+        for worker in [worker for worker, seen in self._seen.items() if seen < deadline]:
+            print(f"Узел {worker} не отвечает, его шарды переданы другим узлам", file=sys.stderr)
+            self._drop(worker)
+
+    def results(self, totals=None):
+        """Результаты по мере проверки шардов; по завершении scan_stats (и totals) - общая статистика"""
+        if not self._started:
+            self.start()
+        started = datetime.datetime.now()
+        try:
+            while True:
+                with self._condition:
+                    while not self._completed and len(self._done) < len(self.shards):
+                        self._condition.wait(WAIT_INTERVAL)
+                        self._expire()
+                    if not self._completed:
+                        break
+                    results = self._completed.popleft()
+                for data in results:
+                    yield _from_dict(data)
+        finally:
+            self.scan_stats['scan_time'] = datetime.datetime.now() - started
+            if totals is not None:
+                totals.update(self.scan_stats)
+
+
+class ScanWorker:
+    """Узел распределенного сканирования: берет шарды у координатора и проверяет их движком DrWebFree.
+    Пути шардов должны быть доступны узлу под теми же именами (общее хранилище)"""
+
+    def __init__(self, address, token=None, engine=None, workers=1):
+        if engine is None:
+            from engine import DrWebFree
+            engine = DrWebFree()
+        self.engine = engine
+        self.address = address
+        self.token = token
+        self.workers = workers
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _connect(self):
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                return socket.create_connection(self.address)
+            except ConnectionRefusedError:
+                if attempt == CONNECT_RETRIES - 1:
+                    raise
+                time.sleep(1)
+
+    def run(self):
+        """Проверка шардов, пока координатор не сообщит о завершении; число проверенных шардов"""
+        conn = self._connect()
+        reader = conn.makefile('rb')
+        heartbeat = threading.Thread(target=self._heartbeat, args=(conn,), daemon=True)
+        try:
+            _send(conn, {'cmd': 'hello', 'token': self.token, 'name': socket.gethostname(),
+                         'clean': bool(self.engine.auto_clean)}, self._send_lock)
+            reply = json.loads(reader.readline() or b'{}')
+            if 'error' in reply or not reply:
+                raise RuntimeError(reply.get('error', "координатор закрыл соединение"))
+            heartbeat.start()
+            shards = 0
+            while True:
+                try:
+                    _send(conn, {'cmd': 'next'}, self._send_lock)
+                    line = reader.readline()
+                except ConnectionError:
+                    line = b''
+                if not line:
+                    # Координатор завершает работу, когда все шарды проверены
+                    return shards
+                reply = json.loads(line)
+                if reply.get('done'):
+                    return shards
+                if 'wait' in reply:
+                    time.sleep(reply['wait'])
+                    continue
+                self._scan(conn, reply['shard'])
+                shards += 1
+        finally:
+            self._stopped.set()
+            reader.close()
+            conn.close()
+
+    def _heartbeat(self, conn):
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                _send(conn, {'cmd': 'heartbeat'}, self._send_lock)
+            except OSError:
+                return
+
+    def _scan(self, conn, shard):
+        # Путь недоступен этому узлу (нет общего хранилища): шард не считается проверенным
+        try:
+            os.stat(shard['path'])
+        except OSError as e:
+            _send(conn, {'cmd': 'failed', 'shard': shard['id'], 'error': str(e)}, self._send_lock)
+            return
+        batch = []
+        try:
+            for result in self.engine.scan_iter(shard['path'], workers=self.workers,
+                                                recursive=shard['recursive']):
+                batch.append(_result_dict(result))
+                if len(batch) >= RESULT_BATCH:
+                    _send(conn, {'cmd': 'results', 'shard': shard['id'], 'results': batch}, self._send_lock)
+                    batch = []
+        except OSError:
+            # Разрыв соединения с координатором: шард будет передан другому узлу
+            raise
+        except Exception as e:
+            _send(conn, {'cmd': 'failed', 'shard': shard['id'], 'error': str(e)}, self._send_lock)
+            return
+        if batch:
+            _send(conn, {'cmd': 'results', 'shard': shard['id'], 'results': batch}, self._send_lock)
+        stats = {name: value for name, value in self.engine.scan_stats.items() if isinstance(value, int)}
+        _send(conn, {'cmd': 'done', 'shard': shard['id'], 'stats': stats}, self._send_lock)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m distributed",
+                                     description="Распределенное сканирование Dr.Web Free")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator = commands.add_parser('coordinator', help="раздать дерево каталогов узлам и собрать отчет")
+    coordinator.add_argument('paths', nargs='+', help="файлы и директории для проверки")
+    coordinator.add_argument('--listen', default=f"127.0.0.1:{DEFAULT_PORT}", metavar='ХОСТ:ПОРТ',
+                             help="адрес для подключения узлов")
+    coordinator.add_argument('--shards', type=int, default=SHARD_TARGET, help="число шардов при делении дерева")
+    coordinator.add_argument('--cross-fs', action='store_true',
+                             help="переходить на другие файловые системы, смонтированные внутри директорий")
+    coordinator.add_argument('-f', '--format', choices=('text', 'jsonl', 'csv'), default='text', help="формат вывода")
+    coordinator.add_argument('-o', '--output', help="файл для результатов (по умолчанию stdout)")
+    coordinator.add_argument('--infected-only', action='store_true',
+                             help="выводить только зараженные файлы (для jsonl и csv)")
+
+    worker = commands.add_parser('worker', help="проверять шарды координатора")
+    worker.add_argument('coordinator', metavar='ХОСТ:ПОРТ', help="адрес координатора")
+    worker.add_argument('-j', '--workers', type=int, default=1, help="число процессов (0 - все ядра)")
+    worker.add_argument('--no-clean', action='store_true', help="не очищать зараженные файлы")
+
+    for command in (coordinator, worker):
+        command.add_argument('--token', default=os.environ.get('DRWEB_TOKEN'),
+                             help="ключ доступа узлов (по умолчанию переменная DRWEB_TOKEN)")
+    parser.set_defaults(watch=False)
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        try:
+            scanner = ScanWorker(parse_address(args.coordinator), args.token, workers=args.workers)
+            scanner.engine.auto_clean = not args.no_clean
+            shards = scanner.run()
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Ошибка узла сканирования: {e}", file=sys.stderr)
+            return 2
+        print(f"Проверено шардов: {shards}", file=sys.stderr)
+        return 0
+
+    from cli import write_results
+    try:
+        scan = Coordinator(args.paths, parse_address(args.listen), args.token, args.shards, args.cross_fs).start()
+    except (OSError, ValueError) as e:
+        print(f"Ошибка запуска координатора: {e}", file=sys.stderr)
+        return 2
+    host, port = scan.address
+    if args.token is None and not host.startswith('127.'):
+        print("Внимание: координатор доступен из сети без ключа доступа (--token)", file=sys.stderr)
+    print(f"Координатор {host}:{port}: шардов {len(scan.shards)}", file=sys.stderr)
+    try:
+        return write_results(args, scan.results)
+    finally:
+        scan.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import hashlib
+
+# Блок чтения растет от начального до максимального, пока одно чтение занимает меньше CHUNK_TARGET_TIME
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_TARGET_TIME = 0.1
+# Минимальный интервал между событиями прогресса, секунды
+PROGRESS_INTERVAL = 0.25
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1
+TIMEOUT = 30
+
+
+class DownloadError(Exception):
+    """Ошибка загрузки или проверки файла"""
+
+
+def file_sha256(path):
+    """SHA-256 файла, прочитанного блоками"""
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MAX_CHUNK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class Downloader:
+    """Загрузка файла через общую HTTP-сессию: докачка по Range после обрыва,
+    проверка SHA-256, события прогресса progress_callback(загружено, всего) не чаще интервала"""
+
+    def __init__(self, session=None, progress_callback=None, interval=PROGRESS_INTERVAL):
+        self._session = session
+        self.progress_callback = progress_callback
+        self.interval = interval
+        self._last_event = 0.0
+        self._validator = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _progress(self, downloaded, total, force=False):
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if force or now - self._last_event >= self.interval:
+            self._last_event = now
+            self.progress_callback(downloaded, total)
+
+    def download(self, url, path, sha256=None):
+        """Загрузка url в path; недокачанная часть хранится в path + '.part' и продолжается при повторе"""
+        import requests
+        # Обрыв соединения при чтении тела ответа приходит из urllib3
+        from urllib3.exceptions import HTTPError as TransportError
+
+        part_path = path + '.part'
+        # ETag или Last-Modified первого ответа: при докачке передается в If-Range
+        self._validator = None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                self._fetch(url, part_path)
+                break
+            except (requests.RequestException, TransportError, OSError) as e:
+                if isinstance(e, requests.HTTPError) or attempt == MAX_ATTEMPTS:
+                    raise DownloadError(f"не удалось загрузить {url}: {e}") from e
+                time.sleep(RETRY_DELAY * attempt)
+
+        # Контрольная сумма проверяется до того, как файл будет использован
+        if sha256 is not None and file_sha256(part_path) != sha256.lower():
+            os.remove(part_path)
+            raise DownloadError("контрольная сумма SHA-256 не совпадает")
+        os.replace(part_path, path)
+        return path
+
+    def _fetch(self, url, part_path):
+        offset = os.lstat(part_path).st_size if os.path.lexists(part_path) else 0
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if self._validator:
+                headers['If-Range'] = self._validator
+
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 416 and offset:
+                # Файл уже загружен полностью
+                return
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+                if not match or int(match.group(1)) != offset:
+                    raise DownloadError("сервер вернул неверный диапазон")
+                total = int(match.group(2)) if match.group(2) != '*' else 0
+                flags = os.O_APPEND
+            else:
+                # Сервер не поддерживает докачку или файл изменился: загрузка с начала
+                offset = 0
+                total = int(response.headers.get('Content-Length', 0))
+                flags = os.O_TRUNC
+            self._validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+            downloaded = offset
+            chunk_size = DEFAULT_CHUNK_SIZE
+            # Символическая ссылка вместо недокачанного файла не открывается: запись ушла бы в чужой файл
+            flags |= os.O_WRONLY | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_BINARY', 0)
+            with open(os.open(part_path, flags, 0o600), 'wb') as f:
+                while True:
+                    started = time.monotonic()
+                    data = response.raw.read(chunk_size)
+                    if not data:
+                        break
+                    f.write(data)
+                    downloaded += len(data)
+                    if len(data) == chunk_size and time.monotonic() - started < CHUNK_TARGET_TIME:
+                        chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+                    self._progress(downloaded, total)
+            if total and downloaded < total:
+                raise OSError(f"соединение прервано: получено {downloaded} из {total} байт")
+            self._progress(downloaded, total or downloaded, force=True)
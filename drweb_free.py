@@ -1,216 +1,18 @@
 import os
-import json
-import hashlib
 import datetime
 import threading
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from pathlib import Path
-import zipfile
-import tempfile
-import shutil
-from updater import Updater
 from theme import DrWebTheme
+# Движок сканирования вынесен в engine.py и не зависит от графической среды
+from engine import DrWebFree
+from scan_session import ScanSession, resumable
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 
-class DrWebFree:
-    def __init__(self):
-        self.updater = Updater()
-        self.load_signatures()
-        
-        # Статистика сканирования
-        self.scan_stats = {
-            'total_files': 0,
-            'infected_files': 0,
-            'cleaned_files': 0,
-            'scan_time': 0
-        }
-        
-    def load_signatures(self):
-        """Загрузка базы сигнатур из файла"""
-        try:
-            with open("signatures.json", 'r') as f:
-                data = json.load(f)
-                self.virus_signatures = data['signatures']
-                self.heuristic_rules = data['heuristic_rules']
-        except Exception as e:
-            print(f"Ошибка загрузки сигнатур: {e}")
-            self.virus_signatures = {}
-            self.heuristic_rules = {
-                'suspicious_strings': [],
-                'suspicious_extensions': [],
-                'packers': {}
-            }
-            
-    def check_for_updates(self):
-        """Проверка обновлений"""
-        self.updater.run_update()
-        
-    def calculate_file_hash(self, file_path):
-        """Вычисление MD5 хеша файла"""
-        try:
-            with open(file_path, 'rb') as f:
-                file_hash = hashlib.md5()
-                while chunk := f.read(8192):
-                    file_hash.update(chunk)
-            return file_hash.hexdigest()
-        except Exception as e:
-            print(f"Ошибка при вычислении хеша файла {file_path}: {e}")
-            return None
-            
-    def check_suspicious_strings(self, file_path):
-        """Проверка на подозрительные строки"""
-        try:
-            with open(file_path, 'rb') as f:
-                content = f.read().lower()
-                for string in self.heuristic_rules['suspicious_strings']:
-                    if string.encode() in content:
-                        return True
-        except:
-            pass
-        return False
-        
-    def check_file_entropy(self, file_path):
-        """Проверка энтропии файла"""
-        try:
-            with open(file_path, 'rb') as f:
-                data = f.read()
-                if not data:
-                    return False
-                    
-                counts = {}
-                for byte in data:
-                    counts[byte] = counts.get(byte, 0) + 1
-                    
-                entropy = 0
-                for count in counts.values():
-                    p = count / len(data)
-                    entropy -= p * (p.bit_length() - 1)
-                    
-                return entropy > 7
-        except:
-            return False
-            
-    def check_packed_files(self, file_path):
-        """Проверка на упакованные файлы"""
-        try:
-            with open(file_path, 'rb') as f:
-                header = f.read(4)
-                return header in self.heuristic_rules['packers']
-        except:
-            return False
-            
-    def scan_file(self, file_path):
-        """Сканирование файла"""
-        results = {
-            'file_path': file_path,
-            'is_infected': False,
-            'threats': [],
-            'can_clean': False
-        }
-        
-        try:
-            # Проверка расширения
-            if Path(file_path).suffix.lower() in self.heuristic_rules['suspicious_extensions']:
-                results['threats'].append('Подозрительное расширение')
-                results['is_infected'] = True
-                
-            # Проверка хеша
-            file_hash = self.calculate_file_hash(file_path)
-            if file_hash in self.virus_signatures:
-                threat = self.virus_signatures[file_hash]
-                results['threats'].append(f'Обнаружен {threat["name"]} ({threat["type"]})')
-                results['is_infected'] = True
-                results['can_clean'] = True
-                
-            # Эвристический анализ
-            if self.check_suspicious_strings(file_path):
-                results['threats'].append('Подозрительные строки в файле')
-                results['is_infected'] = True
-                
-            if self.check_file_entropy(file_path):
-                results['threats'].append('Высокая энтропия (возможно упакован/зашифрован)')
-                results['is_infected'] = True
-                
-            if self.check_packed_files(file_path):
-                results['threats'].append('Обнаружен упакованный файл')
-                results['is_infected'] = True
-                
-        except Exception as e:
-            results['threats'].append(f'Ошибка сканирования: {e}')
-            results['is_infected'] = True
-            
-        return results
-        
-    def clean_file(self, file_path):
-        """Очистка зараженного файла"""
-        try:
-            # Создаем резервную копию
-            backup_path = f"{file_path}.bak"
-            shutil.copy2(file_path, backup_path)
-            
-            # Здесь можно добавить логику очистки в зависимости от типа вируса
-            
-            return True
-        except Exception as e:
-            print(f"Ошибка при очистке файла: {e}")
-            return False
-            
-    def scan_directory(self, directory_path, progress_callback=None):
-        """Сканирование директории"""
-        scan_results = []
-        self.scan_stats = {
-            'total_files': 0,
-            'infected_files': 0,
-            'cleaned_files': 0,
-            'scan_time': datetime.datetime.now()
-        }
-        
-        try:
-            for root, _, files in os.walk(directory_path):
-                for file in files:
-                    self.scan_stats['total_files'] += 1
-                    file_path = os.path.join(root, file)
-                    
-                    result = self.scan_file(file_path)
-                    scan_results.append(result)
-                    
-                    if result['is_infected']:
-                        self.scan_stats['infected_files'] += 1
-                        if result['can_clean'] and self.clean_file(file_path):
-                            self.scan_stats['cleaned_files'] += 1
-                            
-                    if progress_callback:
-                        progress = (self.scan_stats['total_files'] / 
-                                  sum(1 for _, _, files in os.walk(directory_path) for _ in files) * 100)
-                        progress_callback(progress)
-                        
-        except Exception as e:
-            print(f"Ошибка при сканировании: {e}")
-            
-        self.scan_stats['scan_time'] = datetime.datetime.now() - self.scan_stats['scan_time']
-        return scan_results
-        
-    def generate_report(self, scan_results):
-        """Генерация отчета"""
-        report = []
-        report.append("=== ОТЧЕТ DR.WEB FREE ===")
-        report.append(f"Время сканирования: {self.scan_stats['scan_time']}")
-        report.append(f"Всего проверено файлов: {self.scan_stats['total_files']}")
-        report.append(f"Найдено зараженных файлов: {self.scan_stats['infected_files']}")
-        report.append(f"Очищено файлов: {self.scan_stats['cleaned_files']}")
-        report.append("\nЗараженные файлы:")
-        
-        for result in scan_results:
-            if result['is_infected']:
-                report.append(f"\nФайл: {result['file_path']}")
-                for threat in result['threats']:
-                    report.append(f"- {threat}")
-                if result['can_clean']:
-                    report.append("- Файл был очищен")
-                    
-        return "\n".join(report)
+# Период опроса очереди событий сканирования, мс
+POLL_INTERVAL = 100
 
 class AntivirusGUI:
     def __init__(self):
@@ -222,6 +24,10 @@ class AntivirusGUI:
         self.theme = DrWebTheme()
         self.antivirus = DrWebFree()
         self.scan_thread = None
+        # Сеанс текущего сканирования: контрольные точки, пауза и отмена
+        self.session = None
+        # События из потока сканирования; виджеты обновляются только в главном потоке
+        self.events = queue.Queue()
         
         self.create_widgets()
         
@@ -250,6 +56,7 @@ class AntivirusGUI:
         tools_menu = tk.Menu(menubar, tearoff=0, bg='#f8f9fa', fg='#2c3e50')
         menubar.add_cascade(label="Инструменты", menu=tools_menu)
         tools_menu.add_command(label="Проверить обновления", command=self.check_updates)
+        tools_menu.add_command(label="Обновить базы сигнатур", command=self.update_signatures)
         
         # Панель управления
         control_frame = self.theme.create_frame(main_frame)
@@ -261,9 +68,14 @@ class AntivirusGUI:
         path_entry.config(textvariable=self.path_var, width=50)
         path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         
-        # Кнопка сканирования
+        # Кнопки сканирования
+        self.cancel_button = self.theme.create_warning_button(control_frame, "Отмена", self.cancel_scan)
+        self.cancel_button.pack(side=tk.RIGHT, padx=(10, 0))
+        self.pause_button = self.theme.create_action_button(control_frame, "Пауза", self.toggle_pause)
+        self.pause_button.pack(side=tk.RIGHT, padx=(10, 0))
         scan_button = self.theme.create_action_button(control_frame, "Начать сканирование", self.start_scan)
         scan_button.pack(side=tk.RIGHT)
+        self.set_scan_controls(False)
         
         # Статистика
         stats_frame = self.theme.create_frame(main_frame)
@@ -283,7 +95,12 @@ class AntivirusGUI:
         
         # Прогресс-бар
         self.progress = self.theme.create_progressbar(main_frame)
-        self.progress.pack(fill=tk.X, pady=(0, 20))
+        self.progress.pack(fill=tk.X, pady=(0, 5))
+        
+        self.progress_var = tk.StringVar(value="")
+        progress_label = self.theme.create_label(main_frame, "")
+        progress_label.config(textvariable=self.progress_var)
+        progress_label.pack(anchor=tk.W, pady=(0, 15))
         
         # Отчет
         report_frame = self.theme.create_frame(main_frame)
@@ -306,6 +123,8 @@ class AntivirusGUI:
         
         # Добавляем подсказки
         self.theme.create_tooltip(scan_button, "Начать сканирование выбранной директории")
+        self.theme.create_tooltip(self.pause_button, "Приостановить или продолжить сканирование")
+        self.theme.create_tooltip(self.cancel_button, "Остановить сканирование; его можно будет продолжить позже")
         self.theme.create_tooltip(path_entry, "Выберите директорию для сканирования")
         
     def select_directory(self):
@@ -316,16 +135,88 @@ class AntivirusGUI:
     def check_updates(self):
         self.antivirus.check_for_updates()
         
-    def update_progress(self, value):
-        self.progress['value'] = value
-        self.root.update_idletasks()
+    def update_signatures(self):
+        """Обновление баз в фоне; идущее сканирование продолжается с новой базой"""
+        outcome = {}
+        
+        def update_thread():
+            try:
+                outcome['updated'] = self.antivirus.update_signatures()
+            except Exception as e:
+                outcome['error'] = e
+                
+        thread = threading.Thread(target=update_thread, daemon=True)
+        thread.start()
+        
+        def wait():
+            if thread.is_alive():
+                self.root.after(POLL_INTERVAL, wait)
+            elif 'error' in outcome:
+                messagebox.showerror("Ошибка", f"Не удалось обновить базы сигнатур: {outcome['error']}")
+            elif outcome['updated']:
+                messagebox.showinfo("Обновления",
+                                    f"Базы сигнатур обновлены до версии {self.antivirus.virus_signatures.version}")
+            else:
+                messagebox.showinfo("Обновления", "Базы сигнатур актуальны")
+                
+        self.root.after(POLL_INTERVAL, wait)
+        
+    def update_progress(self, event):
+        self.progress['value'] = event['percent']
+        total = event['total_files'] if event['counted'] else f"{event['total_files']}+"
+        status = (f"{event['files']} из {total} файлов, "
+                  f"{event['files_per_sec']:.0f} файлов/с, "
+                  f"{event['bytes_per_sec'] / (1024 * 1024):.1f} МБ/с")
+        if event['eta'] is not None:
+            status += f", осталось {datetime.timedelta(seconds=int(event['eta']))}"
+        self.progress_var.set(status)
+        
+    def poll_events(self):
+        """Обработка событий потока сканирования в главном потоке"""
+        try:
+            while True:
+                kind, payload = self.events.get_nowait()
+                if kind == 'progress':
+                    self.update_progress(payload)
+                elif kind == 'done':
+                    self.scan_completed(payload)
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL, self.poll_events)
         
     def update_stats(self, total, infected, cleaned):
         self.total_files_var.set(f"Всего файлов: {total}")
         self.infected_files_var.set(f"Зараженных: {infected}")
         self.cleaned_files_var.set(f"Очищено: {cleaned}")
         
+    def set_scan_controls(self, running):
+        state = tk.NORMAL if running else tk.DISABLED
+        self.pause_button.config(state=state, text="Пауза")
+        self.cancel_button.config(state=state)
+        
+    def toggle_pause(self):
+        if self.session is None:
+            return
+        if self.session.paused:
+            self.session.resume()
+            self.pause_button.config(text="Пауза")
+        else:
+            self.session.pause()
+            self.pause_button.config(text="Продолжить")
+            self.progress_var.set("Сканирование приостановлено")
+            
+    def cancel_scan(self):
+        if self.session is not None:
+            self.session.cancel()
+            self.progress_var.set("Сканирование останавливается...")
+            
     def scan_completed(self, scan_results):
+        cancelled = self.session.cancelled
+        self.session.close()
+        self.session = None
+        self.set_scan_controls(False)
+        
         report = self.antivirus.generate_report(scan_results)
         self.report_text.delete(1.0, tk.END)
         self.report_text.insert(tk.END, report)
@@ -337,6 +228,10 @@ class AntivirusGUI:
             self.antivirus.scan_stats['cleaned_files']
         )
         
+        if cancelled:
+            messagebox.showinfo("Сканирование отменено",
+                                "Сканирование остановлено; при следующем запуске его можно продолжить")
+            return
         messagebox.showinfo("Сканирование завершено", 
                           f"Найдено {self.antivirus.scan_stats['infected_files']} зараженных файлов")
         
@@ -345,14 +240,24 @@ class AntivirusGUI:
         if not directory or not os.path.isdir(directory):
             messagebox.showerror("Ошибка", "Выберите корректную директорию")
             return
+        if self.session is not None:
+            return
+            
+        resume = resumable(directory) and messagebox.askyesno(
+            "Незавершенное сканирование", "Сканирование этой директории было прервано. Продолжить его?")
+        self.session = ScanSession(directory, resume=resume)
+        session = self.session
+        self.set_scan_controls(True)
             
         def scan_thread():
-            scan_results = self.antivirus.scan_directory(directory, self.update_progress)
-            self.root.after(0, lambda: self.scan_completed(scan_results))
+            scan_results = self.antivirus.scan_directory(
+                directory, lambda event: self.events.put(('progress', event)), session=session)
+            self.events.put(('done', scan_results))
             
         self.scan_thread = threading.Thread(target=scan_thread)
         self.scan_thread.daemon = True
         self.scan_thread.start()
+        self.root.after(POLL_INTERVAL, self.poll_events)
         
     def run(self):
         self.root.mainloop()
@@ -0,0 +1,594 @@
+import os
+import sys
+import time
+import datetime
+import itertools
+from pathlib import Path
+from collections import deque
+from aho_corasick import AhoCorasick
+from entropy import ENTROPY_THRESHOLD
+from progress import ProgressTracker, file_size
+from metrics import CLEAN
+from traversal import ORDER_INODE, READAHEAD_FILES, TreeWalker, readahead
+from dedup import Deduplicator
+from sigdb import SIGNATURES_PATH, COMPILED_PATH, EmptyDatabase, cache_directory, open_database
+from results import (ScanResult, SUSPICIOUS_EXTENSION, SIGNATURE, SUSPICIOUS_STRINGS,
+                     HIGH_ENTROPY, ENTROPY_REGION, PACKED, RULE, ARCHIVE_LIMIT, SCAN_ERROR)
+from rules import SKIP, RuleContext, RuleError, RulePlan
+from magic import MagicError, build_index
+from sinks import REPORT_TITLE, report_summary, report_entry
+from analyzers import (CHUNK_SIZE, HEADER_SIZE, MMAP_THRESHOLD, HashAnalyzer, SignatureHashAnalyzer, StringAnalyzer,
+                       EntropyAnalyzer, HeaderAnalyzer, RangeAnalyzer, analyze_file)
+from policies import POLICIES, SIZE_POLICIES, policy_for_size, part_ranges
+from archives import MEMBER_SEPARATOR, ArchiveScanner
+
+class DrWebFree:
+    def __init__(self):
+        self._updater = None
+        self.chunk_size = CHUNK_SIZE
+        # Параллельный режим: число процессов (1 - последовательно, 0 - все ядра) и файлов в задании
+        self.scan_workers = 1
+        self.scan_chunksize = None
+        # Кеш вердиктов между запусками (включается enable_scan_cache)
+        self.scan_cache = None
+        # Очищать ли файлы с известными сигнатурами во время сканирования
+        self.auto_clean = True
+        # Карантин для копий очищаемых файлов (открывается при первой очистке или enable_quarantine)
+        self.quarantine = None
+        # Проверять содержимое архивов (zip, tar) без извлечения на диск
+        self.scan_archives = True
+        # Каталог обновлений сигнатур (см. sigupdate)
+        self.signatures_update_url = None
+        # Метрики проверок (включаются enable_metrics; выключенные почти ничего не стоят)
+        self.metrics = None
+        # Обход каталогов: порядок файлов, переход на другие файловые системы, число файлов упреждающего чтения
+        self.walk_order = ORDER_INODE
+        self.cross_filesystems = False
+        self.readahead = READAHEAD_FILES
+        # Политики анализа по размеру файла (см. policies) и порог чтения через mmap
+        self.size_policies = SIZE_POLICIES
+        self.mmap_threshold = MMAP_THRESHOLD
+        # Жесткие ссылки и одинаковые файлы проверяются один раз за сканирование (см. dedup)
+        self.deduplicate = True
+        self.load_signatures()
+        
+        # Статистика сканирования
+        self.scan_stats = {
+            'total_files': 0,
+            'infected_files': 0,
+            'cleaned_files': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'dedup_files': 0,
+            'dedup_bytes': 0,
+            'scan_time': 0
+        }
+        
+    @property
+    def updater(self):
+        """Модуль обновлений создается при первом обращении (ему нужна графическая среда)"""
+        if self._updater is None:
+            from updater import Updater
+            self._updater = Updater()
+        return self._updater
+        
+    def load_signatures(self):
+        """Загрузка скомпилированной базы сигнатур (при изменении signatures.json она пересобирается)"""
+        try:
+            database = open_database(SIGNATURES_PATH, COMPILED_PATH)
+        except Exception as e:
+            print(f"Ошибка загрузки сигнатур: {e}", file=sys.stderr)
+            try:
+                # Каталог программы может быть недоступен для записи: личный кеш пользователя,
+                # а если и он недоступен - новый закрытый временный каталог
+                try:
+                    directory = cache_directory()
+                except OSError:
+                    import tempfile
+                    directory = tempfile.mkdtemp(prefix='drweb-free-')
+                database = open_database(SIGNATURES_PATH, os.path.join(directory, COMPILED_PATH))
+            except Exception as e:
+                print(f"Ошибка загрузки сигнатур: {e}", file=sys.stderr)
+                database = EmptyDatabase()
+                
+        self.virus_signatures = database
+        self.heuristic_rules = database.heuristic_rules
+        self.signatures_version = database.signatures_version
+        
+        # Индекс типов файлов и упаковщиков по заголовку
+        try:
+            self.magic_index = build_index(self.heuristic_rules)
+        except MagicError as e:
+            print(f"Ошибка в таблице типов файлов: {e}", file=sys.stderr)
+            self.magic_index = build_index({})
+            
+        # Правила компилируются в план проверки один раз при загрузке базы
+        try:
+            self.rule_plan = RulePlan(self.heuristic_rules.get('rules', ()), self.magic_index.types)
+        except RuleError as e:
+            print(f"Ошибка в правилах эвристики: {e}", file=sys.stderr)
+            self.rule_plan = RulePlan()
+            
+        # Автомат строится один раз и используется для всех файлов; строки правил ищутся тем же проходом
+        self.suspicious_strings = set(self.heuristic_rules['suspicious_strings'])
+        self.string_matcher = AhoCorasick(self.heuristic_rules['suspicious_strings']
+                                          + sorted(self.rule_plan.strings
+                                                   - {string.lower() for string in self.suspicious_strings}))
+        
+        if self.scan_cache is not None:
+            self.scan_cache.version = self.signatures_version
+            
+    def enable_scan_cache(self, path=None, max_entries=None):
+        """Включение постоянного кеша вердиктов для повторных сканирований"""
+        from scan_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, ScanCache
+        self.scan_cache = ScanCache(path or DEFAULT_CACHE_PATH, self.signatures_version,
+                                    max_entries or DEFAULT_MAX_ENTRIES)
+        return self.scan_cache
+            
+    def enable_quarantine(self, path=None, hardlink=False):
+        """Открытие карантина для копий очищаемых файлов"""
+        from quarantine import DEFAULT_QUARANTINE_PATH, Quarantine
+        self.quarantine = Quarantine(path or DEFAULT_QUARANTINE_PATH, hardlink=hardlink, metrics=self.metrics)
+        return self.quarantine
+        
+    def enable_metrics(self):
+        """Включение сбора метрик: время анализаторов и этапов, ошибки, самые долгие файлы"""
+        from metrics import ScanMetrics
+        if self.metrics is None:
+            self.metrics = ScanMetrics()
+        if self.quarantine is not None:
+            self.quarantine.metrics = self.metrics
+        return self.metrics
+            
+    def check_for_updates(self):
+        """Проверка обновлений"""
+        self.updater.run_update()
+        
+    def update_signatures(self, base_url=None):
+        """Инкрементальное обновление сигнатур и переключение на новую базу без перезапуска.
+        Идущее сканирование не прерывается: следующие файлы проверяются уже по новой базе
+        (процессы параллельного сканирования - до его окончания по старой)"""
+        from sigupdate import DEFAULT_UPDATE_URL, SignatureUpdater
+        updater = SignatureUpdater(base_url or self.signatures_update_url or DEFAULT_UPDATE_URL,
+                                   SIGNATURES_PATH, COMPILED_PATH)
+        if not updater.update():
+            return False
+        self.load_signatures()
+        return True
+        
+    def create_analyzers(self, size=None):
+        """Набор анализаторов для одного прохода по файлу; по размеру (если известен) выбирается политика"""
+        strings = StringAnalyzer(self.string_matcher)
+        entropy = EntropyAnalyzer()
+        if size is not None:
+            policy = POLICIES[policy_for_size(size, self.size_policies)]
+            ranges = part_ranges(policy['strings'], size)
+            if ranges is not None:
+                strings = RangeAnalyzer(strings, ranges)
+            ranges = part_ranges(policy['entropy'], size)
+            if ranges is not None:
+                entropy = RangeAnalyzer(entropy, ranges)
+        analyzers = [
+            SignatureHashAnalyzer(self.virus_signatures.tables),
+            strings,
+            entropy,
+            HeaderAnalyzer(),
+        ]
+        if self.metrics is not None:
+            analyzers = self.metrics.timed(analyzers)
+        return analyzers
+        
+    def analyze_file(self, file_path, analyzers=None):
+        """Однократное чтение файла всеми анализаторами"""
+        if analyzers is None:
+            analyzers = self.create_analyzers
+        return analyze_file(file_path, analyzers, self.chunk_size, self.mmap_threshold)
+        
+    def calculate_file_hash(self, file_path):
+        """Вычисление MD5 хеша файла"""
+        try:
+            return self.analyze_file(file_path, [HashAnalyzer('md5')])['hash']
+        except Exception as e:
+            print(f"Ошибка при вычислении хеша файла {file_path}: {e}", file=sys.stderr)
+            return None
+            
+    def check_suspicious_strings(self, file_path):
+        """Проверка на подозрительные строки"""
+        try:
+            analyzer = StringAnalyzer(self.string_matcher)
+            strings = self.analyze_file(file_path, [analyzer])['strings']
+            return any(string in self.suspicious_strings for string in strings)
+        except:
+            return False
+        
+    def check_file_entropy(self, file_path):
+        """Проверка энтропии файла"""
+        try:
+            return self.analyze_file(file_path, [EntropyAnalyzer()])['entropy']['total'] > ENTROPY_THRESHOLD
+        except:
+            return False
+            
+    def check_packed_files(self, file_path):
+        """Проверка на упакованные файлы"""
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(HEADER_SIZE)
+            return bool(self.magic_index.classify(header)['packers'])
+        except:
+            return False
+            
+    def has_suspicious_extension(self, name):
+        """Проверка расширения по эвристическим правилам"""
+        return Path(name).suffix.lower() in self.heuristic_rules['suspicious_extensions']
+        
+    def scan_file(self, file_path):
+        """Сканирование файла за один проход чтения"""
+        return self._scan_file(file_path)[0]
+        
+    def _scan_file(self, file_path, source=None):
+        # Результат проверки и заголовок файла (None, если файл не прочитан);
+        # source - путь или открытый дескриптор, по которому файл читается, если он отличается от имени в отчете
+        result = ScanResult(file_path)
+        header = None
+        if source is None:
+            source = file_path
+        
+        try:
+            # Исключения, решаемые по имени и размеру: файл читается только для проверки сигнатур
+            if self.rule_plan.skip_rules and self.rule_plan.prefilter(file_path, file_size(source)):
+                analyzers = [SignatureHashAnalyzer(self.virus_signatures.tables)]
+                if self.metrics is not None:
+                    analyzers = self.metrics.timed(analyzers)
+                try:
+                    self.check_signature(result, self.analyze_file(source, analyzers))
+                except OSError as e:
+                    print(f"Ошибка при чтении файла {file_path}: {e}", file=sys.stderr)
+                    result.error = str(e)
+                    if self.metrics is not None:
+                        self.metrics.error(e)
+                return result, header
+                
+            # Проверка расширения
+            if self.has_suspicious_extension(file_path):
+                result.add(SUSPICIOUS_EXTENSION)
+                
+            try:
+                analysis = self.analyze_file(source)
+            except OSError as e:
+                print(f"Ошибка при чтении файла {file_path}: {e}", file=sys.stderr)
+                result.error = str(e)
+                if self.metrics is not None:
+                    self.metrics.error(e)
+                return result, header
+                
+            header = analysis['header']
+            self.check_analysis(result, analysis)
+            
+        except Exception as e:
+            result.add(SCAN_ERROR, str(e))
+            result.error = str(e)
+            if self.metrics is not None:
+                self.metrics.error(e)
+            
+        return result, header
+        
+    def check_signature(self, result, analysis):
+        """Проверка хешей (всего файла и префиксов) по базе сигнатур.
+        Исключения (skip) ее не отменяют: и до чтения файла, и после анализа остаются только находки сигнатур"""
+        threat = self.virus_signatures.match(analysis['hashes'], analysis['size'])
+        if threat is not None:
+            result.add(SIGNATURE, f'{threat["name"]} ({threat["type"]})')
+            result.can_clean = True
+        return result
+        
+    def check_analysis(self, result, analysis):
+        """Проверки по результатам анализа содержимого: сигнатуры и эвристики"""
+        self.check_signature(result, analysis)
+            
+        # Тип файла и упаковщик по заголовку, общие для правил и проверок ниже
+        classification = self.magic_index.classify(analysis['header'])
+        
+        # Правила эвристики; сработавшее исключение отменяет остальные эвристические проверки
+        if self.rule_plan:
+            context = RuleContext(result.file_path, analysis['size'], analysis, classification)
+            for rule in self.rule_plan.evaluate(context):
+                if rule.action == SKIP:
+                    result.threats = [threat for threat in result.threats if threat[0] == SIGNATURE]
+                    return result
+                result.add(RULE, rule.name)
+                
+        # Эвристический анализ
+        strings = [string for string in analysis['strings'] if string in self.suspicious_strings]
+        if strings:
+            result.add(SUSPICIOUS_STRINGS, ", ".join(strings))
+            
+        entropy = analysis['entropy']
+        if entropy['total'] > ENTROPY_THRESHOLD:
+            result.add(HIGH_ENTROPY)
+        elif entropy['regions']:
+            # Упакованный участок внутри обычного файла
+            start, end = entropy['regions'][0]
+            result.add(ENTROPY_REGION, f'{start}-{end}')
+            
+        if classification['packers']:
+            result.add(PACKED, ", ".join(classification['packers']))
+            
+        return result
+        
+    def scan_entries(self, file_path, source=None):
+        """Проверка файла и, если это архив, его содержимого.
+        Результаты файлов архива (archive.zip!inner/path) выдаются раньше результата самого архива"""
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        if source is None:
+            source = file_path
+        result, header = self._scan_file(file_path, source)
+        if self.scan_archives and header:
+            scanner = ArchiveScanner(self.create_analyzers, self.chunk_size)
+            try:
+                for member_path, analysis, error in scanner.scan(source, header):
+                    yield self._member_result(file_path, member_path, analysis, error)
+            except Exception as e:
+                print(f"Ошибка при проверке архива {file_path}: {e}", file=sys.stderr)
+            for description in scanner.exceeded:
+                result.add(ARCHIVE_LIMIT, description)
+        if metrics is not None:
+            metrics.file(file_path, time.perf_counter() - started, file_size(source))
+        yield result
+        
+    def _member_result(self, file_path, member_path, analysis, error):
+        result = ScanResult(f"{file_path}{MEMBER_SEPARATOR}{member_path}", container=file_path)
+        if self.has_suspicious_extension(member_path.rsplit(MEMBER_SEPARATOR, 1)[-1]):
+            result.add(SUSPICIOUS_EXTENSION)
+        if error is not None:
+            result.error = str(error)
+            if self.metrics is not None:
+                self.metrics.error(error)
+            # Элемент прочитан, но не открылся как вложенный архив: сам элемент проверяется
+            if analysis is None:
+                return result
+        try:
+            self.check_analysis(result, analysis)
+        except Exception as e:
+            result.add(SCAN_ERROR, str(e))
+            result.error = str(e)
+            if self.metrics is not None:
+                self.metrics.error(e)
+        # Файл внутри архива нельзя очистить на месте
+        result.can_clean = False
+        return result
+        
+    def clean_file(self, file_path, threats=()):
+        """Очистка зараженного файла"""
+        started = time.perf_counter()
+        try:
+            # Копия помещается в карантин в фоновом потоке
+            quarantine = self.quarantine or self.enable_quarantine()
+            copied = quarantine.submit(file_path, threats)
+            
+            # Здесь можно добавить логику очистки в зависимости от типа вируса;
+            # перед изменением файла нужно дождаться копии: copied.result()
+            
+            return True
+        except Exception as e:
+            print(f"Ошибка при очистке файла: {e}", file=sys.stderr)
+            if self.metrics is not None:
+                self.metrics.error(e)
+            return False
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe(CLEAN, time.perf_counter() - started, file_size(file_path))
+            
+    def iter_entries(self, directory_path, recursive=True):
+        """Обход директории с выдачей пар (путь, stat): stat получен при обходе и используется повторно.
+        Каталоги читаются в отдельном потоке, следующие файлы ядро начинает читать заранее"""
+        if os.path.isfile(directory_path):
+            yield directory_path, os.stat(directory_path)
+            return
+        walker = TreeWalker(directory_path, self.walk_order, self.cross_filesystems, self.metrics, recursive=recursive)
+        yield from readahead(walker, self.readahead)
+        
+    def iter_files(self, directory_path):
+        """Обход директории с выдачей путей к файлам (путь к файлу выдается как есть)"""
+        for file_path, _ in self.iter_entries(directory_path):
+            yield file_path
+                
+    def iter_results(self, directory_path, workers=1, chunksize=None, sizes=None, dedup=None, recursive=True,
+                     session=None):
+        """Результаты проверки файлов директории (без подкаталогов, если recursive=False);
+        при включенном кеше неизмененные файлы не читаются.
+        В sizes (если передан) записываются размеры файлов из обхода: путь -> байты.
+        Копии уже проверенных файлов получают их вердикт через dedup (Deduplicator).
+        С session (ScanSession) файлы прошлых запусков пропускаются, пауза и отмена останавливают обход"""
+        cache = self.scan_cache
+        if dedup is None and self.deduplicate:
+            dedup = Deduplicator()
+        
+        def walk_paths():
+            for file_path, entry_stat in self.iter_entries(directory_path, recursive):
+                if session is not None:
+                    if not session.wait():
+                        break
+                    if session.is_done(file_path):
+                        continue
+                if sizes is not None:
+                    sizes[file_path] = entry_stat.st_size if entry_stat else 0
+                if cache is not None:
+                    key = cache.file_key(file_path, entry_stat)
+                    result = cache.get(key, file_path)
+                    if result is not None:
+                        cached.append(result)
+                        continue
+                    keys[file_path] = key
+                if dedup is not None and dedup.check(file_path, entry_stat):
+                    continue
+                yield file_path
+                
+        cached = deque()
+        keys = {}
+        paths = walk_paths()
+            
+        if workers == 1:
+            results = (result for file_path in paths for result in self.scan_entries(file_path))
+        else:
+            from parallel import ParallelScanner
+            results = ParallelScanner(self, workers or None, chunksize).scan(paths)
+        if dedup is not None:
+            results = self._shared_results(results, dedup)
+            
+        # Архивы с зараженным содержимым не кешируются: из кеша выдается только вердикт самого архива
+        unsafe = set()
+        version = self.signatures_version
+        for result in results:
+            if cache is not None:
+                while cached:
+                    yield cached.popleft()
+                if result.container is not None:
+                    if result.is_infected or result.error:
+                        unsafe.add(result.container)
+                else:
+                    key = keys.pop(result.file_path, None)
+                    if result.file_path in unsafe:
+                        unsafe.discard(result.file_path)
+                    # После обновления базы во время сканирования вердикты по старой базе не сохраняются
+                    elif self.signatures_version == version:
+                        cache.put(key, result)
+            yield result
+            
+        if cache is not None:
+            while cached:
+                yield cached.popleft()
+            cache.flush()
+            
+    def _shared_results(self, results, dedup):
+        """Результаты проверки вместе с результатами копий, получивших тот же вердикт"""
+        for result in results:
+            yield result
+            dedup.add(result)
+            yield from self._shared_ready(dedup)
+        # Последние найденные файлы могли оказаться копиями уже проверенных
+        yield from self._shared_ready(dedup)
+        
+    def _shared_ready(self, dedup):
+        while dedup.ready:
+            yield dedup.ready.popleft()
+        # Оригинал не удалось проверить: копии проверяются сами
+        while dedup.rescan:
+            yield from self.scan_entries(dedup.rescan.pop())
+                
+    def scan_iter(self, directory_path, progress_callback=None, workers=None, chunksize=None, recursive=True,
+                  session=None):
+        """Потоковое сканирование: результаты выдаются по мере готовности, scan_stats обновляется на ходу.
+        progress_callback получает события прогресса (см. ProgressTracker.event).
+        session (ScanSession) сохраняет контрольные точки и позволяет приостановить и отменить сканирование;
+        при возобновлении выдаются только результаты новых файлов, счетчики продолжаются"""
+        started = datetime.datetime.now()
+        self.scan_stats = {
+            'total_files': 0,
+            'infected_files': 0,
+            'cleaned_files': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'dedup_files': 0,
+            'dedup_bytes': 0,
+            'scan_time': datetime.timedelta()
+        }
+        if session is not None:
+            self.scan_stats.update(session.counters())
+        previous_time = self.scan_stats['scan_time']
+        
+        workers = self.scan_workers if workers is None else workers
+        chunksize = self.scan_chunksize if chunksize is None else chunksize
+        
+        cache = self.scan_cache
+        if cache is not None:
+            hits, misses = cache.hits, cache.misses
+            
+        tracker = None
+        if progress_callback:
+            # Общий объем считает отдельный обход с теми же параметрами, что у сканирования
+            entries = TreeWalker(directory_path, self.walk_order, self.cross_filesystems, recursive=recursive)
+            tracker = ProgressTracker(directory_path, progress_callback, entries=entries).start()
+            if session is not None:
+                tracker.resume_from(session.stats['files'], session.stats['bytes'])
+            
+        sizes = {} if tracker or session else None
+        dedup = Deduplicator() if self.deduplicate else None
+        completed = False
+        try:
+            for result in self.iter_results(directory_path, workers, chunksize, sizes, dedup, recursive, session):
+                self.scan_stats['total_files'] += 1
+                
+                if result.is_infected:
+                    self.scan_stats['infected_files'] += 1
+                    if result.can_clean and self.auto_clean and self.clean_file(result.file_path, result.threats):
+                        result.cleaned = True
+                        self.scan_stats['cleaned_files'] += 1
+                        
+                size = 0
+                if sizes is not None and result.container is None:
+                    size = sizes.pop(result.file_path, 0)
+                    if tracker:
+                        tracker.advance(size)
+                if session is not None:
+                    session.record(result, self.scan_stats, size)
+                    
+                yield result
+            completed = True
+                
+        except Exception as e:
+            print(f"Ошибка при сканировании: {e}", file=sys.stderr)
+            
+        finally:
+            if tracker:
+                tracker.finish()
+                
+            if self.quarantine is not None:
+                self.quarantine.flush()
+                
+            if cache is not None:
+                self.scan_stats['cache_hits'] += cache.hits - hits
+                self.scan_stats['cache_misses'] += cache.misses - misses
+                
+            if dedup is not None:
+                self.scan_stats['dedup_files'] += dedup.stats['hardlinks'] + dedup.stats['duplicates']
+                self.scan_stats['dedup_bytes'] += dedup.stats['saved_bytes']
+                
+            self.scan_stats['scan_time'] = previous_time + (datetime.datetime.now() - started)
+            
+            if session is not None:
+                # Прерванное сканирование (отмена, ошибка, закрытый генератор) можно возобновить
+                if completed:
+                    session.finish(self.scan_stats)
+                else:
+                    session.checkpoint(self.scan_stats)
+            
+    def scan_directory(self, directory_path, progress_callback=None, workers=None, chunksize=None, sinks=(),
+                       session=None):
+        """Сканирование директории; результаты пишутся в sinks, возвращаются только зараженные файлы.
+        При возобновлении сеанса session сначала выдаются сохраненные в нем результаты"""
+        infected = []
+        previous = session.results() if session is not None and session.resumed else ()
+        for result in itertools.chain(previous, self.scan_iter(directory_path, progress_callback, workers,
+                                                               chunksize, session=session)):
+            for sink in sinks:
+                sink.write(result)
+            if result.is_infected:
+                infected.append(result)
+                
+        for sink in sinks:
+            sink.finish(self.scan_stats)
+        return infected
+        
+    def generate_report(self, scan_results):
+        """Генерация отчета"""
+        report = [REPORT_TITLE]
+        report.extend(report_summary(self.scan_stats))
+        report.append("\nЗараженные файлы:")
+        
+        for result in scan_results:
+            if result.is_infected:
+                report.extend(report_entry(result))
+                
+        return "\n".join(report)
@@ -0,0 +1,145 @@
+import math
+from collections import Counter
+
+# NumPy считает гистограммы векторно, без него используется Counter.
+# Импортируется при первом подсчете, чтобы загрузка модуля оставалась быстрой
+numpy = None
+_numpy_loaded = False
+
+# Порог энтропии (бит на байт), выше которого данные считаются упакованными/зашифрованными
+ENTROPY_THRESHOLD = 7
+# Размер блока для профиля энтропии
+BLOCK_SIZE = 64 * 1024
+# Сколько участков с высокой энтропией запоминать
+MAX_REGIONS = 64
+
+
+def _numpy():
+    global numpy, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def byte_histogram(data):
+    """Гистограмма 256 значений байтов"""
+    _numpy()
+    if numpy is not None:
+        return numpy.bincount(numpy.frombuffer(data, dtype=numpy.uint8), minlength=256)
+    counts = [0] * 256
+    for byte, count in Counter(data).items():
+        counts[byte] = count
+    return counts
+
+
+def block_histograms(data, block_size=BLOCK_SIZE):
+    """Гистограммы всех полных блоков данных (одна строка на блок)"""
+    _numpy()
+    blocks = len(data) // block_size
+    if numpy is not None:
+        array = numpy.frombuffer(data, dtype=numpy.uint8, count=blocks * block_size)
+        # Сдвиг на 256 для каждого блока дает все гистограммы одним вызовом bincount
+        index = array.reshape(blocks, block_size) + (numpy.arange(blocks, dtype=numpy.intp) * 256)[:, None]
+        return numpy.bincount(index.ravel(), minlength=blocks * 256).reshape(blocks, 256)
+    view = memoryview(data)
+    return [byte_histogram(view[i * block_size:(i + 1) * block_size]) for i in range(blocks)]
+
+
+def shannon_entropy(counts):
+    """Энтропия Шеннона по гистограмме, бит на байт"""
+    _numpy()
+    if numpy is not None:
+        counts = numpy.asarray(counts)
+        total = counts.sum()
+        if not total:
+            return 0.0
+        p = counts[counts > 0] / total
+        return float(-(p * numpy.log2(p)).sum())
+    total = sum(counts)
+    if not total:
+        return 0.0
+    entropy = 0.0
+    for count in counts:
+        if count:
+            p = count / total
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+def entropy_profile(data, block_size=BLOCK_SIZE):
+    """Профиль энтропии по блокам: [(смещение, энтропия)], последний блок может быть неполным"""
+    view = memoryview(data)
+    profile = [(i * block_size, shannon_entropy(counts))
+               for i, counts in enumerate(block_histograms(view, block_size))]
+    rest = len(view) % block_size
+    if rest:
+        profile.append((len(view) - rest, shannon_entropy(byte_histogram(view[len(view) - rest:]))))
+    return profile
+
+
+class EntropyAccumulator:
+    """Потоковый подсчет энтропии файла и поиск участков с высокой энтропией"""
+
+    def __init__(self, threshold=ENTROPY_THRESHOLD, block_size=BLOCK_SIZE):
+        _numpy()
+        self.threshold = threshold
+        self.block_size = block_size
+        self.counts = [0] * 256 if numpy is None else numpy.zeros(256, dtype=numpy.int64)
+        self.total = 0
+        self.max_block_entropy = 0.0
+        self.regions = []
+        self._pending = bytearray()
+
+    def feed(self, chunk, offset):
+        """Обработка блока файла; блоки профиля выравниваются по началу файла"""
+        chunk = memoryview(chunk)
+        self.total += len(chunk)
+        if self._pending:
+            need = self.block_size - len(self._pending)
+            self._pending += chunk[:need]
+            chunk = chunk[need:]
+            offset += need
+            if len(self._pending) < self.block_size:
+                return
+            self._add_blocks(self._pending, offset - self.block_size)
+            self._pending = bytearray()
+        full = len(chunk) - len(chunk) % self.block_size
+        if full:
+            self._add_blocks(chunk[:full], offset)
+        self._pending += chunk[full:]
+
+    def _add_blocks(self, data, offset):
+        for i, counts in enumerate(block_histograms(data, self.block_size)):
+            self._add_counts(counts)
+            entropy = shannon_entropy(counts)
+            self.max_block_entropy = max(self.max_block_entropy, entropy)
+            if entropy > self.threshold:
+                self._add_region(offset + i * self.block_size)
+
+    def _add_counts(self, counts):
+        if numpy is not None:
+            self.counts += counts
+        else:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+
+    def _add_region(self, start):
+        end = start + self.block_size
+        if self.regions and self.regions[-1][1] == start:
+            self.regions[-1] = (self.regions[-1][0], end)
+        elif len(self.regions) < MAX_REGIONS:
+            self.regions.append((start, end))
+
+    def result(self):
+        """Энтропия всего файла, максимум по блокам и участки выше порога"""
+        if self._pending:
+            self._add_counts(byte_histogram(self._pending))
+            self._pending = bytearray()
+        return {
+            'total': shannon_entropy(self.counts),
+            'max_block': self.max_block_entropy,
+            'regions': list(self.regions),
+        }
@@ -0,0 +1,166 @@
+import struct
+
+# Привязки образцов: от начала файла, от PE-заголовка (по e_lfanew), имя любой секции PE
+START = 'start'
+PE = 'pe'
+SECTION = 'section'
+ANCHORS = (START, PE, SECTION)
+
+TYPE = 'type'
+PACKER = 'packer'
+KINDS = (TYPE, PACKER)
+
+# Сколько секций PE просматривается (таблица секций должна поместиться в заголовок)
+MAX_SECTIONS = 96
+
+# Встроенная таблица типов; база сигнатур дополняет ее разделом heuristic_rules['magic']
+DEFAULT_MAGIC = [
+    {'name': 'mz', 'kind': TYPE, 'hex': '4d5a'},
+    {'name': 'pe', 'kind': TYPE, 'anchor': PE, 'hex': '50450000'},
+    {'name': 'elf', 'kind': TYPE, 'hex': '7f454c46'},
+    {'name': 'macho', 'kind': TYPE, 'hex': 'cffaedfe'},
+    {'name': 'macho', 'kind': TYPE, 'hex': 'cefaedfe'},
+    {'name': 'macho', 'kind': TYPE, 'hex': 'cafebabe'},
+    {'name': 'zip', 'kind': TYPE, 'hex': '504b0304'},
+    {'name': 'zip', 'kind': TYPE, 'hex': '504b0506'},
+    {'name': 'ole', 'kind': TYPE, 'hex': 'd0cf11e0a1b11ae1'},
+    {'name': 'pdf', 'kind': TYPE, 'text': '%PDF'},
+    {'name': 'gzip', 'kind': TYPE, 'hex': '1f8b'},
+    {'name': 'script', 'kind': TYPE, 'text': '#!'},
+]
+
+_WILDCARD = -1
+# Ключ узла префиксного дерева, под которым хранятся записи, заканчивающиеся в этом узле
+_END = None
+
+_PE_HEADER = struct.Struct('<4sHHIIIHH')
+
+
+class MagicError(ValueError):
+    """Ошибка в описании образца"""
+
+
+def _pattern(entry):
+    if 'text' in entry:
+        if not isinstance(entry['text'], str) or not entry['text']:
+            raise MagicError(f"{entry.get('name')}: образец должен быть непустой строкой: {entry['text']!r}")
+        try:
+            return list(entry['text'].encode('latin-1'))
+        except UnicodeEncodeError:
+            raise MagicError(f"{entry.get('name')}: текстовый образец должен состоять из символов latin-1: "
+                             f"{entry['text']!r}") from None
+    if not isinstance(entry.get('hex', ''), str):
+        raise MagicError(f"{entry.get('name')}: неверный образец {entry.get('hex')!r}")
+    tokens = entry.get('hex', '').replace(' ', '')
+    if not tokens or len(tokens) % 2:
+        raise MagicError(f"{entry.get('name')}: неверный образец {entry.get('hex')!r}")
+    pattern = []
+    for i in range(0, len(tokens), 2):
+        token = tokens[i:i + 2]
+        try:
+            pattern.append(_WILDCARD if token == '??' else int(token, 16))
+        except ValueError:
+            raise MagicError(f"{entry.get('name')}: неверный байт {token!r}") from None
+    return pattern
+
+
+def pe_layout(header):
+    """Смещение PE-заголовка и смещения имен секций в заголовке файла; (None, []) для не-PE"""
+    if header[:2] != b'MZ' or len(header) < 64:
+        return None, []
+    pe_offset = int.from_bytes(header[60:64], 'little')
+    if pe_offset + _PE_HEADER.size > len(header):
+        return None, []
+    signature, _, sections, _, _, _, optional_size, _ = _PE_HEADER.unpack_from(header, pe_offset)
+    if signature != b'PE\0\0':
+        return None, []
+    table = pe_offset + _PE_HEADER.size + optional_size
+    names = [table + 40 * i for i in range(min(sections, MAX_SECTIONS)) if table + 40 * i + 8 <= len(header)]
+    return pe_offset, names
+
+
+class MagicIndex:
+    """Определение типа файла и упаковщика по заголовку.
+    Образцы сгруппированы по (привязка, смещение), в каждой группе - префиксное дерево байтов:
+    поиск проходит по дереву один раз на группу, его стоимость не растет с числом образцов"""
+
+    def __init__(self, entries=()):
+        self._buckets = {}
+        self.types = set()
+        self.packers = set()
+        for order, entry in enumerate(entries):
+            self.add(entry, order)
+
+    def add(self, entry, order=0):
+        if not isinstance(entry, dict):
+            raise MagicError(f"образец должен быть объектом: {entry!r}")
+        name = entry.get('name')
+        kind = entry.get('kind', TYPE)
+        anchor = entry.get('anchor', SECTION if 'section' in entry else START)
+        if not isinstance(name, str) or not name or kind not in KINDS or anchor not in ANCHORS:
+            raise MagicError(f"неверный образец: {entry!r}")
+        offset = entry.get('offset', 0)
+        if not isinstance(offset, int) or isinstance(offset, bool):
+            raise MagicError(f"{name}: смещение должно быть целым числом: {offset!r}")
+        if 'section' in entry:
+            entry = dict(entry, text=entry['section'])
+        pattern = _pattern(entry)
+        node = self._buckets.setdefault((anchor, offset), {})
+        for byte in pattern:
+            node = node.setdefault(byte, {})
+        # Более длинный образец точнее; при равной длине побеждает описанный раньше
+        node.setdefault(_END, []).append((len(pattern), -order, kind, name))
+        (self.types if kind == TYPE else self.packers).add(name)
+
+    def _match(self, node, data, start, found):
+        stack = [(node, start)]
+        while stack:
+            node, position = stack.pop()
+            found.extend(node.get(_END, ()))
+            if position >= len(data):
+                continue
+            child = node.get(data[position])
+            if child is not None:
+                stack.append((child, position + 1))
+            child = node.get(_WILDCARD)
+            if child is not None:
+                stack.append((child, position + 1))
+
+    def classify(self, header):
+        """{'type': имя или None, 'packers': [имена]} по байтам заголовка"""
+        found = []
+        pe_offset = None
+        sections = []
+        if any(anchor != START for anchor, _ in self._buckets):
+            pe_offset, sections = pe_layout(header)
+        for (anchor, offset), node in self._buckets.items():
+            if anchor == START:
+                starts = (offset,)
+            elif anchor == PE:
+                starts = (pe_offset + offset,) if pe_offset is not None else ()
+            else:
+                starts = [position + offset for position in sections]
+            for start in starts:
+                if 0 <= start < len(header):
+                    self._match(node, header, start, found)
+        types = [match for match in found if match[2] == TYPE]
+        return {
+            'type': max(types)[3] if types else None,
+            'packers': sorted({match[3] for match in found if match[2] == PACKER}),
+        }
+
+
+def build_index(heuristic_rules):
+    """Индекс из встроенной таблицы, раздела 'magic' и прежнего словаря 'packers' {строка: имя}"""
+    magic = heuristic_rules.get('magic', [])
+    packers = heuristic_rules.get('packers', {})
+    if not isinstance(magic, list):
+        raise MagicError(f"magic: ожидается список образцов: {magic!r}")
+    if not isinstance(packers, dict):
+        raise MagicError(f"packers: ожидается объект {{строка: имя}}: {packers!r}")
+    entries = list(DEFAULT_MAGIC) + magic
+    entries += [{'name': name, 'kind': PACKER, 'text': text} for text, name in packers.items()]
+    return MagicIndex(entries)
+
+
+DEFAULT_INDEX = MagicIndex(DEFAULT_MAGIC)
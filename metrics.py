@@ -0,0 +1,176 @@
+import time
+import heapq
+import threading
+
+# Границы корзин гистограмм задержки, секунды (как у клиентов Prometheus)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сколько самых долгих файлов хранится
+SLOWEST_FILES = 10
+METRICS_PREFIX = 'drweb'
+
+# Этапы, кроме анализаторов: обход каталогов, проверка файла целиком, очистка, запись в карантин
+WALK = 'walk'
+FILE = 'file'
+CLEAN = 'clean'
+QUARANTINE = 'quarantine'
+
+
+def _histogram():
+    return {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0, 'bytes': 0}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ScanMetrics:
+    """Метрики сканирования: гистограммы задержки и объем данных по проверкам и этапам,
+    ошибки по типам исключений и самые долгие файлы.
+    Собираются в каждом процессе отдельно и объединяются через merge"""
+
+    def __init__(self, slowest=SLOWEST_FILES):
+        self.slowest = slowest
+        self.checks = {}
+        self.errors = {}
+        # Куча (секунды, путь): в ней остаются slowest самых долгих
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def observe(self, check, seconds, size=0):
+        """Учет одного измерения этапа или анализатора"""
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        with self._lock:
+            histogram = self.checks.get(check)
+            if histogram is None:
+                histogram = self.checks[check] = _histogram()
+            histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            histogram['bytes'] += size
+
+    def error(self, error):
+        """Учет ошибки по типу исключения (или по строке, если передан не объект исключения)"""
+        name = type(error).__name__ if isinstance(error, BaseException) else str(error)
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def file(self, path, seconds, size=0):
+        """Учет проверки файла целиком"""
+        self.observe(FILE, seconds, size)
+        with self._lock:
+            self._push(seconds, path)
+
+    def _push(self, seconds, path):
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, (seconds, path))
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, path))
+
+    def timed(self, analyzers):
+        """Анализаторы, обернутые для замера времени и объема данных"""
+        return [TimedAnalyzer(analyzer, self) for analyzer in analyzers]
+
+    def merge(self, data):
+        """Добавление метрик другого процесса (словарь to_dict)"""
+        with self._lock:
+            for check, other in data['checks'].items():
+                histogram = self.checks.get(check)
+                if histogram is None:
+                    histogram = self.checks[check] = _histogram()
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+                histogram['sum'] += other['sum']
+                histogram['count'] += other['count']
+                histogram['bytes'] += other['bytes']
+            for name, count in data['errors'].items():
+                self.errors[name] = self.errors.get(name, 0) + count
+            for entry in data['slowest']:
+                self._push(entry['seconds'], entry['path'])
+
+    def reset(self):
+        with self._lock:
+            self.checks = {}
+            self.errors = {}
+            self._slowest = []
+
+    def take(self):
+        """Снимок метрик со сбросом (для передачи из процесса-обработчика)"""
+        data = self.to_dict()
+        self.reset()
+        return data
+
+    def to_dict(self):
+        """Метрики для JSON; корзины гистограмм не накопительные, последняя - больше всех границ"""
+        with self._lock:
+            checks = {check: dict(histogram, buckets=list(histogram['buckets']))
+                      for check, histogram in self.checks.items()}
+            errors = dict(self.errors)
+            slowest = sorted(self._slowest, reverse=True)
+        return {
+            'buckets': list(LATENCY_BUCKETS),
+            'checks': checks,
+            'errors': errors,
+            'slowest': [{'path': path, 'seconds': seconds} for seconds, path in slowest]
+        }
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Метрики в текстовом формате Prometheus"""
+        data = self.to_dict()
+        lines = [f"# HELP {prefix}_check_seconds Время проверок и этапов сканирования",
+                 f"# TYPE {prefix}_check_seconds histogram"]
+        for check, histogram in sorted(data['checks'].items()):
+            label = f'check="{_escape(check)}"'
+            total = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['buckets']):
+                total += count
+                lines.append(f'{prefix}_check_seconds_bucket{{{label},le="{bound}"}} {total}')
+            lines.append(f"{prefix}_check_seconds_sum{{{label}}} {histogram['sum']}")
+            lines.append(f"{prefix}_check_seconds_count{{{label}}} {histogram['count']}")
+
+        lines += [f"# HELP {prefix}_check_bytes_total Обработано байтов",
+                  f"# TYPE {prefix}_check_bytes_total counter"]
+        for check, histogram in sorted(data['checks'].items()):
+            lines.append(f'{prefix}_check_bytes_total{{check="{_escape(check)}"}} {histogram["bytes"]}')
+
+        lines += [f"# HELP {prefix}_errors_total Ошибки по типам исключений",
+                  f"# TYPE {prefix}_errors_total counter"]
+        for name, count in sorted(data['errors'].items()):
+            lines.append(f'{prefix}_errors_total{{type="{_escape(name)}"}} {count}')
+
+        lines += [f"# HELP {prefix}_slowest_file_seconds Самые долгие файлы",
+                  f"# TYPE {prefix}_slowest_file_seconds gauge"]
+        for entry in data['slowest']:
+            lines.append(f'{prefix}_slowest_file_seconds{{path="{_escape(entry["path"])}"}} {entry["seconds"]}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedAnalyzer:
+    """Обертка анализатора: время и объем данных за файл учитываются одним измерением в result"""
+
+    def __init__(self, analyzer, metrics):
+        self.analyzer = analyzer
+        self.name = analyzer.name
+        self.metrics = metrics
+        self._seconds = 0.0
+        self._bytes = 0
+
+    def start(self, size):
+        started = time.perf_counter()
+        self.analyzer.start(size)
+        self._seconds += time.perf_counter() - started
+
+    def feed(self, chunk, offset):
+        started = time.perf_counter()
+        self.analyzer.feed(chunk, offset)
+        self._seconds += time.perf_counter() - started
+        self._bytes += len(chunk)
+
+    def ranges(self):
+        return self.analyzer.ranges() if hasattr(self.analyzer, 'ranges') else None
+
+    def result(self):
+        started = time.perf_counter()
+        result = self.analyzer.result()
+        self.metrics.observe(self.name, self._seconds + time.perf_counter() - started, self._bytes)
+        return result
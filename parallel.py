@@ -0,0 +1,128 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+from results import error_result
+
+# Количество файлов в одном задании для процесса-обработчика
+DEFAULT_CHUNKSIZE = 16
+
+# Настройки движка, которые передаются процессам-обработчикам
+WORKER_SETTINGS = ('chunk_size', 'scan_archives', 'size_policies', 'mmap_threshold')
+
+# Экземпляр движка в процессе-обработчике (создается один раз при запуске)
+_engine = None
+
+
+def _init_worker(engine_class, settings, metrics=False):
+    """Инициализация процесса-обработчика: база сигнатур загружается один раз"""
+    global _engine
+    _engine = engine_class()
+    for name, value in settings.items():
+        setattr(_engine, name, value)
+    if metrics:
+        _engine.enable_metrics()
+
+
+def _scan_batch(paths):
+    """Результаты задания и метрики, накопленные обработчиком с прошлого задания (или None)"""
+    results = [result for path in paths for result in _engine.scan_entries(path)]
+    return results, _engine.metrics.take() if _engine.metrics is not None else None
+
+
+class ParallelScanner:
+    """Параллельное сканирование файлов пулом процессов"""
+
+    def __init__(self, engine, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = max(1, chunksize or DEFAULT_CHUNKSIZE)
+        # spawn: процессы не наследуют потоки и состояние Tk родителя
+        self._context = multiprocessing.get_context('spawn')
+
+    def _create_pool(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(type(self.engine), {name: getattr(self.engine, name) for name in WORKER_SETTINGS},
+                      self.engine.metrics is not None)
+        )
+
+    def _collect(self, batch_result):
+        """Результаты задания; метрики обработчика добавляются к метрикам движка"""
+        results, metrics = batch_result
+        if metrics is not None and self.engine.metrics is not None:
+            self.engine.metrics.merge(metrics)
+        return results
+
+    def _failed(self, path, error, message=None):
+        if self.engine.metrics is not None:
+            self.engine.metrics.error(error)
+        return error_result(path, message or repr(error))
+
+    def scan(self, paths):
+        """Генератор результатов в порядке завершения проверки"""
+        paths = iter(paths)
+        batches = iter(lambda: list(islice(paths, self.chunksize)), [])
+        pool = self._create_pool(self.workers)
+        pending = {}
+        try:
+            while True:
+                # Ограничиваем число заданий в очереди, обход каталога идет по мере обработки
+                while len(pending) < self.workers * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    pending[pool.submit(_scan_batch, batch)] = batch
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                suspects = []
+                broken = False
+                for future in done:
+                    batch = pending.pop(future)
+                    try:
+                        results = self._collect(future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                        suspects.append(batch)
+                    except BaseException:
+                        # Исключение из обработчика (в том числе SystemExit) не должно прерывать сканирование
+                        suspects.append(batch)
+                    else:
+                        yield from results
+
+                if suspects:
+                    if broken:
+                        # Пул неработоспособен: все незавершенные задания проверяем повторно
+                        for future, batch in pending.items():
+                            if future.done() and not future.exception():
+                                yield from self._collect(future.result())
+                            else:
+                                suspects.append(batch)
+                        pending.clear()
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = self._create_pool(self.workers)
+                    yield from self._isolate([path for batch in suspects for path in batch])
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _isolate(self, paths):
+        """Повторная проверка по одному файлу, чтобы найти файл, на котором падает обработчик"""
+        pool = self._create_pool(1)
+        try:
+            for path in paths:
+                try:
+                    yield from self._collect(pool.submit(_scan_batch, [path]).result())
+                except BrokenProcessPool as e:
+                    yield self._failed(path, e, 'аварийное завершение процесса-обработчика')
+                    pool.shutdown(wait=False)
+                    pool = self._create_pool(1)
+                except BaseException as e:
+                    yield self._failed(path, e)
+        finally:
+            pool.shutdown(wait=False)
@@ -0,0 +1,51 @@
+from entropy import BLOCK_SIZE
+
+# Политики анализа больших файлов
+FULL = 'full'
+SAMPLED = 'sampled'
+HEAD_TAIL = 'head_tail'
+HASH_ONLY = 'hash_only'
+
+# Какие участки файла получают поиск строк и подсчет энтропии; хеши для базы сигнатур считаются всегда
+POLICIES = {
+    FULL: {'strings': FULL, 'entropy': FULL},
+    SAMPLED: {'strings': HEAD_TAIL, 'entropy': SAMPLED},
+    HEAD_TAIL: {'strings': HEAD_TAIL, 'entropy': HEAD_TAIL},
+    HASH_ONLY: {'strings': None, 'entropy': None},
+}
+# Политика по размеру: (наименьший размер файла, политика)
+SIZE_POLICIES = ((0, FULL), (4 * 1024 * 1024 * 1024, SAMPLED))
+# Объем начала и конца файла для HEAD_TAIL
+HEAD_TAIL_SIZE = 16 * 1024 * 1024
+# Число блоков энтропии (по BLOCK_SIZE), равномерно выбранных по файлу для SAMPLED
+SAMPLE_BLOCKS = 1024
+
+
+def policy_for_size(size, size_policies=SIZE_POLICIES):
+    """Политика для файла заданного размера"""
+    policy = FULL
+    for min_size, name in sorted(size_policies):
+        if size >= min_size:
+            policy = name
+    return policy
+
+
+def part_ranges(part, size):
+    """Участки файла [(начало, конец)] для значения политики; None - весь файл.
+    Границы выровнены по блокам энтропии"""
+    if part == FULL:
+        return None
+    if part is None:
+        return []
+    if part == HEAD_TAIL:
+        head = min(HEAD_TAIL_SIZE, size)
+        tail = max(size - HEAD_TAIL_SIZE, head)
+        tail -= tail % BLOCK_SIZE
+        if tail <= head:
+            return [(0, size)]
+        return [(0, head), (tail, size)]
+    if part == SAMPLED:
+        blocks = -(-size // BLOCK_SIZE)
+        step = max(blocks // SAMPLE_BLOCKS, 1)
+        return [(i * BLOCK_SIZE, min((i + 1) * BLOCK_SIZE, size)) for i in range(0, blocks, step)]
+    raise ValueError(f"неизвестная политика: {part}")
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from collections import deque
+
+from traversal import TreeWalker
+
+# Минимальный интервал между событиями прогресса, секунды
+DEFAULT_INTERVAL = 0.25
+# Число последних измерений, по которым считаются перцентили задержки
+LATENCY_WINDOW = 1000
+
+
+def file_size(file_path):
+    """Размер файла или 0, если он недоступен"""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+class ProgressTracker:
+    """Прогресс сканирования: общий объем считает параллельный обход, события выдаются не чаще интервала.
+    entries - обход с теми же параметрами, что у сканирования (пары (путь, stat), см. TreeWalker):
+    в итог входят только файлы, которые будут проверены"""
+
+    def __init__(self, directory_path, callback, interval=DEFAULT_INTERVAL, entries=None):
+        self.directory_path = directory_path
+        self.entries = entries if entries is not None else TreeWalker(directory_path)
+        self.callback = callback
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.total_files = 0
+        self.total_bytes = 0
+        # Пока обход не завершен, итоговые значения - оценка снизу
+        self.counted = False
+        # Файлы и байты, проверенные до возобновления: входят в прогресс, но не в скорость
+        self._resumed_files = 0
+        self._resumed_bytes = 0
+        self._stopped = False
+        self._started = time.monotonic()
+        self._last_event = 0.0
+        self._counter = threading.Thread(target=self._count, daemon=True)
+
+    def start(self):
+        self._counter.start()
+        return self
+
+    def resume_from(self, files, size):
+        """Продолжение прерванного сканирования: files файлов (size байт) уже проверены"""
+        self.files = self._resumed_files = files
+        self.bytes = self._resumed_bytes = size
+        return self
+
+    def stop(self):
+        self._stopped = True
+
+    def _count(self):
+        entries = iter(self.entries)
+        try:
+            for _, stat in entries:
+                if self._stopped:
+                    return
+                self.total_files += 1
+                if stat is not None:
+                    self.total_bytes += stat.st_size
+        finally:
+            # Обход останавливается вместе со сканированием
+            close = getattr(entries, 'close', None)
+            if close is not None:
+                close()
+        self.counted = True
+
+    def advance(self, size=0):
+        """Учет проверенного файла; событие отправляется, если прошел интервал"""
+        self.files += 1
+        self.bytes += size
+        now = time.monotonic()
+        if now - self._last_event >= self.interval:
+            self._last_event = now
+            self.callback(self.event(now))
+
+    def finish(self):
+        """Итоговое событие по завершении сканирования"""
+        self.stop()
+        self.total_files = max(self.total_files, self.files)
+        self.total_bytes = max(self.total_bytes, self.bytes)
+        self.counted = True
+        self.callback(self.event())
+
+    def event(self, now=None):
+        """Снимок прогресса: количество, скорость и оценка оставшегося времени"""
+        elapsed = max((now or time.monotonic()) - self._started, 1e-9)
+        total_files = max(self.total_files, self.files)
+        total_bytes = max(self.total_bytes, self.bytes)
+        files_per_sec = (self.files - self._resumed_files) / elapsed
+        bytes_per_sec = (self.bytes - self._resumed_bytes) / elapsed
+        eta = None
+        if self.counted:
+            if bytes_per_sec and total_bytes:
+                eta = (total_bytes - self.bytes) / bytes_per_sec
+            elif files_per_sec:
+                eta = (total_files - self.files) / files_per_sec
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'total_files': total_files,
+            'total_bytes': total_bytes,
+            'counted': self.counted,
+            'percent': self.files / total_files * 100 if total_files else 100.0,
+            'files_per_sec': files_per_sec,
+            'bytes_per_sec': bytes_per_sec,
+            'elapsed': elapsed,
+            'eta': eta
+        }
+
+
+class LatencyStats:
+    """Задержки (секунды): среднее, перцентили и максимум по последним измерениям"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.count = 0
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self.count += 1
+            self._values.append(value)
+
+    def snapshot(self):
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {'count': self.count, 'avg': None, 'p50': None, 'p99': None, 'max': None}
+        return {
+            'count': self.count,
+            'avg': sum(values) / len(values),
+            'p50': values[min(int(len(values) * 0.5), len(values) - 1)],
+            'p99': values[min(int(len(values) * 0.99), len(values) - 1)],
+            'max': values[-1]
+        }
@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from metrics import QUARANTINE
+
+DEFAULT_QUARANTINE_PATH = "quarantine"
+COMPRESS_LEVEL = 6
+# Если первый блок сжимается хуже этого отношения (упакованные и зашифрованные файлы), образец хранится без сжатия
+COMPRESS_RATIO = 0.9
+READ_SIZE = 1024 * 1024
+# Очередь записи: проверка ждет карантин, только если он отстал на столько файлов
+WRITE_QUEUE_SIZE = 64
+# Сколько записей индекса фиксировать одной транзакцией
+COMMIT_INTERVAL = 100
+# ioctl FICLONE (Linux): копия с общими блоками на btrfs, xfs и других файловых системах с reflink
+FICLONE = 0x40049409
+
+_STOP = object()
+
+
+def _digest(f):
+    """SHA-256 и размер содержимого открытого файла"""
+    file_hash = hashlib.sha256()
+    size = 0
+    while True:
+        block = f.read(READ_SIZE)
+        if not block:
+            break
+        file_hash.update(block)
+        size += len(block)
+    return file_hash.hexdigest(), size
+
+
+def _clone(src, dst):
+    """Копия через reflink; False, если файловая система его не поддерживает"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _write(src, dst, level):
+    """Запись образца со сжатием zlib, хеш считается по ходу копирования; (SHA-256, размер, сжат ли)"""
+    file_hash = hashlib.sha256()
+    block = src.read(READ_SIZE)
+    size = len(block)
+    file_hash.update(block)
+    compressor = zlib.compressobj(level)
+    data = compressor.compress(block)
+    compressed = not block or len(data) + len(compressor.flush(zlib.Z_SYNC_FLUSH)) <= len(block) * COMPRESS_RATIO
+    # Пробное сжатие первого блока только для решения; образец сжимается одним потоком с начала
+    compressor = zlib.compressobj(level) if compressed else None
+    while block:
+        dst.write(compressor.compress(block) if compressed else block)
+        block = src.read(READ_SIZE)
+        size += len(block)
+        file_hash.update(block)
+    if compressed:
+        dst.write(compressor.flush())
+    return file_hash.hexdigest(), size, compressed
+
+
+class Quarantine:
+    """Карантин: образцы хранятся по SHA-256 содержимого, одинаковые - один раз.
+    Образец копируется через reflink, если файловая система это умеет, иначе сжимается (zlib);
+    хеш считается по записанной копии, поэтому измененный во время помещения файл хранится
+    под хешем того содержимого, которое попало в карантин.
+    с hardlink=True несжатый образец становится жесткой ссылкой на файл - это допустимо, только если
+    зараженный файл потом удаляется или заменяется, а не изменяется на месте.
+    Индекс (sqlite) хранит для каждого помещения исходный путь, права, время и угрозы.
+    Каталог карантина, индекс и образцы доступны только владельцу.
+    submit помещает файл в фоновом потоке, записи индекса фиксируются пачками"""
+
+    def __init__(self, path=DEFAULT_QUARANTINE_PATH, level=COMPRESS_LEVEL, hardlink=False, metrics=None):
+        self.path = path
+        self.level = level
+        self.hardlink = hardlink
+        self.metrics = metrics
+        self._objects = os.path.join(path, 'objects')
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        os.makedirs(self._objects, mode=0o700, exist_ok=True)
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._queue = None
+        self._thread = None
+        index_path = os.path.join(path, 'index.db')
+        # sqlite создает файл с правами по umask; журнал WAL получает права файла индекса
+        os.close(os.open(index_path, os.O_WRONLY | os.O_CREAT, 0o600))
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                compressed INTEGER NOT NULL
+            )""")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash TEXT NOT NULL REFERENCES objects (hash),
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mode INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                threats TEXT NOT NULL,
+                created INTEGER NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash)")
+        self._db.commit()
+
+    def _object_path(self, digest, compressed):
+        return os.path.join(self._objects, digest[:2], digest + ('.z' if compressed else ''))
+
+    def _copy(self, file_path, temporary):
+        """Копия файла во временный образец; (SHA-256, размер, сжат ли)"""
+        if self.hardlink:
+            try:
+                os.link(file_path, temporary)
+            except OSError:
+                pass
+            else:
+                with open(temporary, 'rb') as f:
+                    return _digest(f) + (False,)
+        with open(file_path, 'rb') as src, \
+                open(os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600), 'w+b') as dst:
+            if _clone(src, dst):
+                return _digest(dst) + (False,)
+            return _write(src, dst, self.level)
+
+    def _store(self, file_path):
+        """Запись образца, если его еще нет; (SHA-256, размер, размер на диске, сжат ли)"""
+        temporary = os.path.join(self._objects, f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if os.path.lexists(temporary):
+                # Остался после аварийного завершения
+                os.remove(temporary)
+            digest, size, compressed = self._copy(file_path, temporary)
+            with self._lock:
+                row = self._db.execute("SELECT stored_size, compressed FROM objects WHERE hash = ?",
+                                       (digest,)).fetchone()
+            if row is not None:
+                return digest, size, row[0], bool(row[1])
+            os.makedirs(os.path.join(self._objects, digest[:2]), mode=0o700, exist_ok=True)
+            os.replace(temporary, self._object_path(digest, compressed))
+        finally:
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+        return digest, size, os.path.getsize(self._object_path(digest, compressed)), compressed
+
+    def add(self, file_path, threats=()):
+        """Помещение файла в карантин; номер записи"""
+        started = time.perf_counter()
+        stat = os.stat(file_path)
+        digest, size, stored_size, compressed = self._store(file_path)
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO objects VALUES (?, ?, ?, ?)",
+                             (digest, size, stored_size, int(compressed)))
+            cursor = self._db.execute(
+                "INSERT INTO entries (hash, path, size, mode, mtime_ns, threats, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, os.path.abspath(file_path), size, stat.st_mode & 0o7777, stat.st_mtime_ns,
+                 json.dumps(list(threats), ensure_ascii=False), int(time.time())))
+            self._changes += 1
+            if self._changes >= COMMIT_INTERVAL:
+                self._commit()
+        if self.metrics is not None:
+            self.metrics.observe(QUARANTINE, time.perf_counter() - started, size)
+        return cursor.lastrowid
+
+    def submit(self, file_path, threats=()):
+        """Помещение файла в карантин в фоновом потоке; Future с номером записи"""
+        if self._thread is None:
+            self._queue = queue.Queue(WRITE_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        future = Future()
+        self._queue.put((file_path, list(threats), future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                file_path, threats, future = item
+                try:
+                    future.set_result(self.add(file_path, threats))
+                except Exception as e:
+                    print(f"Ошибка при помещении в карантин: {e}", file=sys.stderr)
+                    if self.metrics is not None:
+                        self.metrics.error(e)
+                    future.set_exception(e)
+                # Очередь опустела - накопленные записи фиксируются, не дожидаясь полной пачки
+                if self._queue.empty():
+                    with self._lock:
+                        self._commit()
+            finally:
+                self._queue.task_done()
+
+    def _commit(self):
+        self._db.commit()
+        self._changes = 0
+
+    def flush(self):
+        """Ожидание записи всех отправленных файлов и фиксация индекса"""
+        if self._queue is not None:
+            self._queue.join()
+        with self._lock:
+            self._commit()
+
+    def entries(self):
+        """Записи карантина, от новых к старым"""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, hash, path, size, mode, mtime_ns, threats, created FROM entries "
+                "ORDER BY id DESC").fetchall()
+        return [{'id': row[0], 'hash': row[1], 'path': row[2], 'size': row[3], 'mode': row[4],
+                 'mtime_ns': row[5], 'threats': json.loads(row[6]), 'created': row[7]} for row in rows]
+
+    def restore(self, entry_id, destination=None):
+        """Восстановление файла по исходному пути или в destination; путь восстановленного файла"""
+        self.flush()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT entries.hash, path, mode, mtime_ns, compressed FROM entries "
+                "JOIN objects ON objects.hash = entries.hash WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"нет записи карантина {entry_id}")
+        digest, path, mode, mtime_ns, compressed = row
+        destination = destination or path
+        temporary = f"{destination}.{os.getpid()}.restore"
+        file_hash = hashlib.sha256()
+        try:
+            with open(self._object_path(digest, compressed), 'rb') as src, open(temporary, 'wb') as dst:
+                decompressor = zlib.decompressobj() if compressed else None
+                while True:
+                    block = src.read(READ_SIZE)
+                    if not block:
+                        break
+                    if decompressor is not None:
+                        block = decompressor.decompress(block)
+                    file_hash.update(block)
+                    dst.write(block)
+                if decompressor is not None:
+                    block = decompressor.flush()
+                    file_hash.update(block)
+                    dst.write(block)
+            if file_hash.hexdigest() != digest:
+                raise ValueError(f"образец {digest} поврежден")
+            os.chmod(temporary, mode)
+            os.utime(temporary, ns=(mtime_ns, mtime_ns))
+            os.replace(temporary, destination)
+        finally:
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+        return destination
+
+    def purge(self, entry_ids=None, older_than=None):
+        """Удаление записей (заданных или старше older_than секунд; без условий - всех) и образцов,
+        на которые больше нет записей; число удаленных записей"""
+        self.flush()
+        with self._lock:
+            if entry_ids is not None:
+                ids = list(entry_ids)
+                removed = self._db.executemany("DELETE FROM entries WHERE id = ?",
+                                               [(entry_id,) for entry_id in ids]).rowcount
+            elif older_than is not None:
+                removed = self._db.execute("DELETE FROM entries WHERE created < ?",
+                                           (int(time.time() - older_than),)).rowcount
+            else:
+                removed = self._db.execute("DELETE FROM entries").rowcount
+            orphans = self._db.execute(
+                "SELECT hash, compressed FROM objects WHERE hash NOT IN (SELECT hash FROM entries)").fetchall()
+            for digest, compressed in orphans:
+                try:
+                    os.remove(self._object_path(digest, compressed))
+                    os.rmdir(os.path.dirname(self._object_path(digest, compressed)))
+                except OSError:
+                    # Каталог не пуст или образец уже удален
+                    pass
+            self._db.executemany("DELETE FROM objects WHERE hash = ?", [(digest,) for digest, _ in orphans])
+            self._commit()
+        return removed
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._commit()
+            self._db.close()
@@ -0,0 +1,95 @@
+import sys
+
+# Коды угроз (интернированные строки, общие для всех результатов)
+SUSPICIOUS_EXTENSION = sys.intern('suspicious_extension')
+SIGNATURE = sys.intern('signature')
+SUSPICIOUS_STRINGS = sys.intern('suspicious_strings')
+HIGH_ENTROPY = sys.intern('high_entropy')
+ENTROPY_REGION = sys.intern('entropy_region')
+PACKED = sys.intern('packed')
+RULE = sys.intern('rule')
+ARCHIVE_LIMIT = sys.intern('archive_limit')
+SCAN_ERROR = sys.intern('scan_error')
+
+MESSAGES = {
+    SUSPICIOUS_EXTENSION: 'Подозрительное расширение',
+    SIGNATURE: 'Обнаружен {}',
+    SUSPICIOUS_STRINGS: 'Подозрительные строки в файле: {}',
+    HIGH_ENTROPY: 'Высокая энтропия (возможно упакован/зашифрован)',
+    ENTROPY_REGION: 'Участок с высокой энтропией (смещение {})',
+    PACKED: 'Обнаружен упакованный файл: {}',
+    RULE: 'Сработало правило: {}',
+    ARCHIVE_LIMIT: 'Архив превышает ограничения проверки: {}',
+    SCAN_ERROR: 'Ошибка сканирования: {}',
+}
+
+
+def threat_message(code, detail=None):
+    """Текст угрозы для отчета"""
+    template = MESSAGES.get(code, code)
+    return template.format(detail) if '{}' in template else template
+
+
+class ScanResult:
+    """Результат проверки файла; угрозы хранятся как пары (код, подробности).
+    can_clean - файл можно очистить, cleaned - файл действительно очищен.
+    Для файла внутри архива container - путь к архиву на диске"""
+    __slots__ = ('file_path', 'threats', 'can_clean', 'error', 'container', 'cleaned')
+
+    def __init__(self, file_path, threats=None, can_clean=False, error=None, container=None, cleaned=False):
+        self.file_path = file_path
+        self.threats = threats if threats is not None else []
+        self.can_clean = can_clean
+        self.error = error
+        self.container = container
+        self.cleaned = cleaned
+
+    @property
+    def is_infected(self):
+        return bool(self.threats)
+
+    def add(self, code, detail=None):
+        self.threats.append((sys.intern(code), detail))
+
+    def __getstate__(self):
+        return (self.file_path, self.threats, self.can_clean, self.error, self.container, self.cleaned)
+
+    def __setstate__(self, state):
+        # Коды угроз после передачи между процессами снова интернируются
+        self.file_path, threats, self.can_clean, self.error, self.container, self.cleaned = state
+        self.threats = [(sys.intern(code), detail) for code, detail in threats]
+
+    def messages(self):
+        """Тексты угроз для отчета"""
+        return [threat_message(code, detail) for code, detail in self.threats]
+
+    def to_dict(self):
+        """Представление для машиночитаемого вывода"""
+        return {
+            'file_path': self.file_path,
+            'is_infected': self.is_infected,
+            'threats': [{'code': code, 'detail': detail, 'message': threat_message(code, detail)}
+                        for code, detail in self.threats],
+            'can_clean': self.can_clean,
+            'cleaned': self.cleaned,
+            'error': self.error
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Восстановление результата из to_dict (например, полученного от службы сканирования)"""
+        result = cls(data['file_path'], can_clean=data.get('can_clean', False), error=data.get('error'),
+                     cleaned=data.get('cleaned', False))
+        for threat in data.get('threats', ()):
+            result.add(threat['code'], threat.get('detail'))
+        return result
+
+    def __repr__(self):
+        return f"ScanResult({self.file_path!r}, threats={self.threats!r}, can_clean={self.can_clean!r})"
+
+
+def error_result(file_path, error):
+    """Результат для файла, который не удалось проверить"""
+    result = ScanResult(file_path, error=str(error))
+    result.add(SCAN_ERROR, str(error))
+    return result
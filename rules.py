@@ -0,0 +1,306 @@
+import os
+import re
+
+from analyzers import HEADER_SIZE
+from magic import DEFAULT_INDEX
+
+# Стоимость условий: сначала проверяются данные без чтения файла, затем заголовок, затем результаты анализа
+COST_NAME = 0
+COST_HEADER = 1
+COST_CONTENT = 2
+
+DETECT = 'detect'
+SKIP = 'skip'
+ACTIONS = (DETECT, SKIP)
+
+
+class RuleError(ValueError):
+    """Ошибка в описании правила"""
+
+
+class RuleContext:
+    """Данные проверяемого файла для правил. Производные значения (тип, расширение, набор строк)
+    вычисляются один раз и общие для всех правил; без analysis доступны только имя и размер.
+    classification - результат MagicIndex.classify, если он уже получен"""
+
+    def __init__(self, name, size, analysis=None, classification=None):
+        self.name = name
+        self.size = size
+        self.analysis = analysis
+        self._cache = {}
+        if classification is not None:
+            self._cache['classification'] = classification
+
+    def get(self, key):
+        if key not in self._cache:
+            self._cache[key] = getattr(self, '_' + key)()
+        return self._cache[key]
+
+    def _extension(self):
+        return os.path.splitext(self.name)[1].lower()
+
+    def _header(self):
+        return self.analysis['header']
+
+    def _classification(self):
+        return DEFAULT_INDEX.classify(self.get('header'))
+
+    def _type(self):
+        return self.get('classification')['type']
+
+    def _packers(self):
+        return set(self.get('classification')['packers'])
+
+    def _strings(self):
+        # Автомат ищет без учета регистра, но возвращает строку в том виде, в каком она задана
+        # (строка из suspicious_strings может совпасть со строкой правила с точностью до регистра)
+        return {string.lower() for string in self.analysis['strings']}
+
+    def _entropy(self):
+        return self.analysis['entropy']
+
+
+# Условия компилируются в узлы (стоимость, функция). Функция возвращает True, False
+# или None, если данных для ответа еще нет (файл не прочитан)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _range(value, field):
+    if _is_number(value):
+        return value, None
+    if (not isinstance(value, list) or len(value) != 2
+            or not all(item is None or _is_number(item) for item in value)):
+        raise RuleError(f"{field}: ожидается число или [минимум, максимум]")
+    return value[0], value[1]
+
+
+def _names(value, field):
+    """Строка или непустой список строк -> список строк"""
+    items = [value] if isinstance(value, str) else value
+    if not isinstance(items, list) or not items or not all(isinstance(item, str) and item for item in items):
+        raise RuleError(f"{field}: ожидается строка или список строк")
+    return items
+
+
+def _in_range(number, low, high):
+    return (low is None or number >= low) and (high is None or number <= high)
+
+
+def _compile_size(value):
+    low, high = _range(value, 'size')
+    return COST_NAME, lambda context: _in_range(context.size, low, high)
+
+
+def _compile_extension(value):
+    extensions = {item.lower() for item in _names(value, 'extension')}
+    return COST_NAME, lambda context: context.get('extension') in extensions
+
+
+def _compile_type(value, known):
+    types = set(_names(value, 'type'))
+    unknown = types - known
+    if unknown:
+        raise RuleError(f"type: неизвестный тип {', '.join(sorted(unknown))}")
+    return COST_HEADER, lambda context: None if context.analysis is None else context.get('type') in types
+
+
+def _compile_packer(value):
+    packers = set(_names(value, 'packer'))
+    return COST_HEADER, lambda context: None if context.analysis is None else bool(context.get('packers') & packers)
+
+
+def _compile_bytes(value):
+    """{"bytes": {"hex": "4d 5a ?? 00", "offset": 0}} или {"bytes": "4d5a"};
+    без offset образец ищется во всем заголовке"""
+    if isinstance(value, str):
+        value = {'hex': value}
+    if not isinstance(value, dict) or not isinstance(value.get('hex'), str):
+        raise RuleError(f"bytes: ожидается строка hex или объект с полем hex: {value!r}")
+    tokens = value['hex'].replace(' ', '')
+    if not tokens or len(tokens) % 2:
+        raise RuleError(f"bytes: неверный образец {value.get('hex')!r}")
+    parts = []
+    for i in range(0, len(tokens), 2):
+        token = tokens[i:i + 2]
+        if token == '??':
+            parts.append(b'.')
+        else:
+            try:
+                parts.append(re.escape(bytes.fromhex(token)))
+            except ValueError:
+                raise RuleError(f"bytes: неверный байт {token!r}") from None
+    pattern = re.compile(b''.join(parts), re.DOTALL)
+    offset = value.get('offset')
+    if offset is not None and (not isinstance(offset, int) or isinstance(offset, bool)):
+        raise RuleError(f"bytes: смещение должно быть целым числом: {offset!r}")
+    if offset is not None and not 0 <= offset <= HEADER_SIZE - len(tokens) // 2:
+        raise RuleError(f"bytes: смещение {offset} за пределами заголовка ({HEADER_SIZE} байт)")
+
+    def match(context):
+        if context.analysis is None:
+            return None
+        header = context.get('header')
+        if offset is None:
+            return pattern.search(header) is not None
+        return pattern.match(header, offset) is not None
+    return COST_HEADER, match
+
+
+def _compile_entropy(value, field='total'):
+    low, high = _range(value, 'entropy')
+    return COST_CONTENT, lambda context: (None if context.analysis is None
+                                          else _in_range(context.get('entropy')[field], low, high))
+
+
+def _strings(value):
+    # Поиск строк не зависит от регистра: строки правил и найденные строки сравниваются в нижнем регистре
+    return [string.lower() for string in _names(value, 'strings')]
+
+
+def _compile_strings(value):
+    strings = _strings(value)
+    return COST_CONTENT, lambda context: (None if context.analysis is None
+                                          else any(string in context.get('strings') for string in strings))
+
+
+def _all(nodes):
+    def evaluate(context):
+        result = True
+        for _, node in nodes:
+            value = node(context)
+            if value is False:
+                return False
+            if value is None:
+                result = None
+        return result
+    return evaluate
+
+
+def _any(nodes):
+    def evaluate(context):
+        result = False
+        for _, node in nodes:
+            value = node(context)
+            if value:
+                return True
+            if value is None:
+                result = None
+        return result
+    return evaluate
+
+
+def _not(node):
+    def evaluate(context):
+        value = node(context)
+        return None if value is None else not value
+    return evaluate
+
+
+PREDICATES = {
+    'size': _compile_size,
+    'extension': _compile_extension,
+    'packer': _compile_packer,
+    'bytes': _compile_bytes,
+    'entropy': _compile_entropy,
+    'block_entropy': lambda value: _compile_entropy(value, 'max_block'),
+    'strings': _compile_strings,
+}
+
+
+def compile_condition(condition, strings, types=DEFAULT_INDEX.types):
+    """Узел (стоимость, функция) для условия; строки из условий "strings" добавляются в strings,
+    types - известные типы файлов"""
+    if not isinstance(condition, dict) or not condition:
+        raise RuleError(f"условие должно быть непустым объектом: {condition!r}")
+    nodes = []
+    for key, value in condition.items():
+        if key in ('all', 'any'):
+            if not isinstance(value, list) or not value:
+                raise RuleError(f"{key}: ожидается непустой список условий")
+            # Дешевые условия проверяются первыми: дорогие часто не понадобятся
+            children = sorted((compile_condition(child, strings, types) for child in value),
+                              key=lambda node: node[0])
+            cost = max(node[0] for node in children)
+            nodes.append((cost, _all(children) if key == 'all' else _any(children)))
+        elif key == 'not':
+            cost, node = compile_condition(value, strings, types)
+            nodes.append((cost, _not(node)))
+        elif key == 'type':
+            nodes.append(_compile_type(value, types))
+        elif key in PREDICATES:
+            if key == 'strings':
+                strings.update(_strings(value))
+            nodes.append(PREDICATES[key](value))
+        else:
+            raise RuleError(f"неизвестное условие: {key}")
+    # Несколько ключей в одном объекте - неявное "all"
+    if len(nodes) == 1:
+        return nodes[0]
+    nodes.sort(key=lambda node: node[0])
+    return max(node[0] for node in nodes), _all(nodes)
+
+
+class Rule:
+    def __init__(self, name, action, stop, cost, condition):
+        self.name = name
+        self.action = action
+        self.stop = stop
+        self.cost = cost
+        self.condition = condition
+
+
+class RulePlan:
+    """Скомпилированные правила из heuristic_rules['rules'].
+
+    Правило: {"name": ..., "when": условие, "action": "detect" | "skip", "stop": false}.
+    Условия: size, extension, type, packer, bytes (с offset), entropy, block_entropy, strings
+    и их сочетания all/any/not. Правила skip (исключения) проверяются первыми, остальные -
+    по возрастанию стоимости; проверка прекращается на сработавшем skip или правиле со stop.
+    Сработавший skip отменяет эвристические проверки файла, но не проверку сигнатур; если решение ясно
+    по имени и размеру, файл читается только для хешей сигнатур"""
+
+    def __init__(self, rules=(), types=DEFAULT_INDEX.types):
+        self.rules = []
+        # Строки из условий: их ищет тот же автомат, что и подозрительные строки
+        self.strings = set()
+        if not isinstance(rules, (list, tuple)):
+            raise RuleError("rules: ожидается список правил")
+        for index, rule in enumerate(rules):
+            if not isinstance(rule, dict):
+                raise RuleError(f"rule {index + 1}: правило должно быть объектом")
+            name = str(rule.get('name') or f"rule {index + 1}")
+            action = rule.get('action', DETECT)
+            if not isinstance(action, str) or action not in ACTIONS:
+                raise RuleError(f"{name}: неизвестное действие {action}")
+            if 'when' not in rule:
+                raise RuleError(f"{name}: нет условия when")
+            try:
+                cost, condition = compile_condition(rule['when'], self.strings, types)
+            except RuleError as e:
+                raise RuleError(f"{name}: {e}") from None
+            self.rules.append(Rule(name, action, bool(rule.get('stop')), cost, condition))
+        self.rules.sort(key=lambda rule: (rule.action != SKIP, rule.cost))
+        self.skip_rules = [rule for rule in self.rules if rule.action == SKIP]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def prefilter(self, name, size):
+        """Правило skip, которое срабатывает без чтения файла (по имени и размеру), или None"""
+        context = RuleContext(name, size)
+        for rule in self.skip_rules:
+            if rule.condition(context):
+                return rule
+        return None
+
+    def evaluate(self, context):
+        """Сработавшие правила по порядку плана"""
+        matched = []
+        for rule in self.rules:
+            if rule.condition(context):
+                matched.append(rule)
+                if rule.action == SKIP or rule.stop:
+                    break
+        return matched
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import sqlite3
+
+from results import ScanResult
+
+DEFAULT_CACHE_PATH = "scan_cache.db"
+# Предел числа записей, при превышении вытесняются давно не использованные
+DEFAULT_MAX_ENTRIES = 1000000
+# Сколько изменений накапливать перед фиксацией транзакции
+COMMIT_INTERVAL = 1000
+# Версия схемы: при изменении формата вердиктов старый кеш пересоздается
+SCHEMA_VERSION = 3
+
+
+def _extension(file_path):
+    return os.path.splitext(file_path)[1].lower()
+
+
+class ScanCache:
+    """Постоянный кеш вердиктов, ключ - (устройство, inode, размер, mtime_ns) и версия сигнатур.
+    Вердикт зависит и от имени: подозрительное расширение и правила по расширению (в том числе
+    исключения, отменяющие эвристики). Поэтому вердикт хранится отдельно для каждого расширения
+    файла: жесткие ссылки с разными расширениями не получают чужой вердикт"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, version='', max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._changes = 0
+        # Кеш используется из потока сканирования, доступ к нему последовательный
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS verdicts")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                is_infected INTEGER NOT NULL,
+                can_clean INTEGER NOT NULL,
+                threats TEXT NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino, extension)
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+        # Вердикты старых версий базы сигнатур больше не нужны
+        self._db.execute("DELETE FROM verdicts WHERE version != ?", (version,))
+        self._db.commit()
+
+    @staticmethod
+    def file_key(file_path, stat=None):
+        """Ключ файла по метаданным или None, если файл недоступен"""
+        try:
+            if stat is None:
+                stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, key, file_path):
+        """Вердикт из кеша в виде ScanResult или None"""
+        if key is None:
+            self.misses += 1
+            return None
+        extension = _extension(file_path)
+        row = self._db.execute(
+            "SELECT size, mtime_ns, version, is_infected, can_clean, threats FROM verdicts "
+            "WHERE dev = ? AND ino = ? AND extension = ?", (*key[:2], extension)).fetchone()
+        if row is None or tuple(row[:3]) != (key[2], key[3], self.version):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute("UPDATE verdicts SET last_used = ? WHERE dev = ? AND ino = ? AND extension = ?",
+                         (int(time.time()), *key[:2], extension))
+        self._changed()
+        result = ScanResult(file_path, can_clean=bool(row[4]))
+        for code, detail in json.loads(row[5]):
+            result.add(code, detail)
+        return result
+
+    def put(self, key, result):
+        """Сохранение вердикта; результаты с ошибкой чтения не кешируются"""
+        if key is None or result.error:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key[:2], _extension(result.file_path), *key[2:], self.version,
+             int(result.is_infected), int(result.can_clean),
+             json.dumps(result.threats, ensure_ascii=False), int(time.time())))
+        self._changed()
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= COMMIT_INTERVAL:
+            self.flush()
+
+    def evict(self):
+        """Вытеснение давно не использованных записей сверх предела"""
+        count = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM verdicts WHERE rowid IN "
+                "(SELECT rowid FROM verdicts ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+    def flush(self):
+        """Фиксация накопленных изменений"""
+        self.evict()
+        self._db.commit()
+        self._changes = 0
+
+    def clear(self):
+        """Очистка кеша"""
+        self._db.execute("DELETE FROM verdicts")
+        self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
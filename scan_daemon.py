@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from progress import LatencyStats
+
+SOCKET_NAME = "drweb-free.sock"
+# Личный каталог сокета во временном каталоге, если нет XDG_RUNTIME_DIR
+PRIVATE_DIR = f"drweb-free-{os.getuid()}" if hasattr(os, 'getuid') else "drweb-free"
+SOCKET_DIR = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(tempfile.gettempdir(), PRIVATE_DIR)
+DEFAULT_SOCKET_PATH = os.path.join(SOCKET_DIR, SOCKET_NAME)
+# Предельный размер одного запроса и число дескрипторов в одном сообщении
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+MAX_FDS = 256
+
+
+def _private_directory(path):
+    """Каталог сокета в общем временном каталоге: создается с правами 0700, чужой или открытый
+    другим пользователям каталог не используется (в нем можно подменить сокет)"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if os.path.islink(path) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"каталог {path} доступен другим пользователям")
+
+
+class ScanDaemon:
+    """Служба сканирования: база сигнатур и автоматы загружаются один раз,
+    запросы принимаются через Unix-сокет и выполняются пулом потоков.
+
+    Протокол - строки JSON в обе стороны:
+        {"id": 1, "cmd": "scan", "paths": [...]}    - файлы и директории
+        {"id": 2, "cmd": "scan", "names": [...]}    - файлы, переданные дескрипторами (SCM_RIGHTS)
+        {"id": 3, "cmd": "stats"} / "metrics" / "reload" / "ping"
+    Ответ содержит тот же id и results (ScanResult.to_dict), latency или error"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, workers=None, engine=None):
+        if engine is None:
+            from engine import DrWebFree
+            engine = DrWebFree()
+        # Файл, укороченный клиентом во время проверки, не должен завершать службу (SIGBUS при mmap)
+        if getattr(engine, 'mmap_threshold', None) is not None:
+            engine.mmap_threshold = None
+        self.engine = engine
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='scan')
+        self._lock = threading.Lock()
+        self._socket = None
+        self._stopped = threading.Event()
+        self.stats = {
+            'requests': 0,
+            'files': 0,
+            'infected_files': 0,
+            'errors': 0,
+            'queued': 0,
+            'active': 0
+        }
+        self.latency = LatencyStats()
+
+    def bind(self):
+        """Создание сокета; оставшийся от завершившейся службы файл сокета удаляется"""
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        if os.path.basename(directory) == PRIVATE_DIR:
+            _private_directory(directory)
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"служба уже запущена: {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Служба читает файлы от своего имени: доступ к сокету только у владельца.
+        # Права задаются маской при создании: между bind и chmod к сокету успели бы подключиться
+        umask = os.umask(0o177)
+        try:
+            self._socket.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        self._socket.listen(64)
+        return self
+
+    def serve_forever(self):
+        if self._socket is None:
+            self.bind()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn, _ = self._socket.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._socket is not None:
+            self._socket.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+
+        def respond(response):
+            data = (json.dumps(response, ensure_ascii=False) + "\n").encode()
+            with send_lock:
+                try:
+                    conn.sendall(data)
+                except OSError:
+                    pass
+
+        buffer = b''
+        fds = deque()
+        try:
+            while True:
+                data, received, _, _ = socket.recv_fds(conn, 65536, MAX_FDS)
+                fds.extend(received)
+                if not data:
+                    break
+                buffer += data
+                if len(buffer) > MAX_REQUEST_SIZE:
+                    respond({'error': "слишком большой запрос"})
+                    break
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    if line.strip():
+                        self._dispatch(line, fds, respond)
+        except OSError:
+            pass
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def _dispatch(self, line, fds, respond):
+        started = time.monotonic()
+        try:
+            request = json.loads(line)
+            cmd = request.get('cmd', 'scan')
+        except (ValueError, AttributeError) as e:
+            respond({'error': f"неверный запрос: {e}"})
+            return
+        request_id = request.get('id')
+        if cmd == 'ping':
+            respond({'id': request_id, 'ok': True})
+        elif cmd == 'stats':
+            respond({'id': request_id, 'stats': self.snapshot()})
+        elif cmd == 'metrics':
+            if self.engine.metrics is None:
+                respond({'id': request_id, 'error': "сбор метрик не включен (--metrics)"})
+            else:
+                respond({'id': request_id, 'metrics': self.engine.metrics.to_dict()})
+        elif cmd == 'reload':
+            self._pool.submit(self._reload, request_id, respond)
+        elif cmd == 'scan':
+            names = request.get('names', [])
+            if len(names) > len(fds):
+                respond({'id': request_id, 'error': "переданы не все дескрипторы файлов"})
+                return
+            items = [(path, None) for path in request.get('paths', [])]
+            items += [(name, fds.popleft()) for name in names]
+            self._scan(request_id, items, started, respond)
+        else:
+            respond({'id': request_id, 'error': f"неизвестная команда: {cmd}"})
+
+    def _reload(self, request_id, respond):
+        try:
+            self.engine.load_signatures()
+            respond({'id': request_id, 'ok': True, 'version': self.engine.signatures_version})
+        except Exception as e:
+            respond({'id': request_id, 'error': str(e)})
+
+    def _expand(self, items):
+        # Директории раскрываются в список файлов
+        for name, fd in items:
+            if fd is None and os.path.isdir(name):
+                for file_path in self.engine.iter_files(name):
+                    yield file_path, None
+            else:
+                yield name, fd
+
+    def _scan(self, request_id, items, started, respond):
+        """Файлы запроса распределяются по пулу, ответ отправляется после проверки последнего"""
+        items = list(self._expand(items))
+        results = [None] * len(items)
+        remaining = [len(items)]
+
+        def finish():
+            latency = time.monotonic() - started
+            flat = [entry for entries in results for entry in entries]
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['files'] += len(flat)
+                self.stats['infected_files'] += sum(1 for entry in flat if entry['is_infected'])
+                self.stats['errors'] += sum(1 for entry in flat if entry['error'])
+            self.latency.add(latency)
+            respond({'id': request_id, 'results': flat, 'latency': latency})
+
+        def task(index, name, fd):
+            with self._lock:
+                self.stats['queued'] -= 1
+                self.stats['active'] += 1
+            try:
+                results[index] = self._scan_item(name, fd)
+            finally:
+                with self._lock:
+                    self.stats['active'] -= 1
+                    remaining[0] -= 1
+                    last = not remaining[0]
+                if last:
+                    finish()
+
+        if not items:
+            finish()
+            return
+        with self._lock:
+            self.stats['queued'] += len(items)
+        for index, (name, fd) in enumerate(items):
+            self._pool.submit(task, index, name, fd)
+
+    def _scan_item(self, name, fd):
+        try:
+            if fd is None:
+                return [result.to_dict() for result in self.engine.scan_entries(name)]
+            # Файл читается по дескриптору, без повторного открытия; имя в отчете - переданное клиентом
+            return [result.to_dict() for result in self.engine.scan_entries(name, fd)]
+        except Exception as e:
+            from results import error_result
+            return [error_result(name, e).to_dict()]
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def snapshot(self):
+        """Счетчики службы, глубина очереди и задержка запросов (секунды)"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['workers'] = self.workers
+        stats['signatures_version'] = self.engine.signatures_version
+        stats['latency'] = self.latency.snapshot()
+        return stats
+
+
+class ScanClient:
+    """Клиент службы сканирования"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        try:
+            self._check_owner()
+        except OSError:
+            self._socket.close()
+            raise
+        self._reader = self._socket.makefile('rb')
+        self._next_id = 0
+
+    def _check_owner(self):
+        """Служба должна работать от имени этого пользователя или root: файлы и их содержимое
+        не отправляются процессу, который занял путь сокета"""
+        if not hasattr(os, 'getuid'):
+            return
+        if hasattr(socket, 'SO_PEERCRED'):
+            credentials = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            uid = struct.unpack('3i', credentials)[1]
+        else:
+            uid = os.stat(self.socket_path).st_uid
+        if uid not in (os.getuid(), 0):
+            raise PermissionError(f"служба {self.socket_path} запущена другим пользователем (uid {uid})")
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, cmd, fds=(), **fields):
+        self._next_id += 1
+        request = dict(fields, id=self._next_id, cmd=cmd)
+        data = (json.dumps(request, ensure_ascii=False) + "\n").encode()
+        if fds:
+            socket.send_fds(self._socket, [data], list(fds))
+        else:
+            self._socket.sendall(data)
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("служба сканирования закрыла соединение")
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def scan(self, paths):
+        """Проверка файлов и директорий по путям; список словарей ScanResult.to_dict"""
+        return self.request('scan', paths=list(paths))['results']
+
+    def scan_files(self, files):
+        """Проверка открытых файлов {имя: файл или дескриптор}: служба читает их без доступа к путям"""
+        names = list(files)
+        fds = [f if isinstance(f, int) else f.fileno() for f in files.values()]
+        return self.request('scan', fds=fds, names=names)['results']
+
+    def stats(self):
+        return self.request('stats')['stats']
+
+    def metrics(self):
+        """Метрики проверок службы (ScanMetrics.to_dict)"""
+        return self.request('metrics')['metrics']
+
+    def reload(self):
+        """Перечитать базу сигнатур без перезапуска службы"""
+        return self.request('reload')['version']
+
+    def ping(self):
+        return self.request('ping')['ok']
+
+
+def main(argv=None):
+    import argparse
+    import signal
+    parser = argparse.ArgumentParser(prog="python -m scan_daemon", description="Служба сканирования Dr.Web Free")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help="путь к Unix-сокету")
+    parser.add_argument('-j', '--workers', type=int, help="число потоков проверки (по умолчанию - число ядер)")
+    parser.add_argument('--metrics', action='store_true', help="собирать метрики проверок (команда metrics)")
+    args = parser.parse_args(argv)
+
+    daemon = ScanDaemon(args.socket, args.workers)
+    if args.metrics:
+        daemon.engine.enable_metrics()
+    try:
+        daemon.bind()
+    except (RuntimeError, OSError) as e:
+        print(f"Ошибка запуска службы: {e}", file=sys.stderr)
+        return 1
+    # SIGHUP - перечитать базу сигнатур, SIGTERM - завершение
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *_: daemon.engine.load_signatures())
+    signal.signal(signal.SIGTERM, lambda *_: daemon.shutdown())
+    print(f"Служба сканирования запущена: {args.socket}", file=sys.stderr)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        daemon.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
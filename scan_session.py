@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import datetime
+import threading
+
+from results import ScanResult
+
+DEFAULT_SESSION_DIR = "sessions"
+# Как часто фиксировать контрольную точку, секунды: после сбоя теряется не больше этого времени работы
+CHECKPOINT_INTERVAL = 5.0
+
+RUNNING = 'running'
+PAUSED = 'paused'
+CANCELLED = 'cancelled'
+FINISHED = 'finished'
+
+# Счетчики scan_stats, которые продолжаются после возобновления
+_COUNTERS = ('total_files', 'infected_files', 'cleaned_files', 'cache_hits', 'cache_misses',
+             'dedup_files', 'dedup_bytes')
+
+
+def session_path(directory_path, session_dir=DEFAULT_SESSION_DIR):
+    """Файл контрольных точек для директории"""
+    name = hashlib.sha1(os.path.abspath(directory_path).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(session_dir, f"{name}.db")
+
+
+def resumable(directory_path, path=None):
+    """Есть ли незавершенный сеанс для директории"""
+    path = path or session_path(directory_path)
+    if not os.path.exists(path):
+        return False
+    db = sqlite3.connect(path)
+    try:
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return False
+    finally:
+        db.close()
+    return meta.get('directory') == os.path.abspath(directory_path) and meta.get('state') not in (None, FINISHED)
+
+
+class ScanSession:
+    """Сеанс долгого сканирования с контрольными точками, паузой и отменой.
+
+    В файл (sqlite) записываются проверенные файлы, результаты с угрозами и ошибками и счетчики;
+    изменения фиксируются не чаще CHECKPOINT_INTERVAL. Незавершенный сеанс той же директории
+    возобновляется: проверенные файлы пропускаются, счетчики и результаты продолжаются.
+    pause, resume и cancel можно вызывать из любого потока: сканирование перестает брать новые
+    файлы, уже начатые проверки завершаются и попадают в контрольную точку"""
+
+    def __init__(self, directory_path, path=None, resume=True):
+        self.directory_path = os.path.abspath(directory_path)
+        self.path = path or session_path(directory_path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._started = time.monotonic()
+        self._last_checkpoint = self._started
+        # Результаты файлов архивов ждут результата самого архива: архив записывается целиком
+        self._members = {}
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS done (path TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (file_path TEXT NOT NULL, data TEXT NOT NULL)")
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self.resumed = (resume and meta.get('directory') == self.directory_path
+                        and meta.get('state') not in (None, FINISHED))
+        if self.resumed:
+            self.stats = json.loads(meta['stats'])
+        else:
+            self._db.execute("DELETE FROM done")
+            self._db.execute("DELETE FROM results")
+            self.stats = {'files': 0, 'bytes': 0, 'scan_time': 0.0}
+            self.stats.update((name, 0) for name in _COUNTERS)
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('directory', ?)", (self.directory_path,))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('created', ?)", (datetime.datetime.now().isoformat(),))
+        # Время прошлых запусков; время текущего прибавляется в контрольных точках
+        self._previous_time = self.stats['scan_time']
+        self.state = RUNNING
+        self.checkpoint()
+
+    def pause(self):
+        if not self._cancelled.is_set():
+            self._running.clear()
+            self.state = PAUSED
+
+    def resume(self):
+        if not self._cancelled.is_set():
+            self.state = RUNNING
+            self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.state = CANCELLED
+        # Приостановленное сканирование просыпается, чтобы завершиться
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait(self):
+        """Ожидание на паузе; False, если сканирование отменено"""
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    def is_done(self, file_path):
+        """Проверен ли файл в прошлых запусках сеанса"""
+        return self._db.execute("SELECT 1 FROM done WHERE path = ?", (file_path,)).fetchone() is not None
+
+    def record(self, result, scan_stats, size=0):
+        """Учет результата и счетчиков scan_stats; файл считается проверенным по результату без container"""
+        if result.container is not None:
+            if result.is_infected or result.error:
+                self._members.setdefault(result.container, []).append(result)
+            return
+        for item in self._members.pop(result.file_path, []) + [result]:
+            if item.is_infected or item.error:
+                data = dict(item.to_dict(), container=item.container)
+                self._db.execute("INSERT INTO results VALUES (?, ?)",
+                                 (item.file_path, json.dumps(data, ensure_ascii=False)))
+        self._db.execute("INSERT OR IGNORE INTO done VALUES (?)", (result.file_path,))
+        self.stats['files'] += 1
+        self.stats['bytes'] += size
+        # Контрольная точка - только между файлами, чтобы счетчики совпадали с записанными файлами
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint(scan_stats)
+
+    def results(self):
+        """Результаты с угрозами и ошибками, сохраненные в сеансе"""
+        for (data,) in self._db.execute("SELECT data FROM results ORDER BY rowid"):
+            data = json.loads(data)
+            result = ScanResult.from_dict(data)
+            result.container = data.get('container')
+            yield result
+
+    def counters(self):
+        """Начальные значения scan_stats: счетчики прошлых запусков"""
+        stats = {name: self.stats[name] for name in _COUNTERS}
+        stats['scan_time'] = datetime.timedelta(seconds=self._previous_time)
+        return stats
+
+    def checkpoint(self, scan_stats=None):
+        """Фиксация проверенных файлов, результатов и счетчиков"""
+        if scan_stats is not None:
+            self.stats.update((name, scan_stats[name]) for name in _COUNTERS if name in scan_stats)
+        self.stats['scan_time'] = self._previous_time + time.monotonic() - self._started
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('state', ?)", (self.state,))
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('stats', ?)", (json.dumps(self.stats),))
+        self._db.commit()
+        self._last_checkpoint = time.monotonic()
+
+    def finish(self, scan_stats=None):
+        """Последняя контрольная точка: отмененный сеанс можно возобновить, завершенный - нет"""
+        if not self.cancelled:
+            self.state = FINISHED
+        self.checkpoint(scan_stats)
+
+    def close(self):
+        self._db.close()
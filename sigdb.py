@@ -0,0 +1,389 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+
+SIGNATURES_PATH = "signatures.json"
+COMPILED_PATH = "signatures.db"
+# Каталог в кеше пользователя для базы, скомпилированной вне каталога программы
+CACHE_DIR = "drweb-free"
+
+MAGIC = b'DWSIGDB2'
+# Заголовок: сигнатура формата, смещение и длина описания разделов (JSON),
+# размер и mtime исходного JSON
+HEADER = struct.Struct('<8sQQQQ')
+DEFAULT_ALGORITHM = 'md5'
+# Бит фильтра Блума на запись и число хеш-функций (~1% ложных срабатываний)
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+# Число шагов интерполяционного поиска до перехода на двоичный
+INTERPOLATION_STEPS = 8
+# Поля записи, которые задают таблицу, а не описание угрозы
+TABLE_FIELDS = ('algorithm', 'prefix')
+
+DEFAULT_RULES = {
+    'suspicious_strings': [],
+    'suspicious_extensions': [],
+    'packers': {},
+    'magic': [],
+    'rules': []
+}
+
+
+def signatures_version(raw, data):
+    """Версия базы: номер из файла и хеш содержимого"""
+    return f"{data.get('version', '')}-{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _bloom_positions(digest, bits, hashes):
+    # Ключ уже является криптографическим хешем: двойное хеширование по его половинам
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _digest_size(algorithm):
+    try:
+        return hashlib.new(algorithm).digest_size
+    except (ValueError, TypeError):
+        return 0
+
+
+def compile_signatures(json_path=SIGNATURES_PATH, db_path=COMPILED_PATH):
+    """Компиляция JSON-базы в двоичный формат для загрузки через mmap"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        raw = f.read()
+        stat = os.fstat(f.fileno())
+    data = json.loads(raw)
+
+    # Таблица на каждую пару (алгоритм, длина префикса); 0 - хеш всего файла
+    groups = {}
+    for key, meta in data['signatures'].items():
+        algorithm = str(meta.get('algorithm', DEFAULT_ALGORITHM)).lower()
+        prefix = int(meta.get('prefix', 0))
+        try:
+            digest = bytes.fromhex(key)
+        except ValueError:
+            continue
+        if len(digest) < 16 or len(digest) != _digest_size(algorithm):
+            continue
+        record = {name: value for name, value in meta.items() if name not in TABLE_FIELDS}
+        groups.setdefault((algorithm, prefix), []).append(
+            (digest, json.dumps(record, ensure_ascii=False, sort_keys=True), record.get('size')))
+
+    sections = []
+    position = HEADER.size
+
+    def add(section):
+        nonlocal position
+        sections.append(section)
+        offset = position
+        position += len(section)
+        return offset
+
+    # Одинаковые описания хранятся один раз для всех таблиц
+    records = {}
+    tables = []
+    for (algorithm, prefix), entries in sorted(groups.items()):
+        entries.sort()
+        digest_size = len(entries[0][0])
+        digests = bytearray()
+        record_ids = []
+        sizes = set()
+        for digest, meta, size in entries:
+            if digests[-digest_size:] == digest:
+                continue
+            digests += digest
+            record_ids.append(records.setdefault(meta, len(records)))
+            sizes.add(size)
+        count = len(record_ids)
+
+        bloom_bits = max(count * BLOOM_BITS_PER_ENTRY, 64)
+        bloom = bytearray((bloom_bits + 7) // 8)
+        for i in range(count):
+            for bit in _bloom_positions(digests[i * digest_size:(i + 1) * digest_size], bloom_bits, BLOOM_HASHES):
+                bloom[bit >> 3] |= 1 << (bit & 7)
+
+        table = {
+            'algorithm': algorithm,
+            'prefix': prefix,
+            'digest_size': digest_size,
+            'count': count,
+            'digests': add(bytes(digests)),
+            'record_ids': add(struct.pack(f'<{count}I', *record_ids)),
+            'bloom': add(bytes(bloom)),
+            'bloom_bits': bloom_bits,
+            'bloom_hashes': BLOOM_HASHES,
+            'sizes': None,
+            'sizes_count': 0,
+        }
+        # Если размер указан у всех записей, файлы других размеров не нужно хешировать
+        if None not in sizes:
+            sizes = sorted(int(size) for size in sizes)
+            table['sizes'] = add(struct.pack(f'<{len(sizes)}Q', *sizes))
+            table['sizes_count'] = len(sizes)
+        tables.append(table)
+
+    blobs = [meta.encode() for meta in records]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    info = json.dumps({
+        'version': data.get('version', ''),
+        'last_updated': data.get('last_updated', ''),
+        'signatures_version': signatures_version(raw, data),
+        'heuristic_rules': data.get('heuristic_rules', DEFAULT_RULES),
+        'record_offsets': add(struct.pack(f'<{len(offsets)}Q', *offsets)),
+        'record_blobs': add(b''.join(blobs)),
+        'tables': tables,
+    }, ensure_ascii=False).encode()
+    info_offset = add(info)
+
+    header = HEADER.pack(MAGIC, info_offset, len(info), stat.st_size, stat.st_mtime_ns)
+    write_atomic(db_path, [header] + sections)
+    return db_path
+
+
+def write_atomic(path, sections):
+    """Запись во временный файл и атомарная замена: читатели не увидят частично записанный файл,
+    а уже открытые (в том числе через mmap) продолжают работать со старым"""
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.signatures-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for section in sections:
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class SignatureTable:
+    """Таблица хешей одного алгоритма: фильтр Блума и поиск по отсортированным хешам"""
+
+    def __init__(self, buffer, info):
+        self._map = buffer
+        self.algorithm = info['algorithm']
+        self.prefix = info['prefix']
+        self.digest_size = info['digest_size']
+        self.count = info['count']
+        self.bloom_bits = info['bloom_bits']
+        self.bloom_hashes = info['bloom_hashes']
+        self._digests = info['digests']
+        self._record_ids = info['record_ids']
+        self._bloom = info['bloom']
+        self._sizes = info['sizes']
+        self._sizes_count = info['sizes_count']
+
+    def __len__(self):
+        return self.count
+
+    def _digest(self, index):
+        start = self._digests + index * self.digest_size
+        return self._map[start:start + self.digest_size]
+
+    def _bloom_contains(self, digest):
+        for bit in _bloom_positions(digest, self.bloom_bits, self.bloom_hashes):
+            if not self._map[self._bloom + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def has_size(self, size):
+        """Есть ли в таблице сигнатуры файлов такого размера (без ограничения - всегда да)"""
+        if self._sizes is None:
+            return True
+        lo, hi = 0, self._sizes_count - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            current = struct.unpack_from('<Q', self._map, self._sizes + mid * 8)[0]
+            if current == size:
+                return True
+            if current < size:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return False
+
+    def find(self, digest):
+        """Индекс хеша в таблице или -1"""
+        if len(digest) != self.digest_size or not self.count or not self._bloom_contains(digest):
+            return -1
+        key = int.from_bytes(digest, 'big')
+        lo, hi = 0, self.count - 1
+        steps = 0
+        while lo <= hi:
+            if steps < INTERPOLATION_STEPS:
+                # Хеши распределены равномерно: интерполяция сходится за несколько шагов
+                lo_key = int.from_bytes(self._digest(lo), 'big')
+                hi_key = int.from_bytes(self._digest(hi), 'big')
+                if key < lo_key or key > hi_key:
+                    return -1
+                mid = lo if hi_key == lo_key else lo + (key - lo_key) * (hi - lo) // (hi_key - lo_key)
+                steps += 1
+            else:
+                mid = (lo + hi) // 2
+            current = self._digest(mid)
+            if current == digest:
+                return mid
+            if current < digest:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return -1
+
+    def record_id(self, index):
+        return struct.unpack_from('<I', self._map, self._record_ids + index * 4)[0]
+
+
+class SignatureDatabase:
+    """Скомпилированная база сигнатур, отображенная в память через mmap"""
+
+    def __init__(self, path=COMPILED_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            # Страницы отображения разделяются всеми процессами, открывшими файл
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, info_offset, info_length, self.source_size, self.source_mtime_ns = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: неизвестный формат базы сигнатур")
+        info = json.loads(self._map[info_offset:info_offset + info_length].decode())
+        self.version = info['version']
+        self.last_updated = info['last_updated']
+        self.signatures_version = info['signatures_version']
+        self.heuristic_rules = info['heuristic_rules']
+        self._record_offsets = info['record_offsets']
+        self._record_blobs = info['record_blobs']
+        self.tables = [SignatureTable(self._map, table) for table in info['tables']]
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables)
+
+    def _record(self, record_id):
+        start, end = struct.unpack_from('<QQ', self._map, self._record_offsets + record_id * 8)
+        return json.loads(self._map[self._record_blobs + start:self._record_blobs + end].decode())
+
+    def match(self, hashes, size):
+        """Поиск угрозы по хешам файла {(алгоритм, префикс): hex} и его размеру"""
+        for table in self.tables:
+            digest = hashes.get((table.algorithm, table.prefix))
+            if digest is None:
+                continue
+            index = table.find(bytes.fromhex(digest))
+            if index < 0:
+                continue
+            record = self._record(table.record_id(index))
+            if record.get('size') in (None, size):
+                return record
+        return None
+
+    def get(self, hexdigest, default=None):
+        """Описание угрозы по hex-хешу всего файла"""
+        try:
+            digest = bytes.fromhex(hexdigest)
+        except (TypeError, ValueError):
+            return default
+        for table in self.tables:
+            if not table.prefix and table.digest_size == len(digest):
+                index = table.find(digest)
+                if index >= 0:
+                    return self._record(table.record_id(index))
+        return default
+
+    def __contains__(self, hexdigest):
+        return self.get(hexdigest) is not None
+
+    def __getitem__(self, hexdigest):
+        record = self.get(hexdigest)
+        if record is None:
+            raise KeyError(hexdigest)
+        return record
+
+    def is_stale(self, json_path=SIGNATURES_PATH):
+        """Исходный JSON изменился после компиляции"""
+        try:
+            stat = os.stat(json_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) != (self.source_size, self.source_mtime_ns)
+
+    def close(self):
+        self._map.close()
+
+
+class EmptyDatabase:
+    """Пустая база сигнатур на случай, если загрузить базу не удалось"""
+    version = ''
+    signatures_version = ''
+    tables = []
+
+    def __init__(self):
+        self.heuristic_rules = {name: type(value)() for name, value in DEFAULT_RULES.items()}
+
+    def __len__(self):
+        return 0
+
+    def match(self, hashes, size):
+        return None
+
+    def get(self, hexdigest, default=None):
+        return default
+
+    def __contains__(self, hexdigest):
+        return False
+
+    def __getitem__(self, hexdigest):
+        raise KeyError(hexdigest)
+
+    def close(self):
+        pass
+
+
+def private_directory(path):
+    """Каталог с правами 0700; чужой или доступный другим каталог не используется"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        info = os.lstat(path)
+        if os.path.islink(path) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f"каталог {path} доступен другим пользователям")
+    return path
+
+
+def cache_directory():
+    """Личный каталог кеша пользователя для базы, если каталог программы недоступен для записи.
+    Каталог создается с правами 0700; чужой или доступный другим каталог не используется:
+    подмененная база отключила бы обнаружение"""
+    base = (os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return private_directory(os.path.join(base, CACHE_DIR))
+
+
+def open_database(json_path=SIGNATURES_PATH, db_path=COMPILED_PATH):
+    """Открытие скомпилированной базы; при изменении JSON база компилируется заново"""
+    if os.path.exists(db_path):
+        try:
+            database = SignatureDatabase(db_path)
+        except ValueError:
+            # База старого формата: перекомпилируем
+            database = None
+        if database is not None:
+            if not database.is_stale(json_path):
+                return database
+            database.close()
+    compile_signatures(json_path, db_path)
+    return SignatureDatabase(db_path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Компиляция базы сигнатур")
+    parser.add_argument('source', nargs='?', default=SIGNATURES_PATH)
+    parser.add_argument('output', nargs='?', default=COMPILED_PATH)
+    args = parser.parse_args()
+    compile_signatures(args.source, args.output)
+    print(f"База сигнатур скомпилирована: {args.output} ({len(SignatureDatabase(args.output))} записей)")
@@ -0,0 +1,130 @@
+import json
+
+from sigdb import SIGNATURES_PATH, COMPILED_PATH, compile_signatures, write_atomic
+
+# Каталог обновлений: index.json, полная база и разностные обновления
+DEFAULT_UPDATE_URL = "https://raw.githubusercontent.com/your_username/drweb-free/main/"
+INDEX_NAME = "index.json"
+FULL_NAME = "signatures.json"
+# ETag и Last-Modified последнего полученного индекса
+STATE_PATH = "signatures.state.json"
+TIMEOUT = 30
+
+
+class SignatureUpdateError(Exception):
+    """Ошибка загрузки или применения обновления сигнатур"""
+
+
+def apply_diff(data, diff):
+    """Применение разностного обновления {from, version, add, remove, heuristic_rules} к базе"""
+    if diff.get('from') != data.get('version'):
+        raise SignatureUpdateError(
+            f"обновление {diff.get('version')} предназначено для версии {diff.get('from')}, "
+            f"установлена {data.get('version')}")
+    signatures = data['signatures']
+    for key in diff.get('remove', ()):
+        signatures.pop(key, None)
+    signatures.update(diff.get('add', {}))
+    if 'heuristic_rules' in diff:
+        data['heuristic_rules'] = diff['heuristic_rules']
+    data['version'] = diff['version']
+    if 'last_updated' in diff:
+        data['last_updated'] = diff['last_updated']
+    return data
+
+
+def diff_chain(index, version):
+    """Цепочка разностных обновлений от version до версии индекса или None, если ее нет"""
+    diffs = {entry['from']: entry for entry in index.get('diffs', ())}
+    chain = []
+    while version != index['version']:
+        entry = diffs.get(version)
+        # Число шагов ограничено: цепочка в индексе не должна зацикливаться
+        if entry is None or len(chain) >= len(diffs):
+            return None
+        chain.append(entry)
+        version = entry['to']
+    return chain
+
+
+class SignatureUpdater:
+    """Инкрементальное обновление базы сигнатур.
+    Индекс запрашивается условно (If-None-Match/If-Modified-Since), затем применяется цепочка
+    разностных обновлений или, если ее нет, загружается полная база. Новая база записывается атомарно"""
+
+    def __init__(self, base_url=DEFAULT_UPDATE_URL, json_path=SIGNATURES_PATH,
+                 db_path=COMPILED_PATH, state_path=STATE_PATH, session=None):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.json_path = json_path
+        self.db_path = db_path
+        self.state_path = state_path
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        write_atomic(self.state_path, [json.dumps(state).encode()])
+
+    def fetch(self, name, headers=None):
+        """Загрузка файла каталога обновлений; None, если он не изменился (304)"""
+        response = self.session.get(self.base_url + name, headers=headers, timeout=TIMEOUT)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise SignatureUpdateError(f"{name}: HTTP {response.status_code}")
+        return response
+
+    def update(self):
+        """Загрузка и применение обновлений; True, если база сигнатур изменилась"""
+        with open(self.json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        version = data.get('version')
+
+        # Условный запрос имеет смысл, только если локальная база не менялась после прошлого обновления
+        state = self.load_state()
+        headers = {}
+        if state.get('version') == version:
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
+        response = self.fetch(INDEX_NAME, headers)
+        if response is None:
+            return False
+        index = response.json()
+
+        updated = index['version'] != version
+        if updated:
+            chain = diff_chain(index, version)
+            if chain is None:
+                data = self.fetch(index.get('full', FULL_NAME)).json()
+                if data.get('version') != index['version']:
+                    raise SignatureUpdateError(f"версия полной базы {data.get('version')} не совпадает с индексом")
+            else:
+                for entry in chain:
+                    data = apply_diff(data, self.fetch(entry['path']).json())
+            self.install(data)
+
+        self.save_state({
+            'version': index['version'],
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        })
+        return updated
+
+    def install(self, data):
+        """Атомарная замена signatures.json и компиляция новой базы"""
+        write_atomic(self.json_path, [json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')])
+        compile_signatures(self.json_path, self.db_path)
@@ -0,0 +1,97 @@
+import csv
+import json
+
+REPORT_TITLE = "=== ОТЧЕТ DR.WEB FREE ==="
+
+
+def report_summary(scan_stats):
+    """Строки отчета со статистикой сканирования"""
+    lines = [
+        f"Время сканирования: {scan_stats['scan_time']}",
+        f"Всего проверено файлов: {scan_stats['total_files']}",
+        f"Найдено зараженных файлов: {scan_stats['infected_files']}",
+        f"Очищено файлов: {scan_stats['cleaned_files']}",
+    ]
+    if scan_stats.get('cache_hits'):
+        lines.append(f"Взято из кеша: {scan_stats['cache_hits']}")
+    if scan_stats.get('dedup_files'):
+        saved = scan_stats['dedup_bytes'] / (1024 * 1024)
+        lines.append(f"Пропущено копий: {scan_stats['dedup_files']} (не проанализировано {saved:.1f} МБ)")
+    return lines
+
+
+def report_entry(result):
+    """Строки отчета по зараженному файлу"""
+    lines = [f"\nФайл: {result.file_path}"]
+    lines.extend(f"- {message}" for message in result.messages())
+    if result.cleaned:
+        lines.append("- Файл был очищен")
+    return lines
+
+
+class ResultSink:
+    """Приемник результатов: пишет каждый результат сразу, ничего не накапливая"""
+
+    def __init__(self, stream, infected_only=False):
+        self.stream = stream
+        self.infected_only = infected_only
+
+    def write(self, result):
+        if result.is_infected or not self.infected_only:
+            self.write_result(result)
+
+    def write_result(self, result):
+        raise NotImplementedError
+
+    def finish(self, scan_stats):
+        """Завершение вывода после сканирования"""
+        self.stream.flush()
+
+
+class JsonLinesSink(ResultSink):
+    """Результаты в формате JSON Lines, итоговая статистика - последней строкой"""
+
+    def write_result(self, result):
+        self.stream.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+
+    def finish(self, scan_stats):
+        stats = {name: str(value) if name == 'scan_time' else value for name, value in scan_stats.items()}
+        self.stream.write(json.dumps({'scan_stats': stats}, ensure_ascii=False) + "\n")
+        super().finish(scan_stats)
+
+
+class CsvSink(ResultSink):
+    """Результаты в CSV: одна строка на файл, коды угроз через ';'"""
+    FIELDS = ('file_path', 'is_infected', 'threat_codes', 'threats', 'can_clean', 'cleaned', 'error')
+
+    def __init__(self, stream, infected_only=False):
+        super().__init__(stream, infected_only)
+        self._writer = csv.writer(stream)
+        self._writer.writerow(self.FIELDS)
+
+    def write_result(self, result):
+        self._writer.writerow((
+            result.file_path,
+            int(result.is_infected),
+            ';'.join(code for code, _ in result.threats),
+            '; '.join(result.messages()),
+            int(result.can_clean),
+            int(result.cleaned),
+            result.error or ''
+        ))
+
+
+class TextReportSink(ResultSink):
+    """Текстовый отчет: зараженные файлы по мере обнаружения, статистика в конце"""
+
+    def __init__(self, stream, infected_only=True):
+        super().__init__(stream, infected_only)
+        self.stream.write(REPORT_TITLE + "\n")
+        self.stream.write("\nЗараженные файлы:\n")
+
+    def write_result(self, result):
+        self.stream.write("\n".join(report_entry(result)) + "\n")
+
+    def finish(self, scan_stats):
+        self.stream.write("\n" + "\n".join(report_summary(scan_stats)) + "\n")
+        super().finish(scan_stats)
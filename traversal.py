@@ -0,0 +1,145 @@
+import os
+import stat
+import time
+import queue
+import threading
+from collections import deque
+
+from metrics import WALK
+
+# Порядок файлов внутри каталога: по номеру inode (ближе к порядку на диске) или как вернула ОС
+ORDER_INODE = 'inode'
+ORDER_NONE = 'none'
+ORDERS = (ORDER_INODE, ORDER_NONE)
+# Очередь найденных файлов (пачками по каталогу): обход идет впереди проверки, но не дальше этого числа пачек
+WALK_QUEUE_SIZE = 256
+WALK_BATCH_SIZE = 1024
+# Сколько следующих файлов ядро начинает читать заранее (POSIX_FADV_WILLNEED) и сколько байтов каждого
+READAHEAD_FILES = 8
+READAHEAD_BYTES = 4 * 1024 * 1024
+
+_DONE = object()
+
+
+class TreeWalker:
+    """Обход дерева каталогов через os.scandir в отдельном потоке.
+    Выдает пары (путь, stat) только для обычных файлов; stat - None для битой ссылки.
+    Ссылки на каталоги не обходятся (как у os.walk), другие файловые системы - только с cross_filesystems;
+    с recursive=False выдаются только файлы самого каталога"""
+
+    def __init__(self, root, order=ORDER_INODE, cross_filesystems=False, metrics=None,
+                 queue_size=WALK_QUEUE_SIZE, recursive=True):
+        self.root = root
+        self.order = order
+        self.cross_filesystems = cross_filesystems
+        self.recursive = recursive
+        self.metrics = metrics
+        self._queue = queue.Queue(queue_size)
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is _DONE:
+                    return
+                yield from batch
+        finally:
+            # Проверку прервали: поток обхода завершается, не дожидаясь места в очереди
+            self._stopped.set()
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            self._walk()
+        finally:
+            self._put(_DONE)
+
+    def _walk(self):
+        try:
+            device = os.stat(self.root).st_dev
+        except OSError:
+            return
+        stack = [self.root]
+        while stack and not self._stopped.is_set():
+            directory = stack.pop()
+            started = time.perf_counter()
+            files, directories = self._scan(directory, device)
+            if self.metrics is not None:
+                self.metrics.observe(WALK, time.perf_counter() - started)
+            for start in range(0, len(files), WALK_BATCH_SIZE):
+                if not self._put(files[start:start + WALK_BATCH_SIZE]):
+                    return
+            # Первым из стека берется подкаталог с меньшим inode
+            if self.recursive:
+                stack.extend(reversed(directories))
+
+    def _scan(self, directory, device):
+        files = []
+        directories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if entry.is_symlink():
+                                continue
+                            if not self.cross_filesystems and entry.stat(follow_symlinks=False).st_dev != device:
+                                continue
+                            directories.append((entry.inode(), entry.path))
+                            continue
+                        try:
+                            entry_stat = entry.stat()
+                        except FileNotFoundError:
+                            # Битая ссылка: выдается, чтобы ошибка попала в отчет
+                            files.append((entry.path, None))
+                            continue
+                        # Каналы и устройства не читаются: чтение из них может не завершиться
+                        if stat.S_ISREG(entry_stat.st_mode):
+                            files.append((entry.path, entry_stat))
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        if self.order == ORDER_INODE:
+            files.sort(key=lambda item: (item[1].st_dev, item[1].st_ino) if item[1] else (0, 0))
+            directories.sort()
+        return files, [path for _, path in directories]
+
+
+def _advise(path, entry_stat, size):
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, min(entry_stat.st_size, size), os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def readahead(entries, count=READAHEAD_FILES, size=READAHEAD_BYTES):
+    """Пары (путь, stat) с подсказкой ядру заранее читать следующие count файлов"""
+    if not count or not hasattr(os, 'posix_fadvise'):
+        yield from entries
+        return
+    window = deque()
+    for path, entry_stat in entries:
+        if entry_stat is not None and entry_stat.st_size:
+            _advise(path, entry_stat, size)
+        window.append((path, entry_stat))
+        if len(window) > count:
+            yield window.popleft()
+    yield from window
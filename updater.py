@@ -2,28 +2,44 @@ import os
 import json
 import requests
 import threading
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox
 from theme import DrWebTheme
+from sigupdate import SignatureUpdater
 import zipfile
 import tempfile
 import shutil
 from pathlib import Path
 import sys
 import subprocess
+from download import Downloader, DownloadError, file_sha256
+from sigdb import cache_directory, private_directory
+
+# Период опроса событий загрузки, мс
+POLL_INTERVAL = 100
+TIMEOUT = 30
+# Подкаталог личного кеша пользователя для загрузки обновлений
+UPDATE_DIR = "updates"
 
 class Updater:
     def __init__(self):
         self.theme = DrWebTheme()
+        # Общая сессия: соединения с сервером обновлений переиспользуются
+        self.session = requests.Session()
+        # Постоянный каталог загрузки: недокачанный архив продолжается при следующей попытке.
+        # По умолчанию - личный каталог в кеше пользователя (см. download_directory)
+        self.download_dir = None
         self.repo_owner = "your_username"  # Замените на ваше имя пользователя GitHub
         self.repo_name = "drweb-free"     # Замените на имя вашего репозитория
         self.current_version = "1.0.0"
         self.update_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/releases/latest"
-        self.signatures_url = f"https://raw.githubusercontent.com/{self.repo_owner}/{self.repo_name}/main/signatures.json"
+        # Каталог обновлений сигнатур: index.json, полная база и разностные обновления
+        self.signatures_url = f"https://raw.githubusercontent.com/{self.repo_owner}/{self.repo_name}/main/"
         
     def check_for_updates(self):
         try:
-            response = requests.get(self.update_url)
+            response = self.session.get(self.update_url, timeout=TIMEOUT)
             if response.status_code == 200:
                 latest_release = response.json()
                 latest_version = latest_release['tag_name']
@@ -75,18 +91,18 @@ class Updater:
         button_frame.pack(fill=tk.X, pady=(0, 10))
         
         update_button = self.theme.create_action_button(button_frame, "Обновить", 
-            lambda: self.start_update(dialog, release_info['assets'][0]['browser_download_url']))
+            lambda: self.start_update(dialog, release_info))
         update_button.pack(side=tk.LEFT, padx=5)
         
         cancel_button = self.theme.create_warning_button(button_frame, "Отмена",
             dialog.destroy)
         cancel_button.pack(side=tk.RIGHT, padx=5)
         
-    def start_update(self, dialog, download_url):
+    def start_update(self, dialog, release_info):
         dialog.destroy()
-        self.show_progress_dialog(download_url)
+        self.show_progress_dialog(release_info)
         
-    def show_progress_dialog(self, download_url):
+    def show_progress_dialog(self, release_info):
         progress_dialog = tk.Toplevel()
         progress_dialog.title("Обновление")
         progress_dialog.geometry("400x150")
@@ -108,76 +124,105 @@ class Updater:
         status_label = self.theme.create_label(main_frame, "Загрузка обновлений...")
         status_label.pack()
         
-        # Запускаем обновление в отдельном потоке
-        update_thread = threading.Thread(target=self.download_update, 
-            args=(download_url, progress, status_label, progress_dialog))
+        # Загрузка идет в отдельном потоке, виджеты обновляются только здесь по событиям из очереди
+        events = queue.Queue()
+        update_thread = threading.Thread(target=self.download_update, args=(release_info, events))
         update_thread.daemon = True
         update_thread.start()
         
-    def download_update(self, download_url, progress, status_label, dialog):
+        def poll():
+            try:
+                while True:
+                    kind, payload = events.get_nowait()
+                    if kind == 'progress':
+                        downloaded, total = payload
+                        progress['value'] = downloaded / total * 100 if total else 0
+                        status_label.config(text=f"Загрузка обновлений... {int(progress['value'])}% "
+                                                 f"({downloaded / (1024 * 1024):.1f} МБ)")
+                    elif kind == 'done':
+                        messagebox.showinfo("Обновление", "Обновление успешно установлено")
+                        progress_dialog.destroy()
+                        # Перезапускаем приложение
+                        self.restart_application()
+                        return
+                    elif kind == 'error':
+                        messagebox.showerror("Ошибка", f"Не удалось установить обновление: {payload}")
+                        progress_dialog.destroy()
+                        return
+            except queue.Empty:
+                pass
+            progress_dialog.after(POLL_INTERVAL, poll)
+            
+        progress_dialog.after(POLL_INTERVAL, poll)
+        
+    def asset_sha256(self, release_info, asset):
+        """Ожидаемый SHA-256 архива: поле digest ассета или файл <имя>.sha256 в релизе"""
+        digest = asset.get('digest') or ''
+        if digest.startswith('sha256:'):
+            return digest[len('sha256:'):]
+        for other in release_info.get('assets', []):
+            if other.get('name') == f"{asset['name']}.sha256":
+                response = self.session.get(other['browser_download_url'], timeout=TIMEOUT)
+                response.raise_for_status()
+                return response.text.split()[0]
+        return None
+        
+    def download_update(self, release_info, events):
+        """Загрузка и установка обновления; прогресс и итог передаются в очередь events"""
         try:
-            # Создаем временную директорию
-            temp_dir = tempfile.mkdtemp()
-            zip_path = os.path.join(temp_dir, "update.zip")
+            asset = release_info['assets'][0]
+            sha256 = self.asset_sha256(release_info, asset)
+            if sha256 is None:
+                raise DownloadError("для архива обновления не опубликована контрольная сумма")
+                
+            zip_path = os.path.join(self.download_directory(), os.path.basename(asset['name']))
             
             # Загружаем обновление
-            response = requests.get(download_url, stream=True)
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 1024
-            downloaded = 0
-            
-            with open(zip_path, 'wb') as f:
-                for data in response.iter_content(block_size):
-                    downloaded += len(data)
-                    f.write(data)
-                    progress['value'] = (downloaded / total_size) * 100
-                    status_label.config(text=f"Загрузка обновлений... {int(progress['value'])}%")
-                    dialog.update()
+            downloader = Downloader(self.session,
+                lambda downloaded, total: events.put(('progress', (downloaded, total))))
+            downloader.download(asset['browser_download_url'], zip_path, sha256)
             
             # Устанавливаем обновление
-            self.install_update(zip_path)
-            
+            if not self.install_update(zip_path, sha256):
+                raise DownloadError("не удалось распаковать архив обновления")
+                
             # Обновляем сигнатуры
             self.update_signatures()
             
-            messagebox.showinfo("Обновление", "Обновление успешно установлено")
-            dialog.destroy()
-            
-            # Перезапускаем приложение
-            self.restart_application()
+            events.put(('done', None))
             
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось установить обновление: {str(e)}")
-            dialog.destroy()
+            events.put(('error', e))
             
-    def install_update(self, zip_path):
-        """Установка обновления"""
+    def download_directory(self):
+        """Каталог загрузки с правами 0700: в общем временном каталоге другой пользователь
+        мог бы подменить каталог или недокачанный файл, который продолжает загрузка"""
+        return private_directory(self.download_dir or os.path.join(cache_directory(), UPDATE_DIR))
+
+    def install_update(self, zip_path, sha256=None):
+        """Установка обновления; архив распаковывается только после проверки контрольной суммы"""
         try:
+            if sha256 is not None and file_sha256(zip_path) != sha256.lower():
+                raise DownloadError("контрольная сумма SHA-256 не совпадает")
+                
             # Распаковываем архив
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
                 zip_ref.extractall(".")
                 
-            # Удаляем временные файлы
+            # Удаляем загруженный архив
             os.remove(zip_path)
-            os.rmdir(os.path.dirname(zip_path))
             
             return True
         except Exception as e:
-            print(f"Ошибка при установке обновления: {e}")
+            print(f"Ошибка при установке обновления: {e}", file=sys.stderr)
             return False
             
     def update_signatures(self):
-        """Обновление базы сигнатур"""
+        """Обновление базы сигнатур (разностное, с атомарной заменой файла)"""
         try:
-            response = requests.get(self.signatures_url)
-            if response.status_code == 200:
-                signatures = response.json()
-                with open("signatures.json", 'w') as f:
-                    json.dump(signatures, f)
-                return True
-            return False
+            return SignatureUpdater(self.signatures_url, session=self.session).update()
         except Exception as e:
-            print(f"Ошибка при обновлении сигнатур: {e}")
+            print(f"Ошибка при обновлении сигнатур: {e}", file=sys.stderr)
             return False
             
     def restart_application(self):
@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import queue
+import errno
+import select
+import struct
+import ctypes
+import threading
+
+from progress import LatencyStats
+
+# Окно подавления повторов: файл проверяется, когда события по нему прекратились на это время, секунды
+DEBOUNCE = 0.5
+# Файл, который пишется непрерывно, все равно проверяется не реже этого интервала
+MAX_DELAY = 5.0
+# Очередь на проверку; когда она заполнена, чтение событий приостанавливается
+MAX_QUEUE = 1024
+
+# Константы inotify из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """Минимальная обертка над inotify(7) через ctypes"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self, path=None):
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code), path)
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise(path)
+        return wd
+
+    def read(self):
+        """Список событий (wd, mask, имя); пустой, если событий нет"""
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Проверка файлов по мере их изменения (Linux inotify).
+    Серии событий по одному файлу объединяются окном debounce; проверку выполняют потоки-обработчики,
+    callback(result, latency) получает результат и задержку от первого события до вердикта"""
+
+    def __init__(self, engine, paths, callback, debounce=DEBOUNCE, workers=1, max_queue=MAX_QUEUE):
+        # Наблюдаемые файлы меняются во время проверки: mmap укороченного файла завершил бы процесс (SIGBUS)
+        if getattr(engine, 'mmap_threshold', None) is not None:
+            engine.mmap_threshold = None
+        self.engine = engine
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.callback = callback
+        self.debounce = debounce
+        self.workers = workers
+        self._inotify = None
+        self._queue = queue.Queue(max_queue)
+        self._watches = {}
+        # Путь -> (время первого события, время последнего события)
+        self._pending = {}
+        self._stopped = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        # Время последнего чтения событий: после переполнения очереди ядра перепроверяются файлы новее него
+        self._last_read = time.time()
+        self.latency = LatencyStats()
+        self.stats = {
+            'events': 0,
+            'scanned': 0,
+            'overflows': 0,
+            'watch_errors': 0
+        }
+
+    def start(self):
+        self._inotify = Inotify()
+        for path in self.paths:
+            self.add_tree(path)
+        self._threads.append(threading.Thread(target=self._read_events, daemon=True))
+        for _ in range(self.workers):
+            self._threads.append(threading.Thread(target=self._scan_worker, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(1)
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def wait(self):
+        """Ожидание до вызова stop (например, из обработчика сигнала)"""
+        while not self._stopped.wait(1):
+            pass
+
+    def snapshot(self):
+        """Счетчики, число наблюдаемых каталогов, глубина очереди и задержка до вердикта"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['watches'] = len(self._watches)
+        stats['pending'] = len(self._pending)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['latency'] = self.latency.snapshot()
+        return stats
+
+    def add_tree(self, path, now=None, since=None):
+        """Наблюдение за каталогом и всеми подкаталогами; с now уже существующие файлы
+        (измененные не раньше since) ставятся на проверку"""
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                wd = self._inotify.add_watch(directory)
+            except OSError as e:
+                self.stats['watch_errors'] += 1
+                if e.errno == errno.ENOSPC:
+                    print(f"Превышен предел наблюдаемых каталогов (fs.inotify.max_user_watches): {directory}",
+                          file=sys.stderr)
+                continue
+            # Повторное добавление того же каталога (например, после переименования) обновляет путь
+            self._watches[wd] = directory
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif now is not None and entry.is_file(follow_symlinks=False):
+                            if since is None or entry.stat(follow_symlinks=False).st_mtime >= since:
+                                self._touch(entry.path, now)
+            except OSError:
+                pass
+
+    def _touch(self, path, now):
+        first, _ = self._pending.get(path, (now, now))
+        self._pending[path] = (first, now)
+
+    def _read_events(self):
+        poller = select.poll()
+        poller.register(self._inotify.fd, select.POLLIN)
+        while not self._stopped.is_set():
+            timeout = self._next_timeout()
+            if poller.poll(timeout * 1000 if timeout is not None else 1000):
+                events = self._inotify.read()
+                self._handle(events)
+                self._last_read = time.time()
+            self._flush(time.monotonic())
+
+    def _next_timeout(self):
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        deadline = min(min(last + self.debounce, first + MAX_DELAY) for first, last in self._pending.values())
+        return max(deadline - now, 0)
+
+    def _handle(self, events):
+        now = time.monotonic()
+        for wd, mask, name in events:
+            self.stats['events'] += 1
+            if mask & IN_Q_OVERFLOW:
+                # События потеряны: проверяются файлы, измененные после предыдущего чтения
+                self.stats['overflows'] += 1
+                for path in self.paths:
+                    self.add_tree(path, now, self._last_read - 1)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Новый каталог мог заполниться до того, как за ним началось наблюдение
+                    self.add_tree(path, now)
+            elif mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._touch(path, now)
+
+    def _flush(self, now):
+        due = [path for path, (first, last) in self._pending.items()
+               if now - last >= self.debounce or now - first >= MAX_DELAY]
+        for path in due:
+            first, _ = self._pending.pop(path)
+            # Блокирующая постановка в очередь: при перегрузке чтение событий ждет обработчиков
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put((path, first), timeout=1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _scan_worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None or self._stopped.is_set():
+                return
+            path, first = item
+            if not os.path.isfile(path):
+                continue
+            for result in self.engine.scan_entries(path):
+                latency = time.monotonic() - first
+                with self._lock:
+                    self.stats['scanned'] += 1
+                if result.container is None:
+                    self.latency.add(latency)
+                self.callback(result, latency)